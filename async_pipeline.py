@@ -0,0 +1,138 @@
+import asyncio
+import contextvars
+import inspect
+import threading
+import time
+
+from query_router import winning_file
+from resilience import CircuitOpenError, is_transient
+
+
+class BackgroundEventLoop:
+    """
+    Event loop running in a daemon thread.
+
+    Lets synchronous code (a Streamlit rerun, a worker thread, a script) drive coroutines
+    without creating a new loop per call.
+    """
+
+    def __init__(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="rag-pipeline-loop", daemon=True)
+        self._thread.start()
+
+    @property
+    def loop(self):
+        return self._loop
+
+    def run(self, coroutine, timeout=None):
+        """
+        Run a coroutine on the background loop and block until it finishes.
+
+        The caller's context variables (e.g. the active trace) are visible to the coroutine.
+        """
+        wrapped = _with_context(coroutine, contextvars.copy_context())
+        return asyncio.run_coroutine_threadsafe(wrapped, self._loop).result(timeout)
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+async def _with_context(coroutine, context):
+    # Tasks get their own copy of the loop thread's context; restore the caller's values in it
+    for variable, value in context.items():
+        variable.set(value)
+    return await coroutine
+
+
+async def _call(function, *args, **kwargs):
+    """Await `function(*args, **kwargs)` whether it is a coroutine function or a blocking one."""
+    if inspect.iscoroutinefunction(function):
+        return await function(*args, **kwargs)
+    return await asyncio.to_thread(function, *args, **kwargs)
+
+
+class AsyncRagPipeline:
+    """
+    Retrieval pipeline that overlaps the independent stages before the LLM call.
+
+    The stages are injected as callables (sync or async):
+
+    - load_system_prompt(instructions_file) -> str
+    - embed_query(query) -> list[float]
+    - search(embedding, knowledge_files, lexical_chunks=None) -> list[chunk dict]
+    - lexical_search(query, knowledge_files) -> {"chunks", "decisive"} (optional)
+
+    Loading the system prompt, loading the conversation history and the
+    embed -> search chain all run concurrently, so the pre-LLM part of a request costs
+    roughly as much as its slowest stage. With a `lexical_search`, the local keyword
+    search runs first (it takes well under a millisecond): a decisive keyword match skips
+    the embedding entirely, otherwise its hits are passed to `search` to be fused with
+    the vector hits (or used alone while the embedding model is unavailable). Every
+    candidate knowledge file is searched in one pass (see `retrieve`). The answer itself is
+    generated by the caller (ChatEngine.ask_gpt), through its retries and quota scheduler.
+    """
+
+    def __init__(
+        self,
+        load_system_prompt,
+        embed_query,
+        search,
+        lexical_search=None
+    ):
+        self._load_system_prompt = load_system_prompt
+        self._embed_query = embed_query
+        self._search = search
+        self._lexical_search = lexical_search
+
+    async def _embed_and_search(self, query, knowledge_files):
+        if self._lexical_search is None:
+            embedding = await _call(self._embed_query, query)
+            return embedding, await _call(self._search, embedding, knowledge_files)
+        lexical = await _call(self._lexical_search, query, knowledge_files)
+        if lexical["decisive"]:
+            return None, await _call(self._search, None, knowledge_files, lexical_chunks=lexical["chunks"])
+        try:
+            embedding = await _call(self._embed_query, query)
+        except Exception as error:
+            # The embedding model is unavailable (open circuit, or still failing after the
+            # retries): answer from the keyword hits alone, when there are any
+            if not lexical["chunks"] or not (isinstance(error, CircuitOpenError) or is_transient(error)):
+                raise
+            return None, await _call(self._search, None, knowledge_files, lexical_chunks=lexical["chunks"])
+        return embedding, await _call(self._search, embedding, knowledge_files, lexical_chunks=lexical["chunks"])
+
+    async def retrieve(self, query, knowledge_files, instructions_files, load_history=None, search=True):
+        """
+        Run the pre-LLM stages concurrently.
+
+        `knowledge_files` are searched together and `instructions_files` maps each of them
+        to its system prompt file: every prompt is loaded while searching, and the file the
+        hits favour is returned with its prompt.
+
+        Returns a dict with `system_prompt`, `history`, `embedding` (None when a keyword
+        match made it unnecessary), `chunks`, `knowledge_file` and `seconds` (wall time).
+        With `search=False` only the prompts and the history are loaded, and the first
+        file is returned.
+        """
+        start = time.perf_counter()
+        stages = [
+            _call(load_history) if load_history is not None else _call(list),
+            *(_call(self._load_system_prompt, instructions_files[file]) for file in knowledge_files)
+        ]
+        if search:
+            stages.append(self._embed_and_search(query, knowledge_files))
+        results = await asyncio.gather(*stages)
+        embedding, chunks = results[-1] if search else (None, [])
+        prompts = results[1:1 + len(knowledge_files)]
+        chosen = winning_file(chunks, knowledge_files)
+        system_prompt = prompts[knowledge_files.index(chosen)]
+        return {
+            "system_prompt": system_prompt,
+            "history": results[0],
+            "embedding": embedding,
+            "chunks": chunks,
+            "knowledge_file": chosen,
+            "seconds": time.perf_counter() - start
+        }
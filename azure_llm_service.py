@@ -1,4 +1,16 @@
-from openai import AzureOpenAI
+import asyncio
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from clients import get_azure_openai_client
+from llm_batch import POLL_SECONDS, batch_request, collect_results, poll_batch, submit_batch_file, write_batch_file
+from rate_limiter import PRIORITY_BATCH, LoadShedError, RequestScheduler, estimate_tokens, get_scheduler
+from resilience import CircuitOpenError, ResilientCaller, is_transient, status_code
+
+# Prompts run at once by execute_many (the scheduler still keeps them within the quota)
+DEFAULT_CONCURRENCY = 8
 
 class AzureLLMService:
     def __init__(
@@ -10,45 +22,233 @@ class AzureLLMService:
         deployment_id: str,
         max_tokens: int = 4096,
         temperature: float = 0.7,
-        top_p: float = 1
+        top_p: float = 1,
+        caller: ResilientCaller | None = None,
+        scheduler: RequestScheduler | None = None,
+        priority: int = PRIORITY_BATCH,
+        max_queue_seconds: float | None = None,
+        batch_deployment: str | None = None,
+        batch_client=None
     ) -> None:
-        self._openai = AzureOpenAI(
+        # Shared with every other service of the process, over one pooled HTTP client (clients.py)
+        self._openai = get_azure_openai_client(
             api_key=azure_api_key,
             api_version=api_version,
-            azure_endpoint=base_url,
-            azure_deployment=deployment_id,
+            endpoint=base_url,
+            deployment=deployment_id
         )
         self._model = model
         self._max_tokens = max_tokens
         self._temperature = temperature
         self._top_p = top_p
+        # Retries and circuit breaking; the breaker is shared with the chat on the same deployment
+        self._caller = caller or ResilientCaller(f"chat:{deployment_id}")
+        # Quota shared with the chat on the same deployment; batch work yields to users' questions
+        self._scheduler = scheduler or get_scheduler(deployment_id)
+        self._priority = priority
+        # None waits up to the scheduler's deadline (LLM_QUEUE_SECONDS)
+        self._max_queue_seconds = max_queue_seconds
+        # Batch jobs need a Global Batch or Data Zone Batch deployment, with its own quota
+        # (see llm_batch.py); interactive deployments reject them
+        self._batch_deployment = batch_deployment or os.getenv("AZURE_OPENAI_BATCH_DEPLOYMENT")
+        # Files and batches are resource-level APIs: the client must not be bound to a deployment
+        self._batch_client = batch_client or get_azure_openai_client(
+            api_key=azure_api_key,
+            api_version=api_version,
+            endpoint=base_url
+        )
 
     def execute(
         self,
         sys_prompt: str,
         usr_prompt: str = "",
         temperature: float | None = None,
-        top_p: float | None = None
+        top_p: float | None = None,
+        user: str | None = None
     ) -> tuple[str | None, int]:
-        if temperature:
-            self._temperature = temperature
-        if top_p:
-            self._top_p = top_p
+        """
+        Run one prompt; returns (content, status). `temperature` and `top_p` override the
+        service defaults for this call only, so one service can be shared between threads.
+        """
+        content, status, _, _ = self._complete(sys_prompt, usr_prompt, temperature, top_p, user)
+        return content, status
+
+    def execute_many(
+        self,
+        prompts: list[tuple[str, str]],
+        max_concurrency: int = DEFAULT_CONCURRENCY,
+        temperature: float | None = None,
+        top_p: float | None = None,
+        user: str | None = None
+    ) -> list[dict]:
+        """
+        Run (sys_prompt, usr_prompt) pairs on up to `max_concurrency` threads.
+
+        Returns one result per prompt, in the order of `prompts`: a dict with `content`,
+        `status`, `latency` (seconds) and `usage` (prompt, completion and total tokens, or
+        None), plus `error` when the prompt raised. A failing prompt does not stop the others.
+        """
+        if not prompts:
+            return []
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(prompts)), thread_name_prefix="llm") as executor:
+            return list(executor.map(
+                lambda prompt: self._execute_item(prompt, temperature, top_p, user), prompts
+            ))
+
+    async def execute_many_async(
+        self,
+        prompts: list[tuple[str, str]],
+        max_concurrency: int = DEFAULT_CONCURRENCY,
+        temperature: float | None = None,
+        top_p: float | None = None,
+        user: str | None = None
+    ) -> list[dict]:
+        """`execute_many` for async callers: prompts run in worker threads, `max_concurrency` at a time."""
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def run(prompt):
+            async with semaphore:
+                return await asyncio.to_thread(self._execute_item, prompt, temperature, top_p, user)
+
+        return list(await asyncio.gather(*(run(prompt) for prompt in prompts)))
+
+    def submit_batch(
+        self,
+        prompts: dict[str, tuple[str, str]],
+        temperature: float | None = None,
+        top_p: float | None = None,
+        path: str | None = None
+    ) -> str:
+        """
+        Submit (sys_prompt, usr_prompt) pairs, keyed by request id, as one Batch API job;
+        returns the batch id. The JSONL batch file is kept at `path` when given.
+        Raises ValueError when no batch deployment is configured.
+        """
+        if not self._batch_deployment:
+            raise ValueError(
+                "Batch jobs need a Global Batch or Data Zone Batch deployment: "
+                "set AZURE_OPENAI_BATCH_DEPLOYMENT or pass batch_deployment."
+            )
+        parameters = {
+            "max_tokens": self._max_tokens,
+            "temperature": self._temperature if temperature is None else temperature,
+            "top_p": self._top_p if top_p is None else top_p
+        }
+        requests = [
+            batch_request(request_id, self._messages(sys_prompt, usr_prompt), self._batch_deployment, **parameters)
+            for request_id, (sys_prompt, usr_prompt) in prompts.items()
+        ]
+        if path is not None:
+            return submit_batch_file(self._batch_client, write_batch_file(path, requests))
+        with tempfile.TemporaryDirectory() as directory:
+            return submit_batch_file(
+                self._batch_client, write_batch_file(os.path.join(directory, "batch.jsonl"), requests)
+            )
+
+    def wait_for_batch(
+        self,
+        batch_id: str,
+        request_ids: list[str] | None = None,
+        poll_seconds: float = POLL_SECONDS,
+        timeout: float | None = None
+    ) -> dict[str, dict]:
+        """
+        Poll a batch until it ends and return its results keyed by request id, each with
+        `content`, `status`, `usage` and, on failure, `error`. Raises TimeoutError after
+        `timeout` seconds; the batch keeps running and can be waited for again.
+        """
+        batch = poll_batch(self._batch_client, batch_id, poll_seconds, timeout)
+        return collect_results(self._batch_client, batch, request_ids)
+
+    def execute_batch(
+        self,
+        prompts: dict[str, tuple[str, str]],
+        temperature: float | None = None,
+        top_p: float | None = None,
+        poll_seconds: float = POLL_SECONDS,
+        timeout: float | None = None,
+        path: str | None = None
+    ) -> dict[str, dict]:
+        """`submit_batch` then `wait_for_batch`: results of every prompt, keyed by request id."""
+        batch_id = self.submit_batch(prompts, temperature, top_p, path)
+        return self.wait_for_batch(batch_id, list(prompts), poll_seconds, timeout)
+
+    @staticmethod
+    def _messages(sys_prompt, usr_prompt):
         messages = [{"role": "system", "content": sys_prompt}]
         if usr_prompt:
             messages.append({"role": "user", "content": usr_prompt})
-        completion = self._openai.chat.completions.create(
-            model=self._model,
-            max_tokens=self._max_tokens,
-            temperature=self._temperature,
-            top_p=self._top_p,
-            messages=messages
-        )
+        return messages
+
+    def _execute_item(self, prompt, temperature, top_p, user) -> dict:
+        sys_prompt, usr_prompt = prompt
+        start = time.perf_counter()
+        result = {"content": None, "status": 500, "latency": 0.0, "usage": None}
+        try:
+            result["content"], result["status"], result["usage"], error = self._complete(
+                sys_prompt, usr_prompt, temperature, top_p, user
+            )
+        except Exception as raised:
+            result["status"] = status_code(raised) or 500
+            error = str(raised)
+        if error is not None:
+            result["error"] = error
+        result["latency"] = time.perf_counter() - start
+        return result
+
+    def _complete(self, sys_prompt, usr_prompt, temperature, top_p, user):
+        """
+        Returns (content, status, usage, error), `error` describing why no content came
+        back (None on success); the parameters of the call stay local to it.
+        """
+        temperature = self._temperature if temperature is None else temperature
+        top_p = self._top_p if top_p is None else top_p
+        messages = self._messages(sys_prompt, usr_prompt)
+        try:
+            reservation = self._scheduler.acquire(
+                estimate_tokens(messages, self._max_tokens), user=user, priority=self._priority,
+                max_wait=self._max_queue_seconds
+            )
+        except LoadShedError as error:
+            return self._failure(f"Azure LLM request shed: {error}", 429)
+        completion = None
+        try:
+            completion = self._caller.call(
+                self._openai.chat.completions.create,
+                model=self._model,
+                max_tokens=self._max_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                messages=messages
+            )
+        except CircuitOpenError as error:
+            return self._failure(f"Azure LLM unavailable: {error}", 503)
+        except Exception as error:
+            if not is_transient(error):
+                raise
+            return self._failure(f"Azure LLM failed after retries: {error}", status_code(error) or 503)
+        finally:
+            if completion is None:
+                # Nothing was generated: give the estimate back so failures do not use up the quota
+                reservation.settle(0)
+        usage = getattr(completion, "usage", None)
+        reservation.settle(usage.total_tokens if usage is not None else None)
+        if usage is not None:
+            usage = {
+                "prompt_tokens": usage.prompt_tokens,
+                "completion_tokens": usage.completion_tokens,
+                "total_tokens": usage.total_tokens
+            }
         choice = completion.choices[0]
         if choice.finish_reason != "stop":
-            print(f"[Warning] Azure LLM could not get a valid response. Finish reason={choice.finish_reason}")
-            return None, 500
+            return self._failure(
+                f"Azure LLM could not get a valid response. Finish reason={choice.finish_reason}", 500, usage
+            )
         if choice.message.content is None:
-            print(f"[Warning] Azure LLM invalid response (content=None)")
-            return None, 500
-        return choice.message.content, 200
\ No newline at end of file
+            return self._failure("Azure LLM invalid response (content=None)", 500, usage)
+        return choice.message.content, 200, usage, None
+
+    @staticmethod
+    def _failure(reason, status, usage=None):
+        print(f"[Warning] {reason}")
+        return None, status, usage, reason
@@ -0,0 +1,76 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from resilience import backoff_delay, is_transient
+
+
+def make_batches(items, max_items, max_bytes=None, size_of=None):
+    """
+    Split items into consecutive batches bounded by count and, optionally, by size.
+
+    `size_of(item)` estimates an item's request payload in bytes. An item larger than
+    `max_bytes` on its own still gets a batch of its own.
+    """
+    batches = []
+    current = []
+    current_bytes = 0
+    for item in items:
+        item_bytes = size_of(item) if max_bytes and size_of else 0
+        if current and (len(current) >= max_items or (max_bytes and current_bytes + item_bytes > max_bytes)):
+            batches.append(current)
+            current = []
+            current_bytes = 0
+        current.append(item)
+        current_bytes += item_bytes
+    if current:
+        batches.append(current)
+    return batches
+
+
+def call_with_retries(function, *args, retries=3, backoff=1.0, **kwargs):
+    """
+    Call `function`, retrying transient failures (see resilience.is_transient) with the
+    backoff of resilience.py. Other errors, such as a rejected request or a bug, are
+    raised at once.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return function(*args, **kwargs)
+        except Exception as error:
+            if attempt == retries or not is_transient(error):
+                raise
+            time.sleep(backoff_delay(attempt, error, backoff))
+
+
+class BatchError(Exception):
+    """Raised when some batches still fail after every retry."""
+
+    def __init__(self, failures):
+        self.failures = failures
+        super().__init__(
+            f"{len(failures)} batch(es) failed: "
+            + "; ".join(f"batch {index}: {error}" for index, error in failures)
+        )
+
+
+def run_batches(worker, batches, max_workers=4):
+    """
+    Run `worker(batch)` for every batch on a bounded thread pool.
+
+    A failing batch does not stop the others. Returns the results in batch order, or
+    raises BatchError listing the batches that failed once all of them have run.
+    """
+    if not batches:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches)))) as pool:
+        futures = [pool.submit(worker, batch) for batch in batches]
+    results = []
+    failures = []
+    for index, future in enumerate(futures):
+        try:
+            results.append(future.result())
+        except Exception as error:
+            failures.append((index, error))
+    if failures:
+        raise BatchError(failures)
+    return results
@@ -0,0 +1,317 @@
+"""
+End-to-end latency benchmark for the chat pipeline and the ingestion script.
+
+Everything runs offline against the deterministic stand-ins in `local_fakes.py` and the
+in-process NumPy vector store. Results (p50/p95/p99 per stage, throughput under N
+concurrent conversations, memory growth) are written as JSON so they can be compared
+between releases:
+
+    python benchmark.py --output bench.json
+    python benchmark.py --compare bench.json --tolerance 0.2
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# The ingestion module builds a Pinecone client at import time; it is never called here.
+os.environ.setdefault("PINECONE_API_KEY", "offline-benchmark")
+
+import embed_and_store  # noqa: E402
+from chat_engine import NAMESPACE, ChatEngine, Conversation  # noqa: E402
+from embedding_cache import EmbeddingCache  # noqa: E402
+from local_fakes import FakeChatClient, FakeChatCompletions, FakeEmbedder  # noqa: E402
+from response_cache import ResponseCache  # noqa: E402
+from semantic_cache import SemanticCache  # noqa: E402
+from vector_store import NumpyVectorStore, VectorStore  # noqa: E402
+
+KNOWLEDGE_FILES = ["tucuvi_data_organizational.md", "tucuvi_data_technical.md"]
+
+
+class StageRecorder:
+    """Thread-safe collection of per-stage durations."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.samples[stage].append(seconds)
+
+    def wrap(self, stage, function):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return timed
+
+    def summary(self):
+        with self._lock:
+            return {stage: summarize(values) for stage, values in sorted(self.samples.items())}
+
+
+class TimedVectorStore(VectorStore):
+    """VectorStore wrapper recording query and fetch durations."""
+
+    def __init__(self, store, recorder):
+        self._store = store
+        self._query = recorder.wrap("search", store.query)
+        self._fetch = recorder.wrap("fetch", store.fetch)
+
+    def upsert(self, vectors, namespace):
+        return self._store.upsert(vectors, namespace)
+
+    def query(self, vector, top_k, namespace, filter=None, include_values=False, include_metadata=True):
+        return self._query(vector, top_k, namespace, filter=filter, include_values=include_values, include_metadata=include_metadata)
+
+    def delete(self, namespace, ids=None, delete_all=False):
+        return self._store.delete(namespace, ids=ids, delete_all=delete_all)
+
+    def fetch(self, ids, namespace):
+        return self._fetch(ids, namespace)
+
+    def list_namespaces(self):
+        return self._store.list_namespaces()
+
+
+def summarize(values):
+    """Count, mean and p50/p95/p99/max in milliseconds."""
+    if not values:
+        return {"count": 0}
+    data = np.asarray(values) * 1000.0
+    return {
+        "count": int(data.size),
+        "mean_ms": float(data.mean()),
+        "p50_ms": float(np.percentile(data, 50)),
+        "p95_ms": float(np.percentile(data, 95)),
+        "p99_ms": float(np.percentile(data, 99)),
+        "max_ms": float(data.max())
+    }
+
+
+def sample_questions():
+    """Deterministic questions built from the headings of the knowledge files."""
+    questions = []
+    for file_path in KNOWLEDGE_FILES:
+        prefix = "/tech " if "technical" in file_path else ""
+        with open(file_path, "r", encoding="utf-8") as file:
+            for line in file:
+                match = re.match(r"^#{1,3}\s+(.*)", line)
+                if match:
+                    title = match.group(1).strip("*` ").strip()
+                    questions.append(f"{prefix}Where can I find information about {title}?")
+    return questions
+
+
+def build_store(embedder):
+    """Ingest the knowledge files into a fresh NumPy store (silencing the script output)."""
+    store = NumpyVectorStore()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for file_path in KNOWLEDGE_FILES:
+            embed_and_store.embed_and_store_with_pinecone(
+                file_path, embed_and_store.INDEX_NAME, NAMESPACE, store=store, embed_texts=embedder.embed_many
+            )
+    return store
+
+
+def benchmark_ingestion(args):
+    durations = []
+    chunks = 0
+    for _ in range(args.ingest_runs):
+        embedder = FakeEmbedder(latency=args.embed_latency, jitter=args.jitter)
+        start = time.perf_counter()
+        build_store(embedder)
+        durations.append(time.perf_counter() - start)
+        chunks = embedder.inputs
+    total = sum(durations)
+    return {
+        "runs": args.ingest_runs,
+        "chunks_per_run": chunks,
+        "run": summarize(durations),
+        "chunks_per_second": chunks * args.ingest_runs / total if total else None
+    }
+
+
+def build_engine(args, recorder, store):
+    embedder = FakeEmbedder(latency=args.embed_latency, jitter=args.jitter, seed=1, failure_rate=args.failure_rate)
+    completions = FakeChatCompletions(
+        latency=args.llm_latency, jitter=args.jitter, seconds_per_token=args.llm_seconds_per_token, seed=2,
+        failure_rate=args.failure_rate
+    )
+    caches = {}
+    if args.with_caches:
+        caches = {
+            "embedding_cache": EmbeddingCache(),
+            "response_cache": ResponseCache(watched_patterns=["tucuvi_data_*.md", "system_prompts/*.txt"]),
+            "semantic_cache": SemanticCache()
+        }
+    return ChatEngine(
+        embed_query=recorder.wrap("embed", embedder),
+        vector_store=TimedVectorStore(store, recorder),
+        llm_client=FakeChatClient(completions),
+        **caches
+    )
+
+
+def run_conversation(engine, questions, turns, recorder, stream):
+    """One conversation: a new thread followed by refresh / plain continues."""
+    conversation = Conversation()
+    on_token = (lambda token: None) if stream else None
+    for turn in range(turns):
+        if turn == 0:
+            flow = engine.new_thread
+        else:
+            flow = engine.continue_thread_update if turn % 2 else engine.continue_thread
+        result = flow(conversation, questions[turn % len(questions)], on_token=on_token)
+        for stage, seconds in result["timings"].items():
+            recorder.record(stage, seconds)
+
+
+def benchmark_chat(args, store, questions):
+    recorder = StageRecorder()
+    engine = build_engine(args, recorder, store)
+
+    # Sequential: per-stage latency without contention
+    start = time.perf_counter()
+    for index in range(args.requests):
+        run_conversation(engine, questions[index:] + questions[:index], 1, recorder, args.stream)
+    sequential_seconds = time.perf_counter() - start
+
+    # Concurrent: N conversations of `turns` requests each
+    concurrent_recorder = StageRecorder()
+    concurrent_engine = build_engine(args, concurrent_recorder, store)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [
+            pool.submit(
+                run_conversation, concurrent_engine, questions[index:] + questions[:index],
+                args.turns, concurrent_recorder, args.stream
+            )
+            for index in range(args.concurrency * args.conversations_per_worker)
+        ]
+        for future in futures:
+            future.result()
+    concurrent_seconds = time.perf_counter() - start
+    concurrent_requests = args.concurrency * args.conversations_per_worker * args.turns
+
+    return {
+        "sequential": {
+            "requests": args.requests,
+            "requests_per_second": args.requests / sequential_seconds if sequential_seconds else None,
+            "stages": recorder.summary()
+        },
+        "concurrent": {
+            "workers": args.concurrency,
+            "requests": concurrent_requests,
+            "requests_per_second": concurrent_requests / concurrent_seconds if concurrent_seconds else None,
+            "stages": concurrent_recorder.summary()
+        }
+    }
+
+
+def benchmark_memory(args, store, questions):
+    """Python heap growth over many requests on one engine (tracemalloc)."""
+    recorder = StageRecorder()
+    engine = build_engine(args, recorder, store)
+    run_conversation(engine, questions, 1, recorder, args.stream)  # warm-up
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    for index in range(args.memory_requests):
+        run_conversation(engine, questions[index:] + questions[:index], 1, recorder, args.stream)
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "requests": args.memory_requests,
+        "growth_kb": (after - before) / 1024,
+        "growth_per_request_bytes": (after - before) / max(args.memory_requests, 1),
+        "peak_kb": peak / 1024
+    }
+
+
+def compare(results, baseline, tolerance, min_delta_ms=1.0):
+    """
+    List the chat stages whose p95 regressed by more than `tolerance` against a baseline.
+
+    Differences below `min_delta_ms` are ignored so sub-millisecond noise is not reported.
+    """
+    regressions = []
+    for mode in ("sequential", "concurrent"):
+        current_stages = results["chat"][mode]["stages"]
+        baseline_stages = baseline.get("chat", {}).get(mode, {}).get("stages", {})
+        for stage, stats in current_stages.items():
+            old = baseline_stages.get(stage, {}).get("p95_ms")
+            new = stats.get("p95_ms")
+            if old and new and new > old * (1 + tolerance) and new - old > min_delta_ms:
+                regressions.append(f"{mode}/{stage}: p95 {old:.2f} ms -> {new:.2f} ms")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=50, help="sequential requests")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent conversations")
+    parser.add_argument("--conversations-per-worker", type=int, default=2)
+    parser.add_argument("--turns", type=int, default=3, help="requests per concurrent conversation")
+    parser.add_argument("--memory-requests", type=int, default=200)
+    parser.add_argument("--ingest-runs", type=int, default=3)
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="fake embedding latency (s)")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="fake time to first token (s)")
+    parser.add_argument("--llm-seconds-per-token", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.005, help="± jitter on every fake latency (s)")
+    parser.add_argument("--failure-rate", type=float, default=0.0,
+                        help="share of fake embedding/LLM calls failing with a 503 (exercises the retries)")
+    parser.add_argument("--stream", action="store_true", help="stream answers (records time to first token)")
+    parser.add_argument("--with-caches", action="store_true", help="enable the embedding/response/semantic caches")
+    parser.add_argument("--output", help="write the JSON results to this file")
+    parser.add_argument("--compare", help="baseline JSON to compare p95 latencies against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 regression ratio")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore p95 differences below this")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    questions = sample_questions()
+    store = build_store(FakeEmbedder())
+
+    results = {
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "ingestion": benchmark_ingestion(args),
+        "chat": benchmark_chat(args, store, questions),
+        "memory": benchmark_memory(args, store, questions)
+    }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(output)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            regressions = compare(results, json.load(file), args.tolerance, args.min_delta_ms)
+        for regression in regressions:
+            print(f"[Regression] {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,242 +1,128 @@
+import contextlib
 import os
+import threading
 import streamlit as st
-from dotenv import load_dotenv
-
-# Additional imports for the Knowledge Base Chat
-from pinecone import Pinecone
-from openai import AzureOpenAI
-
-########################################
-# 1. Load environment variables
-########################################
-
-load_dotenv()
-
-pinecone_api_key = os.getenv("PINECONE_API_KEY")
-azure_api_key = os.getenv("AZURE_OPENAI_API_KEY")
-azure_base_url = os.getenv("AZURE_OPENAI_ENDPOINT")
-azure_api_version = os.getenv("AZURE_OPENAI_API_VERSION")
-azure_deployment = "gpt-4o"  # example deployment name
-
-
-########################################
-# 2. Knowledge Base Chat Code
-########################################
-
-INDEX_NAME = "knowledge-base"
-NAMESPACE = "markdown_chunks"
-DIMENSION = 1024
-PINECONE_CLOUD = "aws"
-PINECONE_REGION = "us-east-1"
-
-# Create the Pinecone and Azure OpenAI clients
-pc = Pinecone(api_key=pinecone_api_key)
-index = pc.Index(INDEX_NAME)
-azure_openai_client = AzureOpenAI(
-    api_key=azure_api_key,
-    api_version=azure_api_version,
-    azure_endpoint=azure_base_url,
-    azure_deployment=azure_deployment
-)
-
-def load_system_prompt(file_path="instructions.txt"):
-    """Load the system prompt from a text file."""
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"System prompt file '{file_path}' not found.")
-    with open(file_path, "r", encoding="utf-8") as file:
-        return file.read().strip()
-
-def generate_query_embedding(user_query):
-    """Generate query embeddings using Pinecone."""
-    embeddings = pc.inference.embed(
-        model="multilingual-e5-large",
-        inputs=[user_query],
-        parameters={"input_type": "passage"}
-    )
-    return embeddings[0]["values"]
-
-def search_pinecone(query_embedding, knowledge_file, top_k=3):
-    """Query Pinecone for relevant chunks."""
-    results = index.query(
-        namespace=NAMESPACE,
-        vector=query_embedding,
-        top_k=top_k,
-        include_values=False,
-        include_metadata=True,
-        filter={"file": knowledge_file}
-    )
-    return [
-        {
-            "text": match['metadata'].get('text', '[Missing text]'),
-            "section": match['metadata'].get('section', 'Unknown Section'),
-            "file": match['metadata'].get('file', 'Unknown File')
-        }
-        for match in results.get('matches', [])
-    ]
-
-def ask_gpt(messages):
-    """Send messages to Azure OpenAI Chat."""
-    response = azure_openai_client.chat.completions.create(
-        model=azure_deployment,
-        messages=messages,
-        temperature=0.7
-    )
-    return response.choices[0].message.content
-
-def determine_context_type(prompt):
-    if prompt.startswith("/tech"):
-        cleaned_prompt = prompt.replace("/tech", "").strip()
-        return "tucuvi_data_technical.md", cleaned_prompt, "system_prompts/instructions_tech.txt"
-    else:
-        return "tucuvi_data_organizational.md", prompt.strip(), "system_prompts/instructions.txt"
-
-def build_messages_with_context(system_prompt, conversation_history, context, user_query):
-    messages = [{"role": "system", "content": system_prompt}]
-    for msg in conversation_history:
-        messages.append(msg)
-    messages.append({"role": "assistant", "content": f"Context:\n{context}"})
-    messages.append({"role": "user", "content": user_query})
-    return messages
-
-def get_last_interactions(messages, user_turns=2, assistant_turns=2):
-    """Get the last user/assistant messages for conversation continuity."""
-    last_interactions = []
-    reversed_messages = list(reversed(messages))
-    user_count = 0
-    assistant_count = 0
-    for msg in reversed_messages:
-        if msg["role"] == "assistant" and assistant_count < assistant_turns:
-            last_interactions.insert(0, msg)
-            assistant_count += 1
-        elif msg["role"] == "user" and user_count < user_turns:
-            last_interactions.insert(0, msg)
-            user_count += 1
-        if user_count == user_turns and assistant_count == assistant_turns:
-            break
-    return last_interactions
-
-def process_new_thread(user_input):
-    """Handle starting a new thread."""
-    if not user_input.strip():
-        st.session_state.messages.append(
-            {"role": "assistant", "content": "Please provide a valid query to start a new thread."}
-        )
-        return
-
-    # Reset session state for a new thread
-    st.session_state.messages = []
-    st.session_state.knowledge_file = None
-    st.session_state.system_prompt = None
-    st.session_state.context_chunks = []
-
-    # Retrieve knowledge file, cleaned query, and instructions
-    knowledge_file, cleaned_query, instructions_file = determine_context_type(user_input)
-    st.session_state.knowledge_file = knowledge_file
-    st.session_state.system_prompt = load_system_prompt(file_path=instructions_file)
-
-    # Generate embeddings and search for relevant context
-    query_embedding = generate_query_embedding(cleaned_query)
-    relevant_chunks = search_pinecone(query_embedding, knowledge_file)
-
-    if not relevant_chunks:
-        response = "I'm sorry, I couldn't find relevant information."
-        st.session_state.messages.append({"role": "assistant", "content": response})
-    else:
-        context_parts = [
-            f"Section: {chunk['section']}\nFile: {chunk['file']}\n\n{chunk['text']}"
-            for chunk in relevant_chunks
-        ]
-        context = "\n\n---\n\n".join(context_parts)
-
-        # Generate the assistant's response
-        messages = build_messages_with_context(
-            st.session_state.system_prompt, [], context, cleaned_query
-        )
-        response = ask_gpt(messages)
-
-        st.session_state.messages.append({"role": "user", "content": user_input})
-        st.session_state.messages.append({"role": "assistant", "content": response})
-        st.session_state.context_chunks = relevant_chunks
 
-def process_continue_thread(user_input):
-    """Handle continuing an existing thread."""
-    if not st.session_state.system_prompt or not st.session_state.knowledge_file:
-        st.session_state.messages.append(
-            {"role": "assistant", "content": "No active thread found. Please start a new thread."}
+from chat_engine import INDEX_NAME, Conversation, create_default_engine
+from clients import warm_up
+from conversation_memory import ConversationMemory
+from tracing import request_trace, span
+
+# Render answers token by token in the chat panel (set STREAM_RESPONSES=false to disable)
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "true").lower() == "true"
+# Show the per-request timing breakdown in the sidebar (opt-in)
+DEBUG_SIDEBAR = os.getenv("CHAT_DEBUG_SIDEBAR", "false").lower() == "true"
+# Open the connections to Azure OpenAI and Pinecone when the app starts
+WARM_UP_CLIENTS = os.getenv("WARM_UP_CLIENTS", "true").lower() == "true"
+
+
+@st.cache_resource
+def get_chat_engine():
+    """One ChatEngine (clients, caches, event loop) shared by every Streamlit session."""
+    engine = create_default_engine()
+    if WARM_UP_CLIENTS:
+        # In the background, so the first page renders without waiting for it
+        threading.Thread(target=warm_up, args=(INDEX_NAME,), name="warm-up", daemon=True).start()
+    return engine
+
+def stream_to_placeholder(placeholder):
+    """Build an `on_token` callback that renders the partial answer into a Streamlit placeholder."""
+    parts = []
+
+    def on_token(token):
+        parts.append(token)
+        placeholder.markdown(
+            f"<div class='assistant-message'><b>Assistant:</b> {''.join(parts)}</div>",
+            unsafe_allow_html=True
         )
-        return
 
-    if not user_input.strip():
-        st.session_state.messages.append(
-            {"role": "assistant", "content": "Please provide a valid query to continue the thread."}
-        )
-        return
-
-    st.session_state.messages.append({"role": "user", "content": user_input})
-
-    last_interactions = get_last_interactions(st.session_state.messages)
-
-    if not st.session_state.context_chunks:
-        context = "No previous context available."
-    else:
-        context_parts = [
-            f"Section: {chunk['section']}\nFile: {chunk['file']}\n\n{chunk['text']}"
-            for chunk in st.session_state.context_chunks
-        ]
-        context = "\n\n---\n\n".join(context_parts)
-
-    messages = build_messages_with_context(
-        st.session_state.system_prompt,
-        last_interactions,
-        context,
-        user_input
+    return on_token
+
+def _run_in_session(flow, user_input, on_token=None):
+    """Run a ChatEngine flow against the conversation kept in st.session_state."""
+    conversation = Conversation(
+        messages=st.session_state.messages,
+        knowledge_file=st.session_state.knowledge_file,
+        system_prompt=st.session_state.system_prompt,
+        context_chunks=st.session_state.context_chunks,
+        memory=st.session_state.memory,
+        # Set by streamlit_authenticator on login; quota is shared fairly between users
+        user=st.session_state.get("username")
     )
-    response = ask_gpt(messages)
+    result = flow(conversation, user_input, on_token=on_token)
+    st.session_state.messages = conversation.messages
+    st.session_state.knowledge_file = conversation.knowledge_file
+    st.session_state.system_prompt = conversation.system_prompt
+    st.session_state.context_chunks = conversation.context_chunks
+    st.session_state.memory = conversation.memory
+    st.session_state.last_timings = result["timings"]
+    st.session_state.time_to_first_token = result["timings"].get("time_to_first_token")
+    return result
+
+def process_new_thread(user_input, on_token=None):
+    """Handle starting a new thread."""
+    return _run_in_session(get_chat_engine().new_thread, user_input, on_token=on_token)
 
-    st.session_state.messages.append({"role": "assistant", "content": response})
+def process_continue_thread(user_input, on_token=None):
+    """Handle continuing an existing thread."""
+    return _run_in_session(get_chat_engine().continue_thread, user_input, on_token=on_token)
 
-def process_continue_thread_update(user_input):
+def process_continue_thread_update(user_input, on_token=None):
     """Handle continuing an existing thread and updating the knowledge base."""
-    # Retrieve knowledge file, cleaned query, and instructions
-    knowledge_file, cleaned_query, instructions_file = determine_context_type(user_input)
-    st.session_state.knowledge_file = knowledge_file
-    st.session_state.system_prompt = load_system_prompt(file_path=instructions_file)
-
-    # Generate embeddings and search for relevant context
-    query_embedding = generate_query_embedding(cleaned_query)
-    relevant_chunks = search_pinecone(query_embedding, knowledge_file)
-
-    if not user_input.strip():
-        st.session_state.messages.append(
-            {"role": "assistant", "content": "Please provide a valid query to continue the thread and update the knowledge base."}
-        )
-        return
-
-    if not relevant_chunks:
-        st.session_state.messages.append(
-            {"role": "assistant", "content": "No updated information found in the knowledge base for the given query."}
-        )
-        return
-
-    context_parts = [
-        f"Section: {chunk['section']}\nFile: {chunk['file']}\n\n{chunk['text']}"
-        for chunk in relevant_chunks
-    ]
-    context = "\n\n---\n\n".join(context_parts)
-
-    # Generate the assistant's response
-    messages = build_messages_with_context(
-        st.session_state.system_prompt,
-        get_last_interactions(st.session_state.messages),
-        context,
-        user_input
-    )
-    response = ask_gpt(messages)
-
-    # Update context chunks and append the assistant response
-    st.session_state.context_chunks = relevant_chunks
-    st.session_state.messages.append({"role": "user", "content": user_input})
-    st.session_state.messages.append({"role": "assistant", "content": response})
+    return _run_in_session(get_chat_engine().continue_thread_update, user_input, on_token=on_token)
+
+def render_conversation(messages):
+    for msg in messages:
+        with st.container():
+            if msg["role"] == "user":
+                st.markdown(
+                    f"<div class='user-message'><b>You:</b> {msg['content']}</div>",
+                    unsafe_allow_html=True
+                )
+            else:
+                st.markdown(
+                    f"<div class='assistant-message'><b>Assistant:</b> {msg['content']}</div>",
+                    unsafe_allow_html=True
+                )
+
+def render_context_chunks(context_chunks):
+    for i, chunk in enumerate(context_chunks, start=1):
+        # Style for the "Context Chunk" label
+        st.markdown(f'<div class="st-chunk-label">Context Chunk {i}:</div>', unsafe_allow_html=True)
+        # Style for "Section" detail
+        st.markdown(f'<div class="st-chunk-label">- <b>Section:</b> {chunk["section"]}</div>', unsafe_allow_html=True)
+        # Style for "File" detail
+        st.markdown(f'<div class="st-chunk-label">- <b>File:</b> {chunk["file"]}</div>', unsafe_allow_html=True)
+        st.markdown('<div class="st-divider"></div>', unsafe_allow_html=True)
+        st.markdown(f'<div class="st-chunk-details">{chunk["text"]}</div>', unsafe_allow_html=True)
+        st.markdown('<div class="st-divider"></div>', unsafe_allow_html=True)
+
+def render_debug_sidebar():
+    """Timing breakdown of the last request and cache counters."""
+    engine = get_chat_engine()
+    with st.sidebar:
+        st.subheader("Last request")
+        trace = st.session_state.last_trace
+        if not trace:
+            st.caption("No request yet.")
+        else:
+            st.caption(f"Trace {trace['trace_id']}")
+            st.dataframe(
+                [
+                    {
+                        "stage": span_data["name"],
+                        "ms": round(span_data["duration_ms"] or 0.0, 1),
+                        **{key: str(value) for key, value in span_data["attributes"].items()}
+                    }
+                    for span_data in sorted(trace["spans"], key=lambda item: item["start_time"])
+                ],
+                hide_index=True
+            )
+        st.subheader("Caches")
+        for name in ("embedding_cache", "response_cache", "semantic_cache"):
+            cache = getattr(engine, name)
+            if cache is not None:
+                st.json({name: cache.stats()}, expanded=False)
 
 def knowledge_base_chat():
     """
@@ -268,7 +154,7 @@ def knowledge_base_chat():
                 When starting a thread, the assistant uses your query to retrieve relevant documentation. To refine or explore further, use 
                 <i>Continue thread updating knowledge base</i>.
                 <br><br>
-                Begin questions with <code>/tech</code> to access technical documentation on Tucuvi Data and signal that your query requires technical insights.
+                Questions are answered from the organizational or the technical documentation on Tucuvi Data, whichever matches them best. Begin a question with <code>/tech</code> to search the technical documentation only.
             </p>
             """, 
             unsafe_allow_html=True
@@ -283,10 +169,18 @@ def knowledge_base_chat():
         st.session_state.system_prompt = None
     if "context_chunks" not in st.session_state:
         st.session_state.context_chunks = []
+    if "memory" not in st.session_state:
+        st.session_state.memory = ConversationMemory()
     if "clear_input_on_next_run" not in st.session_state:
         st.session_state.clear_input_on_next_run = False
     if "action_triggered" not in st.session_state:
         st.session_state.action_triggered = False
+    if "time_to_first_token" not in st.session_state:
+        st.session_state.time_to_first_token = None
+    if "last_timings" not in st.session_state:
+        st.session_state.last_timings = {}
+    if "last_trace" not in st.session_state:
+        st.session_state.last_trace = None
 
     col1, col2 = st.columns([1, 1])
 
@@ -307,57 +201,61 @@ def knowledge_base_chat():
         if st.session_state.clear_input_on_next_run:
             st.session_state.clear_input_on_next_run = False
 
+        # Streamed answers are rendered here while they are generated
+        stream_placeholder = st.empty()
+        on_token = stream_to_placeholder(stream_placeholder) if STREAM_RESPONSES else None
+
         # Button Logic
+        flow = None
         if new_thread_btn:
             st.session_state.action_triggered = True
-            process_new_thread(user_input)
-            st.session_state.clear_input_on_next_run = True
+            flow = process_new_thread
 
         elif continue_thread_btn:
             st.session_state.action_triggered = True
-            process_continue_thread(user_input)
-            st.session_state.clear_input_on_next_run = True
+            flow = process_continue_thread
 
         elif continue_thread_update_btn:
             st.session_state.action_triggered = True
-            process_continue_thread_update(user_input)
-            st.session_state.clear_input_on_next_run = True
+            flow = process_continue_thread_update
 
         elif user_input.strip() and not st.session_state.action_triggered:
             # Default behavior: if user just presses enter
             if st.session_state.knowledge_file:
-                process_continue_thread(user_input)
+                flow = process_continue_thread
             else:
-                process_new_thread(user_input)
+                flow = process_new_thread
+
+        # Requests are traced from the engine call until the page is rendered
+        trace_scope = contextlib.ExitStack()
+        if flow is not None:
+            trace = trace_scope.enter_context(request_trace("chat_request", action=flow.__name__))
+            try:
+                flow(user_input, on_token=on_token)
+            except BaseException:
+                # Do not leave the trace active for the next rerun of this script thread
+                trace_scope.close()
+                raise
             st.session_state.clear_input_on_next_run = True
 
+        # The final answer is part of the conversation rendered below
+        stream_placeholder.empty()
+
         # Reset action_triggered for the next iteration
         st.session_state.action_triggered = False
 
         # Display conversation
-        for msg in st.session_state.messages:
-            with st.container():
-                if msg["role"] == "user":
-                    st.markdown(
-                        f"<div class='user-message'><b>You:</b> {msg['content']}</div>",
-                        unsafe_allow_html=True
-                    )
-                else:
-                    st.markdown(
-                        f"<div class='assistant-message'><b>Assistant:</b> {msg['content']}</div>",
-                        unsafe_allow_html=True
-                    )
+        with span("render_conversation", messages=len(st.session_state.messages)):
+            render_conversation(st.session_state.messages)
 
     with col2:
         st.header("Retrieved knowledge")
-        if st.session_state.context_chunks:
-            for i, chunk in enumerate(st.session_state.context_chunks, start=1):
-                # Style for the "Context Chunk" label
-                st.markdown(f'<div class="st-chunk-label">Context Chunk {i}:</div>', unsafe_allow_html=True)
-                # Style for "Section" detail
-                st.markdown(f'<div class="st-chunk-label">- <b>Section:</b> {chunk["section"]}</div>', unsafe_allow_html=True)
-                # Style for "File" detail
-                st.markdown(f'<div class="st-chunk-label">- <b>File:</b> {chunk["file"]}</div>', unsafe_allow_html=True)
-                st.markdown('<div class="st-divider"></div>', unsafe_allow_html=True)
-                st.markdown(f'<div class="st-chunk-details">{chunk["text"]}</div>', unsafe_allow_html=True)
-                st.markdown('<div class="st-divider"></div>', unsafe_allow_html=True)
\ No newline at end of file
+        with span("render_context_chunks", chunks=len(st.session_state.context_chunks)):
+            render_context_chunks(st.session_state.context_chunks)
+
+    trace_scope.close()
+    if flow is not None:
+        st.session_state.last_trace = trace.to_dict()
+
+    if DEBUG_SIDEBAR:
+        render_debug_sidebar()
@@ -0,0 +1,813 @@
+import asyncio
+import logging
+import os
+import time
+
+from dotenv import load_dotenv
+
+from async_pipeline import AsyncRagPipeline, BackgroundEventLoop
+from clients import get_azure_openai_client, get_pinecone_client
+from context_expansion import EXPANSION_TOKEN_BUDGET, NEIGHBOUR_WINDOW, expand_chunks, neighbour_ids, parse_chunk_id
+from context_packer import MAX_INPUT_TOKENS, pack_prompt
+from conversation_memory import ConversationMemory, ConversationSummarizer
+from embedding_cache import EmbeddingCache
+from lexical_index import LexicalIndexStore, reciprocal_rank_fusion
+from query_router import KNOWLEDGE_FILES, file_filter, route_prompt
+from rate_limiter import (
+    LOAD_SHED_MESSAGE,
+    PRIORITY_INTERACTIVE,
+    LoadShedError,
+    estimate_tokens,
+    get_scheduler
+)
+from resilience import (
+    BREAKER_FAILURES,
+    BREAKER_RESET_SECONDS,
+    CircuitOpenError,
+    ResilientCaller,
+    get_breaker,
+    is_transient
+)
+from response_cache import ResponseCache
+from semantic_cache import SemanticCache
+from token_counter import count_message_tokens, count_tokens
+from tracing import request_trace, span
+from vector_store import (
+    LAYOUT_PER_FILE,
+    LAYOUT_SHARED,
+    AsyncVectorStore,
+    NamespaceResolver,
+    file_namespace,
+    get_vector_store
+)
+
+logger = logging.getLogger(__name__)
+
+########################################
+# 1. Load environment variables
+########################################
+
+load_dotenv()
+
+INDEX_NAME = "knowledge-base"
+NAMESPACE = "markdown_chunks"
+DIMENSION = 1024
+PINECONE_CLOUD = "aws"
+PINECONE_REGION = "us-east-1"
+EMBEDDING_MODEL = "multilingual-e5-large"
+AZURE_DEPLOYMENT = "gpt-4o"  # example deployment name
+CHAT_TEMPERATURE = 0.7
+# Answer shown when the chat deployment fails after its retries or its circuit is open
+UNAVAILABLE_MESSAGE = "The assistant is temporarily unavailable. Please try again in a moment."
+
+
+########################################
+# 2. Prompt helpers
+########################################
+
+def load_system_prompt(file_path="instructions.txt"):
+    """Load the system prompt from a text file."""
+    with span("load_system_prompt", file=file_path) as current:
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"System prompt file '{file_path}' not found.")
+        with open(file_path, "r", encoding="utf-8") as file:
+            system_prompt = file.read().strip()
+        if current is not None:
+            current.set(chars=len(system_prompt), tokens=count_tokens(system_prompt))
+        return system_prompt
+
+def _service_unavailable(error):
+    """Whether `error` means a service is down or over quota, rather than a bad request or a bug."""
+    return isinstance(error, (CircuitOpenError, LoadShedError)) or is_transient(error)
+
+def determine_context_type(prompt, auto_route=False):
+    """
+    Candidate knowledge files, cleaned query and {knowledge_file: instructions_file} for a prompt.
+
+    `/tech` forces the technical file. Otherwise, with `auto_route`, every knowledge file
+    is a candidate and the search picks the one its hits favour (see query_router.py).
+    """
+    knowledge_files, cleaned_prompt = route_prompt(prompt, auto_route)
+    return knowledge_files, cleaned_prompt, {file: KNOWLEDGE_FILES[file] for file in knowledge_files}
+
+def build_messages_with_context(system_prompt, conversation_history, context, user_query,
+                                max_input_tokens=MAX_INPUT_TOKENS):
+    """
+    Build the message list sent to GPT.
+
+    `context` is either a preformatted string or the retrieved chunks. Chunks and history
+    are packed to keep the prompt within `max_input_tokens` (see context_packer.py).
+    """
+    with span("build_messages_with_context") as current:
+        report = {}
+        if not isinstance(context, str):
+            conversation_history, context, _, report = pack_prompt(
+                system_prompt, conversation_history, context, user_query, max_input_tokens
+            )
+        messages = [{"role": "system", "content": system_prompt}]
+        for msg in conversation_history:
+            messages.append(msg)
+        messages.append({"role": "assistant", "content": f"Context:\n{context}"})
+        messages.append({"role": "user", "content": user_query})
+        if current is not None:
+            current.set(
+                messages=len(messages),
+                history_messages=len(conversation_history),
+                context_chars=len(context),
+                prompt_tokens=count_message_tokens(messages)
+            )
+            current.set(**report)
+        return messages
+
+def get_last_interactions(messages, user_turns=2, assistant_turns=2):
+    """Get the last user/assistant messages for conversation continuity."""
+    last_interactions = []
+    reversed_messages = list(reversed(messages))
+    user_count = 0
+    assistant_count = 0
+    for msg in reversed_messages:
+        if msg["role"] == "assistant" and assistant_count < assistant_turns:
+            last_interactions.insert(0, msg)
+            assistant_count += 1
+        elif msg["role"] == "user" and user_count < user_turns:
+            last_interactions.insert(0, msg)
+            user_count += 1
+        if user_count == user_turns and assistant_count == assistant_turns:
+            break
+    return last_interactions
+
+def _to_chunk(vector_id, metadata, score=None):
+    return {
+        "id": vector_id,
+        "text": metadata.get('text', '[Missing text]'),
+        "section": metadata.get('section', 'Unknown Section'),
+        "file": metadata.get('file', 'Unknown File'),
+        "score": score,
+        "tokens": metadata.get('tokens'),
+        "heading_path": metadata.get('heading_path'),
+        # Chunk positions under the same H1, bounding small-to-big expansion
+        "parent_first": metadata.get('parent_first'),
+        "parent_last": metadata.get('parent_last')
+    }
+
+def matches_to_chunks(results):
+    """Turn vector store matches into the chunk dicts used by the chat."""
+    return [
+        _to_chunk(match['id'], match['metadata'], match.get('score'))
+        for match in results.get('matches', [])
+    ]
+
+def fetched_to_chunks(response):
+    """Turn a vector store fetch response into {id: chunk dict}."""
+    return {
+        vector_id: _to_chunk(vector_id, vector['metadata'])
+        for vector_id, vector in response.get('vectors', {}).items()
+    }
+
+
+def _record_chunks(current, chunks):
+    if current is not None:
+        current.set(
+            matches=len(chunks),
+            payload_chars=sum(len(chunk["text"]) for chunk in chunks),
+            context_tokens=sum(count_tokens(chunk["text"]) for chunk in chunks)
+        )
+
+
+########################################
+# 3. Conversation state and engine
+########################################
+
+class Conversation:
+    """State of one chat thread, independent of any UI."""
+
+    def __init__(self, messages=None, knowledge_file=None, system_prompt=None, context_chunks=None, memory=None,
+                 user=None):
+        self.messages = messages if messages is not None else []
+        self.knowledge_file = knowledge_file
+        self.system_prompt = system_prompt
+        self.context_chunks = context_chunks if context_chunks is not None else []
+        # Running summary of the turns that left the recent history
+        self.memory = memory if memory is not None else ConversationMemory()
+        # Who is asking; the request scheduler shares the deployment's quota fairly between users
+        self.user = user
+
+    def reset(self):
+        self.messages = []
+        self.knowledge_file = None
+        self.system_prompt = None
+        self.context_chunks = []
+        self.memory = ConversationMemory()
+
+
+class ChatEngine:
+    """
+    Headless knowledge base chat.
+
+    Runs the new thread / continue / continue-with-refresh flows against an explicit
+    `Conversation`, so many conversations can be served concurrently from one engine
+    (every cache and client it holds is thread-safe). Each flow updates the conversation
+    and returns a dict with:
+
+    - `response`: the assistant message appended to the conversation
+    - `chunks`: the context chunks used for the answer
+    - `cache`: "semantic" or "response" when the answer came from a cache, else None
+    - `unavailable`: True when the chat deployment could not be reached, or its quota
+      was exhausted, and UNAVAILABLE_MESSAGE (or LOAD_SHED_MESSAGE) was returned instead
+    - `timings`: seconds spent per stage (`retrieval`, `queue` waiting for quota, `llm`,
+      `total`, and `time_to_first_token` when streaming)
+    - `trace`: the `tracing.Trace` with one span per stage (token counts, payload sizes)
+
+    Dependencies are injected, which lets tests and benchmarks swap in local fakes:
+    `embed_query(text) -> vector`, a `VectorStore`, and an OpenAI-compatible client.
+    Calls to the chat deployment and to the embedding model go through ResilientCallers
+    (retries, hedging, circuit breaking; see resilience.py), and chat completions are
+    admitted by a RequestScheduler that keeps them within the deployment's TPM and RPM
+    quotas (see rate_limiter.py).
+    """
+
+    def __init__(
+        self,
+        embed_query,
+        vector_store,
+        llm_client,
+        deployment=AZURE_DEPLOYMENT,
+        namespace=NAMESPACE,
+        embedding_model=EMBEDDING_MODEL,
+        temperature=CHAT_TEMPERATURE,
+        top_k=3,
+        neighbour_window=NEIGHBOUR_WINDOW,
+        expansion_token_budget=EXPANSION_TOKEN_BUDGET,
+        max_input_tokens=MAX_INPUT_TOKENS,
+        summarize_history=True,
+        route_queries=True,
+        lexical_index=None,
+        embedding_cache=None,
+        response_cache=None,
+        semantic_cache=None,
+        resolve_namespace=None,
+        resolve_layout=None,
+        llm_caller=None,
+        embedding_caller=None,
+        scheduler=None
+    ):
+        self._embed_query = embed_query
+        self.vector_store = vector_store
+        self._async_vector_store = AsyncVectorStore(vector_store)
+        self._llm_client = llm_client
+        self.deployment = deployment
+        self.namespace = namespace
+        # Maps the namespace alias to the versioned namespace currently live
+        self._resolve_namespace = resolve_namespace or (lambda alias: alias)
+        # Whether that namespace holds every file (queries filter on the file) or one namespace per file
+        self._resolve_layout = resolve_layout or (lambda alias: LAYOUT_SHARED)
+        self.embedding_model = embedding_model
+        self.temperature = temperature
+        self.top_k = top_k
+        # Small-to-big retrieval: neighbours merged into each hit (0 disables it)
+        self.neighbour_window = neighbour_window
+        self.expansion_token_budget = expansion_token_budget
+        # Prompt size that chunks and history are packed into
+        self.max_input_tokens = max_input_tokens
+        # Shared with every engine and service on the same deployment (unlimited unless configured)
+        self.scheduler = scheduler or get_scheduler(deployment)
+        # Older turns are folded into a running summary; without it the last turns are sent
+        self.summarizer = (
+            ConversationSummarizer(llm_client, deployment, scheduler=self.scheduler) if summarize_history else None
+        )
+        # Questions without /tech are searched in every knowledge file at once
+        self.route_queries = route_queries
+        # BM25 indexes written at ingestion (LexicalIndexStore); None for vector search only
+        self.lexical_index = lexical_index
+        self.llm_caller = llm_caller or ResilientCaller(f"chat:{deployment}")
+        # Embeddings are cheap and idempotent, so slow ones are hedged
+        self.embedding_caller = embedding_caller or ResilientCaller(f"embedding:{embedding_model}", hedge=True)
+        self.embedding_cache = embedding_cache
+        self.response_cache = response_cache
+        self.semantic_cache = semantic_cache
+        self.pipeline = AsyncRagPipeline(
+            load_system_prompt=load_system_prompt,
+            embed_query=self.generate_query_embedding,
+            search=self.search_async,
+            lexical_search=self.lexical_search if lexical_index is not None else None
+        )
+        self._loop = BackgroundEventLoop()
+
+    # Stages
+
+    def generate_query_embedding(self, user_query):
+        """Generate the query embedding, served from the embedding cache when possible."""
+        with span("generate_query_embedding", chars=len(user_query), tokens=count_tokens(user_query)):
+            def embed(text):
+                return self.embedding_caller.call(self._embed_query, text)
+
+            if self.embedding_cache is None:
+                return embed(user_query)
+            return self.embedding_cache.get_or_compute(user_query, self.embedding_model, "passage", embed)
+
+    def lexical_search(self, query, knowledge_file, top_k=None):
+        """
+        Keyword (BM25) search of the chunks indexed at ingestion.
+
+        Returns {"chunks", "decisive"}; `decisive` means the best hit settles the query and
+        the embedding can be skipped.
+        """
+        top_k = top_k or self.top_k
+        with span("lexical_search", file=knowledge_file) as current:
+            index = self.lexical_index.get(self._resolve_namespace(self.namespace)) if self.lexical_index else None
+            if index is None:
+                return {"chunks": [], "decisive": False}
+            # Twice as many candidates as we keep, for the fusion with the vector hits
+            results = index.search(query, top_k * 2, filter=file_filter(knowledge_file))
+            decisive = index.is_decisive(query, results)
+            chunks = [
+                _to_chunk(document["id"], dict(document["metadata"], text=document["text"]), score)
+                for score, document in results
+            ]
+            if decisive:
+                chunks = chunks[:top_k]
+            if current is not None:
+                current.set(matches=len(chunks), decisive=decisive)
+            return {"chunks": chunks, "decisive": decisive}
+
+    def _targets(self, knowledge_file):
+        """
+        (namespace, filter) pairs to query for the knowledge file(s): the file namespaces
+        themselves in a per-file layout, else the shared namespace filtered on the file.
+        """
+        namespace = self._resolve_namespace(self.namespace)
+        if self._resolve_layout(self.namespace) != LAYOUT_PER_FILE:
+            return [(namespace, file_filter(knowledge_file))]
+        files = [knowledge_file] if isinstance(knowledge_file, str) else knowledge_file
+        return [(file_namespace(namespace, file), None) for file in files]
+
+    def _fetch_groups(self, ids, targets):
+        """Neighbour ids grouped by the namespace that holds them."""
+        if len(targets) == 1:
+            return [(targets[0][0], ids)]
+        namespace = self._resolve_namespace(self.namespace)
+        groups = {}
+        for vector_id in ids:
+            parsed = parse_chunk_id(vector_id)
+            if parsed is not None:
+                groups.setdefault(file_namespace(namespace, parsed[0]), []).append(vector_id)
+        return list(groups.items())
+
+    @staticmethod
+    def _query_kwargs(query_embedding, top_k, namespace, metadata_filter, lexical_chunks):
+        return {
+            "namespace": namespace,
+            "vector": query_embedding,
+            # Twice as many candidates when they are fused with the keyword hits
+            "top_k": top_k * 2 if lexical_chunks else top_k,
+            "include_values": False,
+            "include_metadata": True,
+            "filter": metadata_filter
+        }
+
+    @staticmethod
+    def _merge_matches(responses, top_k, lexical_chunks):
+        """Matches of the queried namespaces as chunks, best score first."""
+        chunks = [chunk for response in responses for chunk in matches_to_chunks(response)]
+        chunks.sort(key=lambda chunk: -(chunk["score"] or 0.0))
+        return chunks[:top_k * 2 if lexical_chunks else top_k]
+
+    def _fuse(self, vector_chunks, lexical_chunks, top_k, current):
+        if lexical_chunks is None:
+            return vector_chunks
+        if current is not None:
+            current.set(vector_matches=len(vector_chunks), lexical_matches=len(lexical_chunks))
+        # No keyword hits (e.g. no index): keep the cosine scores, which route_prompt compares
+        if not lexical_chunks:
+            return vector_chunks
+        if not vector_chunks:
+            return lexical_chunks[:top_k]
+        return reciprocal_rank_fusion([vector_chunks, lexical_chunks], top_k)
+
+    async def search_async(self, query_embedding, knowledge_file, top_k=None, lexical_chunks=None):
+        """
+        Vector search of the knowledge file(s), fused with `lexical_chunks` and expanded
+        with neighbours; used by the RAG pipeline. Namespaces are queried concurrently.
+        """
+        top_k = top_k or self.top_k
+        with span("search_pinecone", top_k=top_k, file=knowledge_file) as current:
+            # The first alias lookup fetches it from the store: keep it off the shared event loop
+            targets = await asyncio.to_thread(self._targets, knowledge_file)
+            if current is not None:
+                current.set(namespace=[namespace for namespace, _ in targets])
+            chunks = []
+            if query_embedding is not None:
+                chunks = self._merge_matches(await asyncio.gather(*(
+                    self._async_vector_store.query(
+                        **self._query_kwargs(query_embedding, top_k, namespace, metadata_filter, lexical_chunks)
+                    )
+                    for namespace, metadata_filter in targets
+                )), top_k, lexical_chunks)
+            chunks = self._fuse(chunks, lexical_chunks, top_k, current)
+            ids = neighbour_ids(chunks, self.neighbour_window, self.expansion_token_budget)
+            if ids:
+                fetched = {"vectors": {}}
+                for response in await asyncio.gather(*(
+                    self._async_vector_store.fetch(group, namespace)
+                    for namespace, group in self._fetch_groups(ids, targets)
+                )):
+                    fetched["vectors"].update(response["vectors"])
+                chunks = self._expand(chunks, fetched)
+            _record_chunks(current, chunks)
+            return chunks
+
+    def _expand(self, chunks, fetched):
+        """Merge the hits with their fetched neighbours (small-to-big retrieval)."""
+        with span("expand_chunks", hits=len(chunks), fetched=len(fetched.get("vectors", {}))) as current:
+            passages = expand_chunks(
+                chunks, fetched_to_chunks(fetched), self.neighbour_window, self.expansion_token_budget
+            )
+            if current is not None:
+                current.set(
+                    passages=len(passages),
+                    neighbours_added=sum(len(passage["ids"]) for passage in passages) - len(chunks)
+                )
+            return passages
+
+    def ask_gpt(self, messages, on_token=None, timings=None, user=None):
+        """
+        Send messages to the chat deployment, reusing the cached answer for identical requests.
+
+        When `on_token` is given the completion is streamed and `on_token` is called with
+        each text delta as it arrives; the full answer is still returned at the end.
+        The request waits for the deployment's quota as `user`, and raises LoadShedError
+        when it would wait too long.
+        """
+        with span("ask_gpt", deployment=self.deployment, stream=on_token is not None) as current:
+            answer, usage = self._ask_gpt(messages, on_token, timings, user)
+            if current is not None:
+                current.set(
+                    cache=bool(timings and timings.get("cache") == "response"),
+                    prompt_tokens=usage.prompt_tokens if usage is not None else count_message_tokens(messages),
+                    completion_tokens=usage.completion_tokens if usage is not None else count_tokens(answer or ""),
+                    answer_chars=len(answer or "")
+                )
+            return answer
+
+    def _ask_gpt(self, messages, on_token, timings, user=None):
+        """Returns the answer and the token usage reported by the service (None if unknown)."""
+        if self.response_cache is not None:
+            cached = self.response_cache.get(self.deployment, self.temperature, messages)
+            if cached is not None:
+                if timings is not None:
+                    timings["cache"] = "response"
+                if on_token is not None:
+                    on_token(cached)
+                return cached, None
+        # Admitted once per request: retries spend the same reservation
+        reservation = self.scheduler.acquire(estimate_tokens(messages), user=user, priority=PRIORITY_INTERACTIVE)
+        if timings is not None:
+            timings["queue"] = reservation.waited
+        answer, usage, parts = None, None, []
+        try:
+            if on_token is None:
+                response = self.llm_caller.call(
+                    self._llm_client.chat.completions.create,
+                    model=self.deployment,
+                    messages=messages,
+                    temperature=self.temperature
+                )
+                answer = response.choices[0].message.content
+                usage = getattr(response, "usage", None)
+            else:
+                # Only opening the stream is retried: tokens already shown cannot be taken back
+                stream = self.llm_caller.call_without_hedging(
+                    self._llm_client.chat.completions.create,
+                    model=self.deployment,
+                    messages=messages,
+                    temperature=self.temperature,
+                    stream=True
+                )
+                for chunk in stream:
+                    # Azure sends a first chunk with prompt filter results and no choices
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        parts.append(delta)
+                        on_token(delta)
+                answer = "".join(parts)
+        finally:
+            # A failed request is charged for what it generated, nothing if it never started
+            if usage is not None:
+                reservation.settle(usage.total_tokens)
+            elif answer is not None or parts:
+                reservation.settle(count_message_tokens(messages) + count_tokens(answer or "".join(parts)))
+            else:
+                reservation.settle(0)
+        if answer is not None and self.response_cache is not None:
+            self.response_cache.put(self.deployment, self.temperature, messages, answer)
+        return answer, usage
+
+    def _retrieve(self, query, knowledge_files, instructions_files, load_history=None):
+        return self._loop.run(
+            self.pipeline.retrieve(query, knowledge_files, instructions_files, load_history=load_history)
+        )
+
+    def _generate(self, messages, on_token, timings, started_at, user=None):
+        """Call ask_gpt while recording the LLM time and the time to first token."""
+        def timed_on_token(token):
+            if "time_to_first_token" not in timings:
+                timings["time_to_first_token"] = time.perf_counter() - started_at
+            on_token(token)
+
+        llm_start = time.perf_counter()
+        try:
+            response = self.ask_gpt(
+                messages, on_token=timed_on_token if on_token is not None else None, timings=timings, user=user
+            )
+        except Exception as error:
+            if not _service_unavailable(error):
+                raise
+            # The deployment is down or overloaded: say so at once rather than failing the page
+            response = LOAD_SHED_MESSAGE if isinstance(error, LoadShedError) else UNAVAILABLE_MESSAGE
+            timings["unavailable"] = True
+            if on_token is not None:
+                on_token(response)
+        timings["llm"] = time.perf_counter() - llm_start
+        return response
+
+    def _history(self, messages, memory):
+        """History sent with a follow-up question: running summary plus recent turns."""
+        if self.summarizer is None:
+            return get_last_interactions(messages)
+        return self.summarizer.history(messages, memory)
+
+    def _remember(self, conversation):
+        """Update the thread's running summary in the background once the answer is out."""
+        if self.summarizer is not None:
+            self.summarizer.schedule(conversation.messages, conversation.memory)
+
+    def _unavailable(self, conversation, timings, started_at):
+        """Answer when no context could be retrieved: the embedding model is down and no keyword hit helps."""
+        conversation.messages.append({"role": "assistant", "content": UNAVAILABLE_MESSAGE})
+        timings["unavailable"] = True
+        return self._result(UNAVAILABLE_MESSAGE, [], timings, started_at)
+
+    @staticmethod
+    def _result(response, chunks, timings, started_at):
+        cache = timings.pop("cache", None)
+        unavailable = timings.pop("unavailable", False)
+        timings["total"] = time.perf_counter() - started_at
+        return {
+            "response": response, "chunks": chunks, "cache": cache, "unavailable": unavailable, "timings": timings
+        }
+
+    # Flows
+
+    def new_thread(self, conversation, user_input, on_token=None):
+        """Start a new thread: retrieve context for the query and answer it."""
+        with request_trace("new_thread") as trace:
+            result = self._new_thread(conversation, user_input, on_token)
+        result["trace"] = trace
+        return result
+
+    def _new_thread(self, conversation, user_input, on_token):
+        started_at = time.perf_counter()
+        timings = {}
+        if not user_input.strip():
+            response = "Please provide a valid query to start a new thread."
+            conversation.messages.append({"role": "assistant", "content": response})
+            return self._result(response, [], timings, started_at)
+
+        # Reset the conversation for a new thread
+        conversation.reset()
+
+        # Retrieve candidate knowledge files, cleaned query, and their instructions
+        knowledge_files, cleaned_query, instructions_files = determine_context_type(user_input, self.route_queries)
+
+        # Load the system prompts while embedding the query and searching for relevant context
+        try:
+            retrieval = self._retrieve(cleaned_query, knowledge_files, instructions_files)
+        except Exception as error:
+            if not _service_unavailable(error):
+                raise
+            return self._unavailable(conversation, timings, started_at)
+        timings["retrieval"] = retrieval["seconds"]
+        knowledge_file = retrieval["knowledge_file"]
+        conversation.knowledge_file = knowledge_file
+        conversation.system_prompt = retrieval["system_prompt"]
+        query_embedding = retrieval["embedding"]
+        relevant_chunks = retrieval["chunks"]
+
+        if not relevant_chunks:
+            response = "I'm sorry, I couldn't find relevant information."
+            conversation.messages.append({"role": "assistant", "content": response})
+            return self._result(response, [], timings, started_at)
+
+        # Reuse the answer of a paraphrased question that retrieved the same chunks
+        # (a decisive keyword match skips the embedding, and with it the semantic cache)
+        response = None
+        if self.semantic_cache is not None and query_embedding is not None:
+            response = self.semantic_cache.lookup(
+                query_embedding, knowledge_file, relevant_chunks, system_prompt=conversation.system_prompt
+            )
+            if response is not None:
+                timings["cache"] = "semantic"
+        if response is None:
+            # Generate the assistant's response
+            messages = build_messages_with_context(
+                conversation.system_prompt, [], relevant_chunks, cleaned_query, self.max_input_tokens
+            )
+            response = self._generate(messages, on_token, timings, started_at, conversation.user)
+            if self.semantic_cache is not None and query_embedding is not None and not timings.get("unavailable"):
+                self.semantic_cache.add(
+                    query_embedding, knowledge_file, relevant_chunks, response,
+                    system_prompt=conversation.system_prompt
+                )
+
+        conversation.messages.append({"role": "user", "content": user_input})
+        conversation.messages.append({"role": "assistant", "content": response})
+        conversation.context_chunks = relevant_chunks
+        return self._result(response, relevant_chunks, timings, started_at)
+
+    def continue_thread(self, conversation, user_input, on_token=None):
+        """Continue the thread with the context retrieved previously."""
+        with request_trace("continue_thread") as trace:
+            result = self._continue_thread(conversation, user_input, on_token)
+        result["trace"] = trace
+        return result
+
+    def _continue_thread(self, conversation, user_input, on_token):
+        started_at = time.perf_counter()
+        timings = {}
+        if not conversation.system_prompt or not conversation.knowledge_file:
+            response = "No active thread found. Please start a new thread."
+            conversation.messages.append({"role": "assistant", "content": response})
+            return self._result(response, [], timings, started_at)
+
+        if not user_input.strip():
+            response = "Please provide a valid query to continue the thread."
+            conversation.messages.append({"role": "assistant", "content": response})
+            return self._result(response, [], timings, started_at)
+
+        history = self._history(conversation.messages, conversation.memory)
+        conversation.messages.append({"role": "user", "content": user_input})
+
+        # The packer fits the previous chunks and the history within the prompt budget
+        context = conversation.context_chunks or "No previous context available."
+
+        messages = build_messages_with_context(
+            conversation.system_prompt,
+            history,
+            context,
+            user_input,
+            self.max_input_tokens
+        )
+        response = self._generate(messages, on_token, timings, started_at, conversation.user)
+
+        conversation.messages.append({"role": "assistant", "content": response})
+        self._remember(conversation)
+        return self._result(response, conversation.context_chunks, timings, started_at)
+
+    def continue_thread_update(self, conversation, user_input, on_token=None):
+        """Continue the thread after retrieving fresh context for the new query."""
+        with request_trace("continue_thread_update") as trace:
+            result = self._continue_thread_update(conversation, user_input, on_token)
+        result["trace"] = trace
+        return result
+
+    def _continue_thread_update(self, conversation, user_input, on_token):
+        started_at = time.perf_counter()
+        timings = {}
+
+        # Retrieve candidate knowledge files, cleaned query, and their instructions
+        knowledge_files, cleaned_query, instructions_files = determine_context_type(user_input, self.route_queries)
+
+        # Load the system prompts and the recent history while embedding the query and searching
+        previous_messages = list(conversation.messages)
+        memory = conversation.memory
+        try:
+            retrieval = self._retrieve(
+                cleaned_query, knowledge_files, instructions_files,
+                load_history=lambda: self._history(previous_messages, memory)
+            )
+        except Exception as error:
+            if not _service_unavailable(error):
+                raise
+            return self._unavailable(conversation, timings, started_at)
+        timings["retrieval"] = retrieval["seconds"]
+        conversation.knowledge_file = retrieval["knowledge_file"]
+        conversation.system_prompt = retrieval["system_prompt"]
+        relevant_chunks = retrieval["chunks"]
+
+        if not user_input.strip():
+            response = "Please provide a valid query to continue the thread and update the knowledge base."
+            conversation.messages.append({"role": "assistant", "content": response})
+            return self._result(response, [], timings, started_at)
+
+        if not relevant_chunks:
+            response = "No updated information found in the knowledge base for the given query."
+            conversation.messages.append({"role": "assistant", "content": response})
+            return self._result(response, [], timings, started_at)
+
+        # Generate the assistant's response
+        messages = build_messages_with_context(
+            conversation.system_prompt,
+            retrieval["history"],
+            relevant_chunks,
+            user_input,
+            self.max_input_tokens
+        )
+        response = self._generate(messages, on_token, timings, started_at, conversation.user)
+
+        # Update context chunks and append the assistant response
+        conversation.context_chunks = relevant_chunks
+        conversation.messages.append({"role": "user", "content": user_input})
+        conversation.messages.append({"role": "assistant", "content": response})
+        self._remember(conversation)
+        return self._result(response, relevant_chunks, timings, started_at)
+
+
+########################################
+# 4. Default engine (Pinecone + Azure OpenAI)
+########################################
+
+def create_default_engine():
+    """Build a ChatEngine on the real services, configured from the environment."""
+    # Process-wide pooled clients, shared with every other engine and service of the process
+    pc = get_pinecone_client()
+    azure_openai_client = get_azure_openai_client(deployment=AZURE_DEPLOYMENT)
+
+    def embed_query(user_query):
+        embeddings = pc.inference.embed(
+            model=EMBEDDING_MODEL,
+            inputs=[user_query],
+            parameters={"input_type": "passage"}
+        )
+        return embeddings[0]["values"]
+
+    # Pinecone or the local NumPy store, depending on VECTOR_STORE_BACKEND
+    vector_store = get_vector_store(index_name=INDEX_NAME)
+    # NAMESPACE is an alias for the versioned namespace published by embed_and_store.py
+    resolver = NamespaceResolver(vector_store, refresh_seconds=float(os.getenv("NAMESPACE_ALIAS_REFRESH", "30")))
+    breaker_settings = {
+        "failures": int(os.getenv("BREAKER_FAILURES", str(BREAKER_FAILURES))),
+        "reset_seconds": float(os.getenv("BREAKER_RESET_SECONDS", str(BREAKER_RESET_SECONDS)))
+    }
+
+    # Keyword index written by embed_and_store.py, fused with the vector search
+    lexical_index = None
+    if os.getenv("HYBRID_SEARCH", "true").lower() == "true":
+        lexical_index_path = os.getenv("LEXICAL_INDEX_PATH", "lexical_index")
+        lexical_index = LexicalIndexStore(lexical_index_path)
+        if lexical_index.get(resolver(NAMESPACE)) is None:
+            logger.warning(
+                "No keyword index for '%s' in %s; searching with vectors only until embed_and_store.py writes one",
+                NAMESPACE, lexical_index_path
+            )
+
+    return ChatEngine(
+        embed_query=embed_query,
+        vector_store=vector_store,
+        neighbour_window=int(os.getenv("RETRIEVAL_NEIGHBOURS", str(NEIGHBOUR_WINDOW))),
+        expansion_token_budget=int(os.getenv("RETRIEVAL_TOKEN_BUDGET", str(EXPANSION_TOKEN_BUDGET))),
+        max_input_tokens=int(os.getenv("PROMPT_TOKEN_BUDGET", str(MAX_INPUT_TOKENS))),
+        summarize_history=os.getenv("SUMMARIZE_HISTORY", "true").lower() == "true",
+        # Search both knowledge files unless the question starts with /tech
+        route_queries=os.getenv("ROUTE_QUERIES", "true").lower() == "true",
+        lexical_index=lexical_index,
+        # Retries, hedging and circuit breaking of the calls to Azure OpenAI and Pinecone inference
+        llm_caller=ResilientCaller(
+            f"chat:{AZURE_DEPLOYMENT}",
+            retries=int(os.getenv("LLM_RETRIES", "3")),
+            hedge=os.getenv("HEDGE_LLM_REQUESTS", "false").lower() == "true",
+            breaker=get_breaker(f"chat:{AZURE_DEPLOYMENT}", **breaker_settings)
+        ),
+        embedding_caller=ResilientCaller(
+            f"embedding:{EMBEDDING_MODEL}",
+            retries=int(os.getenv("EMBEDDING_RETRIES", "3")),
+            hedge=os.getenv("HEDGE_EMBEDDINGS", "true").lower() == "true",
+            breaker=get_breaker(f"embedding:{EMBEDDING_MODEL}", **breaker_settings)
+        ),
+        # Admission within the deployment's quota (AZURE_OPENAI_TPM / AZURE_OPENAI_RPM)
+        scheduler=get_scheduler(AZURE_DEPLOYMENT),
+        resolve_namespace=resolver,
+        # Per-file namespaces are queried directly; shared ones are filtered on the file
+        resolve_layout=resolver.layout,
+        llm_client=azure_openai_client,
+        # Query embedding cache, shared by every conversation served by this engine.
+        # Set EMBEDDING_CACHE_PATH to also keep embeddings on disk across restarts.
+        embedding_cache=EmbeddingCache(
+            max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "2048")),
+            ttl_seconds=float(os.getenv("EMBEDDING_CACHE_TTL", "86400")),
+            db_path=os.getenv("EMBEDDING_CACHE_PATH")
+        ),
+        # Exact-match answer cache, dropped whenever the knowledge base sources or the system prompts change
+        response_cache=ResponseCache(
+            max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "512")),
+            ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+            watched_patterns=["tucuvi_data_*.md", "system_prompts/*.txt"]
+        ),
+        # Answers for near-duplicate questions that retrieved the same chunks
+        semantic_cache=SemanticCache(
+            threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+            max_entries=int(os.getenv("SEMANTIC_CACHE_SIZE", "20000")),
+            ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+        )
+    )
@@ -0,0 +1,138 @@
+"""
+Process-wide registry of the Azure OpenAI and Pinecone clients.
+
+Each client is built once per process and shared by every caller: the chat engine
+serving all Streamlit sessions, `AzureLLMService` instances and the ingestion script.
+Every Azure OpenAI client of the process, whatever its deployment, sends its requests
+through one pooled HTTP client: connections are kept alive
+between requests instead of paying a TLS handshake each time, and the number of open
+sockets is capped. HTTP/2 is used when the optional `h2` package is installed.
+"""
+import importlib.util
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Connection pool of the shared HTTP clients
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "10"))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "120"))
+# Seconds to open a connection, and to wait for a response (completions can be slow)
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60"))
+# Seconds each warm-up request may take
+WARM_UP_TIMEOUT = 10.0
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+_clients = {}
+_lock = threading.RLock()
+
+
+def _shared(key, factory):
+    """The client registered under `key`, built by `factory` on first use (factories may nest)."""
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = factory()
+        return client
+
+
+def _http_options():
+    # openai builds its clients on httpx2 (pinned with it in requirements.txt), whose
+    # Limits and Timeout are not interchangeable with those of httpx
+    import httpx2
+
+    return {
+        "limits": httpx2.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_SECONDS
+        ),
+        "timeout": httpx2.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        "http2": HTTP2_AVAILABLE
+    }
+
+
+def get_http_client():
+    """Pooled keep-alive HTTP client shared by the sync Azure OpenAI clients."""
+    from openai import DefaultHttpxClient
+
+    return _shared(("http",), lambda: DefaultHttpxClient(**_http_options()))
+
+
+def _azure_settings(api_key, api_version, endpoint, deployment):
+    return (
+        api_key or os.getenv("AZURE_OPENAI_API_KEY"),
+        api_version or os.getenv("AZURE_OPENAI_API_VERSION"),
+        endpoint or os.getenv("AZURE_OPENAI_ENDPOINT"),
+        deployment
+    )
+
+
+def get_azure_openai_client(api_key=None, api_version=None, endpoint=None, deployment=None):
+    """Shared AzureOpenAI client; settings default to the AZURE_OPENAI_* environment variables."""
+    from openai import AzureOpenAI
+
+    api_key, api_version, endpoint, deployment = _azure_settings(api_key, api_version, endpoint, deployment)
+    return _shared(("azure_openai", api_key, api_version, endpoint, deployment), lambda: AzureOpenAI(
+        api_key=api_key,
+        api_version=api_version,
+        azure_endpoint=endpoint,
+        azure_deployment=deployment,
+        http_client=get_http_client(),
+        # Retries are left to resilience.py, which also honours Retry-After
+        max_retries=0
+    ))
+
+
+def get_pinecone_client(api_key=None):
+    """Shared Pinecone client (control plane and inference), with a bounded connection pool."""
+    from pinecone import Pinecone
+
+    api_key = api_key or os.getenv("PINECONE_API_KEY")
+    return _shared(("pinecone", api_key), lambda: Pinecone(
+        api_key=api_key,
+        timeout=HTTP_READ_TIMEOUT,
+        connection_pool_maxsize=HTTP_MAX_CONNECTIONS
+    ))
+
+
+def get_pinecone_index(index_name, api_key=None):
+    """Shared handle (and connection pool) of a Pinecone index."""
+    return _shared(("pinecone_index", api_key, index_name), lambda: get_pinecone_client(api_key).Index(index_name))
+
+
+def warm_up(index_name=None, timeout=WARM_UP_TIMEOUT):
+    """
+    Open the connections of the shared clients ahead of the first request.
+
+    Sends one cheap request per service concurrently: the Azure OpenAI model list, the
+    Pinecone index list and, with `index_name`, the index stats. Failures are logged and
+    ignored, since a request will simply open its own connection. Returns the seconds
+    each probe took, or its error.
+    """
+    probes = {
+        "azure_openai": lambda: get_azure_openai_client().with_options(timeout=timeout, max_retries=0).models.list(),
+        "pinecone": lambda: get_pinecone_client().list_indexes()
+    }
+    if index_name:
+        probes["pinecone_index"] = lambda: get_pinecone_index(index_name).describe_index_stats()
+
+    def run(probe):
+        start = time.perf_counter()
+        try:
+            probe()
+        except Exception as error:
+            return error
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=len(probes), thread_name_prefix="warm-up") as executor:
+        results = dict(zip(probes, executor.map(run, probes.values())))
+    for name, result in results.items():
+        if isinstance(result, Exception):
+            logger.warning("Warm-up of %s failed: %s", name, result)
+    return results
@@ -0,0 +1,159 @@
+"""
+Small-to-big retrieval: grow each retrieved chunk with its neighbours.
+
+Chunk ids are deterministic (`{file_name}_chunk_{idx}`), so the neighbours of a hit are
+known without another vector query. They are fetched in one batched call, kept only
+when they belong to the same top-level (H1) section as the hit and fit the token budget,
+and merged
+with the hit into a single passage with the repeated heading path (or the overlap left
+by the older character-based chunker) removed.
+"""
+import re
+
+from token_counter import count_tokens
+
+# Neighbours considered on each side of a hit
+NEIGHBOUR_WINDOW = 1
+# Total tokens of retrieved context that expansion may grow to
+EXPANSION_TOKEN_BUDGET = 1500
+# Shortest overlap between consecutive chunks that is treated as duplicated text
+MIN_OVERLAP_CHARS = 20
+
+_CHUNK_ID = re.compile(r"^(.*)_chunk_(\d+)$")
+
+
+def parse_chunk_id(chunk_id):
+    """Split `{file_name}_chunk_{idx}` into (file_name, idx); None for other ids."""
+    match = _CHUNK_ID.match(chunk_id)
+    if not match:
+        return None
+    return match.group(1), int(match.group(2))
+
+
+def parent_section(chunk):
+    """Top-level heading of a chunk: the H1 of its heading path (or of its section name)."""
+    path = chunk.get("heading_path") or (chunk.get("section") or "").split(" > ")
+    return tuple(path[:1])
+
+
+def neighbour_ids(chunks, window=NEIGHBOUR_WINDOW, token_budget=None):
+    """
+    Ids of the chunks within `window` positions of each hit, excluding the hits.
+
+    Positions outside the run of chunks under the hit's H1 (`parent_first`/`parent_last`,
+    recorded at ingestion) are skipped, and nothing is returned when the hits already use
+    `token_budget`: no neighbour could be merged, so there is nothing worth fetching.
+    """
+    if token_budget is not None and sum(_tokens(chunk) for chunk in chunks) >= token_budget:
+        return []
+    hit_ids = {chunk["id"] for chunk in chunks}
+    ids = []
+    for chunk in chunks:
+        parsed = parse_chunk_id(chunk["id"])
+        if parsed is None:
+            continue
+        prefix, idx = parsed
+        first = chunk.get("parent_first")
+        last = chunk.get("parent_last")
+        for distance in range(1, window + 1):
+            for neighbour in (idx - distance, idx + distance):
+                if neighbour < 0 or (first is not None and neighbour < first) or (last is not None and neighbour > last):
+                    continue
+                neighbour_id = f"{prefix}_chunk_{neighbour}"
+                if neighbour_id not in hit_ids and neighbour_id not in ids:
+                    ids.append(neighbour_id)
+    return ids
+
+
+def _heading_prefix(text):
+    lines = []
+    for line in text.split("\n"):
+        if not line.startswith("#"):
+            break
+        lines.append(line)
+    return lines
+
+
+def merge_texts(previous, following):
+    """Join two consecutive chunks, dropping the heading path and any text they share."""
+    shared_headings = _heading_prefix(previous)
+    following_headings = _heading_prefix(following)
+    if shared_headings and following_headings == shared_headings:
+        following = following[len("\n".join(following_headings)):].lstrip("\n")
+    # Character-based chunks repeat the end of the previous chunk at their start
+    probe = following[:MIN_OVERLAP_CHARS]
+    if len(probe) == MIN_OVERLAP_CHARS:
+        start = previous.find(probe)
+        while start != -1:
+            if following.startswith(previous[start:]):
+                following = following[len(previous) - start:].lstrip()
+                break
+            start = previous.find(probe, start + 1)
+    return f"{previous}\n\n{following}" if following else previous
+
+
+def _tokens(chunk):
+    if chunk.get("tokens") is None:
+        chunk["tokens"] = count_tokens(chunk["text"])
+    return chunk["tokens"]
+
+
+def expand_chunks(chunks, fetched, window=NEIGHBOUR_WINDOW, token_budget=EXPANSION_TOKEN_BUDGET):
+    """
+    Merge each hit with the fetched neighbours under the same H1, within `token_budget`.
+
+    `chunks` are the hits, best first; `fetched` maps neighbour ids to chunk dicts. The
+    hits are always kept; neighbours are added closest first, hits in score order, as
+    long as the total stays within the budget and no gap is left between a hit and them.
+    Runs of consecutive chunks become one passage carrying every id in `ids`, ordered
+    by the best score of the run.
+    """
+    selected = {}
+    for chunk in chunks:
+        key = parse_chunk_id(chunk["id"]) or (chunk["id"], None)
+        if key not in selected:
+            selected[key] = dict(chunk)
+    used = sum(_tokens(chunk) for chunk in selected.values())
+
+    for distance in range(1, window + 1):
+        for chunk in chunks:
+            parsed = parse_chunk_id(chunk["id"])
+            if parsed is None:
+                continue
+            prefix, idx = parsed
+            for step in (-1, 1):
+                key = (prefix, idx + step * distance)
+                if key in selected or (prefix, idx + step * (distance - 1)) not in selected:
+                    continue
+                neighbour = fetched.get(f"{prefix}_chunk_{key[1]}")
+                if neighbour is None or parent_section(neighbour) != parent_section(chunk):
+                    continue
+                tokens = _tokens(neighbour)
+                if used + tokens > token_budget:
+                    continue
+                selected[key] = dict(neighbour, score=chunk.get("score"))
+                used += tokens
+
+    # Merge runs of consecutive chunks of the same file
+    passages = []
+    for key in sorted(selected, key=lambda key: (key[0], -1 if key[1] is None else key[1])):
+        chunk = selected[key]
+        previous = passages[-1] if passages else None
+        if (
+            previous is not None and key[1] is not None and previous["_key"][0] == key[0]
+            and previous["_key"][1] == key[1] - 1 and parent_section(previous) == parent_section(chunk)
+        ):
+            previous["text"] = merge_texts(previous["text"], chunk["text"])
+            previous["ids"].append(chunk["id"])
+            scores = [score for score in (previous.get("score"), chunk.get("score")) if score is not None]
+            previous["score"] = max(scores, default=None)
+            previous["_key"] = key
+            continue
+        passage = dict(chunk, ids=[chunk["id"]], _key=key)
+        passages.append(passage)
+
+    for passage in passages:
+        del passage["_key"]
+        passage["tokens"] = count_tokens(passage["text"])
+    passages.sort(key=lambda passage: -(passage.get("score") or 0.0))
+    return passages
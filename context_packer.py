@@ -0,0 +1,172 @@
+"""
+Token-budgeted packing of the prompt sent to GPT.
+
+The system prompt and the user query are always kept whole. Recent history is kept
+newest first up to its own share of the budget, the last exchange truncated if it does
+not fit whole, and the retrieved chunks fill what is left: best score first, paragraphs
+already present in a better chunk removed, the last chunk that does not fit truncated
+(if enough room is left) and the rest dropped.
+"""
+from token_counter import TOKENS_PER_MESSAGE, count_tokens, truncate_to_tokens
+
+# Input tokens of a whole prompt (system prompt, history, context and query)
+MAX_INPUT_TOKENS = 4000
+# Largest share of the budget that the conversation history may use
+HISTORY_SHARE = 0.25
+# A chunk is only truncated to fit if at least this many tokens of it can be kept
+MIN_TRUNCATED_TOKENS = 60
+# Separator between chunks in the context message
+CHUNK_SEPARATOR = "\n\n---\n\n"
+
+
+def format_chunk(chunk):
+    """Context text of one chunk, with its section and file."""
+    return f"Section: {chunk['section']}\nFile: {chunk['file']}\n\n{chunk['text']}"
+
+
+def chunk_tokens(chunk):
+    """Tokens of a chunk's text, counted once and kept on the chunk."""
+    if chunk.get("tokens") is None:
+        chunk["tokens"] = count_tokens(chunk["text"])
+    return chunk["tokens"]
+
+
+def _message_tokens(message):
+    return TOKENS_PER_MESSAGE + count_tokens(message.get("content") or "")
+
+
+def fit_messages(turns, budget):
+    """
+    Messages truncated to share `budget` if they do not fit whole: the smaller ones are
+    kept whole and the larger ones cut to the room left. Returns (messages, tokens).
+    """
+    shares = {}
+    room = budget
+    for left, position in enumerate(sorted(range(len(turns)), key=lambda i: _message_tokens(turns[i])), start=1):
+        share = min(_message_tokens(turns[position]), room // (len(turns) - left + 1))
+        shares[position] = share
+        room -= share
+    fitted = []
+    for position, message in enumerate(turns):
+        if shares[position] < _message_tokens(message):
+            content = truncate_to_tokens(message.get("content") or "", max(shares[position] - TOKENS_PER_MESSAGE, 1))
+            message = dict(message, content=content)
+        fitted.append(message)
+    return fitted, sum(_message_tokens(message) for message in fitted)
+
+
+def trim_history(history, budget):
+    """
+    Keep the most recent messages whose tokens fit in `budget` (oldest are dropped first).
+
+    The last user turn and the answer to it are always kept, truncated when they do not
+    fit whole. System messages (the running conversation summary) are kept ahead of the turns.
+    """
+    summaries = [message for message in history if message.get("role") == "system"]
+    turns = [message for message in history if message.get("role") != "system"]
+    last_user = max((i for i, message in enumerate(turns) if message.get("role") == "user"), default=0)
+    kept = []
+    used = 0
+    for message in summaries:
+        tokens = _message_tokens(message)
+        if used + tokens <= budget:
+            kept.append(message)
+            used += tokens
+    latest, latest_tokens = fit_messages(turns[last_user:], budget - used)
+    used += latest_tokens
+    older = []
+    for message in reversed(turns[:last_user]):
+        tokens = _message_tokens(message)
+        if used + tokens > budget:
+            break
+        older.insert(0, message)
+        used += tokens
+    return kept + older + latest, used
+
+
+def _deduplicate(chunks):
+    """Drop paragraphs (other than headings) already present in a better-ranked chunk."""
+    seen = set()
+    unique = []
+    for chunk in chunks:
+        paragraphs = []
+        new_content = False
+        for paragraph in chunk["text"].split("\n\n"):
+            key = " ".join(paragraph.split())
+            if paragraph.lstrip().startswith("#"):
+                paragraphs.append(paragraph)
+            elif key and key not in seen:
+                seen.add(key)
+                paragraphs.append(paragraph)
+                new_content = True
+        if not new_content:
+            continue
+        text = "\n\n".join(paragraphs)
+        unique.append(chunk if text == chunk["text"] else dict(chunk, text=text, tokens=None))
+    return unique
+
+
+def pack_chunks(chunks, budget):
+    """
+    Select and order chunks so the formatted context fits in `budget` tokens.
+
+    Returns (packed_chunks, report) where report counts the chunks kept, truncated,
+    dropped and deduplicated, and the context tokens used.
+    """
+    ranked = sorted(chunks, key=lambda chunk: -(chunk.get("score") or 0.0))
+    unique = _deduplicate(ranked)
+    packed = []
+    used = 0
+    truncated = 0
+    separator = count_tokens(CHUNK_SEPARATOR)
+    for position, chunk in enumerate(unique):
+        overhead = count_tokens(format_chunk(dict(chunk, text=""))) + (separator if packed else 0)
+        tokens = overhead + chunk_tokens(chunk)
+        if used + tokens <= budget:
+            packed.append(chunk)
+            used += tokens
+            continue
+        room = budget - used - overhead
+        if room >= MIN_TRUNCATED_TOKENS:
+            text = truncate_to_tokens(chunk["text"], room)
+            packed.append(dict(chunk, text=text, tokens=count_tokens(text), truncated=True))
+            used += overhead + packed[-1]["tokens"]
+            truncated += 1
+        dropped = len(unique) - position - (1 if room >= MIN_TRUNCATED_TOKENS else 0)
+        break
+    else:
+        dropped = 0
+    report = {
+        "chunks": len(packed),
+        "truncated_chunks": truncated,
+        "dropped_chunks": dropped,
+        "duplicate_chunks": len(ranked) - len(unique),
+        "context_tokens": used
+    }
+    return packed, report
+
+
+def pack_prompt(system_prompt, history, chunks, user_query, max_input_tokens=MAX_INPUT_TOKENS):
+    """
+    Fit history and chunks around the system prompt and query within `max_input_tokens`.
+
+    Returns (history, context, packed_chunks, report), the report counting the tokens used
+    by each part of the prompt.
+    """
+    system_tokens = TOKENS_PER_MESSAGE + count_tokens(system_prompt)
+    query_tokens = TOKENS_PER_MESSAGE + count_tokens(user_query)
+    # "Context:\n" message header and the reply priming tokens
+    overhead = TOKENS_PER_MESSAGE + count_tokens("Context:\n") + 2
+    available = max(max_input_tokens - system_tokens - query_tokens - overhead, 0)
+    history, history_tokens = trim_history(history, int(available * HISTORY_SHARE))
+    packed, report = pack_chunks(chunks, available - history_tokens)
+    report.update(
+        system_tokens=system_tokens,
+        history_tokens=history_tokens,
+        history_messages=len(history),
+        query_tokens=query_tokens,
+        budget=max_input_tokens,
+        total_tokens=system_tokens + history_tokens + report["context_tokens"] + query_tokens + overhead
+    )
+    context = CHUNK_SEPARATOR.join(format_chunk(chunk) for chunk in packed)
+    return history, context, packed, report
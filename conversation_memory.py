@@ -0,0 +1,153 @@
+"""
+Rolling summary memory for long threads.
+
+The most recent turns are sent verbatim, up to a token cap; older turns are folded into
+a short running summary. The summary is updated in a background thread after an answer
+has been returned, so it never adds latency to a request: a turn that arrives before the
+update finishes uses the previous summary plus the turns it does not cover yet.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from context_packer import fit_messages
+from rate_limiter import PRIORITY_BACKGROUND, estimate_tokens
+from token_counter import TOKENS_PER_MESSAGE, count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Tokens of recent messages sent verbatim (with the summary, this stays within the
+# history share of the prompt budget, see context_packer.py)
+RECENT_HISTORY_TOKENS = 600
+# Length the running summary is asked to stay under
+SUMMARY_MAX_WORDS = 150
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an assistant that "
+    "answers questions about Tucuvi's data knowledge base. Update the summary with the new "
+    "turns. Keep the questions asked, facts, names, decisions and anything left open; drop "
+    "greetings and repetition. Answer with the summary only, in at most {max_words} words, "
+    "in the language of the conversation."
+)
+
+
+class ConversationMemory:
+    """Running summary of one thread: the text and how many messages it covers."""
+
+    def __init__(self):
+        self.summary = ""
+        self.covered = 0
+        self.pending = None
+        self.lock = threading.Lock()
+
+
+def recent_start(messages, token_cap=RECENT_HISTORY_TOKENS):
+    """
+    Index of the first message of the most recent turns that fit in `token_cap`, never
+    after the last user turn (the question and its answer are kept together).
+    """
+    used = 0
+    start = len(messages)
+    for index in range(len(messages) - 1, -1, -1):
+        used += TOKENS_PER_MESSAGE + count_tokens(messages[index].get("content") or "")
+        if used > token_cap and start < len(messages):
+            break
+        start = index
+    last_user = max((i for i, message in enumerate(messages) if message.get("role") == "user"), default=start)
+    return min(start, last_user)
+
+
+def _dialogue(messages):
+    return [message for message in messages if message.get("role") in ("user", "assistant")]
+
+
+def history_with_summary(messages, memory, token_cap=RECENT_HISTORY_TOKENS):
+    """
+    History to send with a new question: the running summary, then the messages it does
+    not cover (the recent ones, truncated to `token_cap` when a long answer exceeds it,
+    plus any not summarized yet).
+    """
+    messages = _dialogue(messages)
+    with memory.lock:
+        summary, covered = memory.summary, memory.covered
+    recent = recent_start(messages, token_cap)
+    start = min(covered, recent)
+    history = []
+    if summary and covered:
+        history.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+    recent_messages, _ = fit_messages(messages[recent:], token_cap)
+    return history + messages[start:recent] + recent_messages
+
+
+class ConversationSummarizer:
+    """Updates ConversationMemory objects in the background with the chat deployment."""
+
+    def __init__(self, llm_client, deployment, token_cap=RECENT_HISTORY_TOKENS,
+                 max_words=SUMMARY_MAX_WORDS, max_workers=2, scheduler=None):
+        self._llm_client = llm_client
+        self._deployment = deployment
+        # Summaries wait behind the users' questions for the deployment's quota
+        self._scheduler = scheduler
+        self.token_cap = token_cap
+        self._max_words = max_words
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="summarizer")
+
+    def history(self, messages, memory):
+        return history_with_summary(messages, memory, self.token_cap)
+
+    def schedule(self, messages, memory):
+        """
+        Fold the turns that left the recent window into the summary, off the request path.
+
+        Does nothing while an update for this thread is still running; the next call picks
+        up everything not covered yet. Returns the future of the update, if one started.
+        """
+        messages = _dialogue(messages)
+        end = recent_start(messages, self.token_cap)
+        with memory.lock:
+            if memory.pending is not None or end <= memory.covered:
+                return None
+            turns = messages[memory.covered:end]
+            summary = memory.summary
+            memory.pending = self._executor.submit(self._update, memory, summary, turns, end)
+            return memory.pending
+
+    def summarize(self, summary, turns):
+        """New running summary from the previous one and the turns to add."""
+        transcript = "\n\n".join(f"{message['role'].capitalize()}: {message['content']}" for message in turns)
+        messages = [
+            {"role": "system", "content": SUMMARY_PROMPT.format(max_words=self._max_words)},
+            {"role": "user", "content": f"Current summary:\n{summary or '(empty)'}\n\nNew turns:\n{transcript}"}
+        ]
+        reservation = None
+        if self._scheduler is not None:
+            # Shed summaries leave the turns verbatim until the next update (see _update)
+            reservation = self._scheduler.acquire(estimate_tokens(messages), priority=PRIORITY_BACKGROUND)
+        response = None
+        try:
+            response = self._llm_client.chat.completions.create(
+                model=self._deployment,
+                messages=messages,
+                temperature=0
+            )
+        finally:
+            if reservation is not None and response is None:
+                # A failed update generated nothing: give its estimate back
+                reservation.settle(0)
+        if reservation is not None:
+            usage = getattr(response, "usage", None)
+            reservation.settle(usage.total_tokens if usage is not None else None)
+        return (response.choices[0].message.content or "").strip()
+
+    def _update(self, memory, summary, turns, end):
+        try:
+            new_summary = self.summarize(summary, turns)
+            with memory.lock:
+                memory.summary = new_summary
+                memory.covered = end
+        except Exception:
+            # The turns stay verbatim in the history and are retried on the next update
+            logger.exception("Conversation summary update failed")
+        finally:
+            with memory.lock:
+                memory.pending = None
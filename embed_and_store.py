@@ -1,15 +1,36 @@
-from pinecone import Pinecone, ServerlessSpec
-import re
+from pinecone import ServerlessSpec
 from dotenv import load_dotenv
+import argparse
+import hashlib
+import json
 import os
 import time
 
+from batching import call_with_retries, make_batches, run_batches
+from clients import get_pinecone_client
+from embedding_cache import EmbeddingCache
+from lexical_index import LexicalIndexStore
+from markdown_chunker import MAX_CHUNK_TOKENS, chunk_markdown
+from token_counter import require_tokenizer
+from vector_store import (
+    LAYOUT_PER_FILE,
+    LAYOUT_SHARED,
+    PineconeVectorStore,
+    base_namespace,
+    file_namespace,
+    get_namespace_alias,
+    get_vector_store,
+    is_version_of,
+    set_namespace_alias,
+    versioned_namespace
+)
+
 # Load environment variables
 load_dotenv()
 pinecone_api_key = os.getenv("PINECONE_API_KEY")
 
 # Initialize Pinecone client
-pc = Pinecone(api_key=pinecone_api_key)
+pc = get_pinecone_client(pinecone_api_key)
 
 # Index configuration
 INDEX_NAME = "knowledge-base"
@@ -17,6 +38,32 @@ NAMESPACE = "markdown_chunks"
 DIMENSION = 1024  # Dimension for multilingual-e5-large
 PINECONE_CLOUD = "aws"  # Replace with your cloud provider
 PINECONE_REGION = "us-east-1"  # Replace with your region
+EMBEDDING_MODEL = "multilingual-e5-large"
+
+# Record of what is currently indexed, used for incremental ingestion
+MANIFEST_PATH = os.getenv("INGESTION_MANIFEST_PATH", "ingestion_manifest.json")
+# Maximum ids per fetch/delete request
+ID_BATCH_SIZE = 1000
+# Inputs per embedding request (Pinecone's limit for multilingual-e5-large is 96)
+EMBED_BATCH_SIZE = 96
+# Characters of text per embedding request, to keep requests small
+EMBED_BATCH_MAX_CHARS = 100_000
+# Vectors per upsert request, and Pinecone's 2 MB request size limit
+UPSERT_BATCH_SIZE = 100
+UPSERT_BATCH_MAX_BYTES = 2 * 1024 * 1024
+# Content-addressed store of passage embeddings, so repeated runs only embed new text
+EMBEDDING_STORE_PATH = os.getenv("INGESTION_EMBEDDING_STORE_PATH", "ingestion_embeddings.sqlite")
+# Embeddings of that store also kept in memory (the rest are read back from SQLite)
+EMBEDDING_STORE_MEMORY_ENTRIES = int(os.getenv("INGESTION_EMBEDDING_STORE_MEMORY", "1000"))
+# Keyword (BM25) indexes of the ingested namespaces, read by the chat for hybrid search
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", "lexical_index")
+# Attempts (and seconds between them) to see a freshly built namespace complete before switching to it
+VALIDATION_ATTEMPTS = 10
+VALIDATION_DELAY = 3
+# Embedding/upsert batches in flight at once
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))
+# Retries per failed embedding or upsert request
+BATCH_RETRIES = 3
 
 
 def ensure_index_exists(index_name, dimension, cloud, region):
@@ -35,101 +82,449 @@ def ensure_index_exists(index_name, dimension, cloud, region):
         print(f"Index '{index_name}' already exists. Skipping creation.")
 
 
-def delete_namespace_vectors(index_name, namespace):
+def delete_namespace_vectors(index_name, namespace, store=None):
     """Deletes all vectors in the specified namespace."""
-    index = pc.Index(index_name)
+    store = store or get_vector_store(pinecone_client=pc, index_name=index_name)
     print(f"Deleting all vectors in namespace '{namespace}'...")
-    index.delete(delete_all=True, namespace=namespace)
+    store.delete(namespace=namespace, delete_all=True)
     print(f"Namespace '{namespace}' cleared.")
 
 
-def split_markdown_into_chunks_with_metadata(file_path, chunk_size=2800, overlap=200):
-    """Splits markdown content into chunks with metadata, adding overlap only for long H1 sections."""
-    with open(file_path, "r", encoding="utf-8") as file:
-        markdown_content = file.read()
-
-    # Split content by H1 headings
-    sections = re.split(r'(?=\n# )', markdown_content)
-    processed_chunks = []
-
-    for section in sections:
-        section = section.strip()
-        if not section:
-            continue
+def split_markdown_into_chunks_with_metadata(file_path, max_tokens=MAX_CHUNK_TOKENS):
+    """
+    Streams markdown content into token-bounded chunks along its H1/H2/H3 heading tree.
 
-        # Extract the H1 title as metadata
-        section_title = section.split("\n")[0].strip()  # The first line is the H1 title
+    Tables and code blocks are kept intact, and each chunk records its heading path.
+    """
+    return chunk_markdown(file_path, max_tokens=max_tokens)
 
-        # If section is small enough, add it as is
-        if len(section) <= chunk_size:
-            processed_chunks.append({"text": section, "metadata": {"section": section_title, "file": file_path}})
-        else:
-            # Split large sections with overlap
-            start = 0
-            while start < len(section):
-                end = min(start + chunk_size, len(section))
-                chunk = section[start:end]
-
-                # Avoid cutting mid-word
-                if end < len(section):
-                    last_space = chunk.rfind(" ")
-                    if last_space != -1:
-                        end = start + last_space
-
-                processed_chunks.append({
-                    "text": section[start:end].strip(),
-                    "metadata": {"section": section_title, "file": file_path}
-                })
-                start = end - overlap if end < len(section) else len(section)
-
-    return processed_chunks
-
-def embed_and_store_with_pinecone(file_path, index_name, namespace):
-    """Embeds markdown chunks and stores them in Pinecone."""
-    index = pc.Index(index_name)
+def embed_passages(texts):
+    """Embeds passages with Pinecone's inference API."""
+    embeddings = pc.inference.embed(
+        model=EMBEDDING_MODEL,
+        inputs=texts,
+        parameters={"input_type": "passage"}
+    )
+    return [embedding["values"] for embedding in embeddings]
 
+def prepare_chunks(file_path):
+    """Chunks a markdown file into records with their vector id, metadata and content hash."""
     # Extract the file name from the file path
     file_name = file_path.split("/")[-1]
 
-    # Split markdown content with metadata
-    chunks_with_metadata = split_markdown_into_chunks_with_metadata(file_path)
-    print(f"Processing {len(chunks_with_metadata)} chunks...")
-
-    # Generate embeddings using Pinecone's inference API
-    embeddings = pc.inference.embed(
-        model="multilingual-e5-large",
-        inputs=[chunk["text"] for chunk in chunks_with_metadata],
-        parameters={"input_type": "passage"}
-    )
+    chunks = list(split_markdown_into_chunks_with_metadata(file_path))
+    # First and last position of each run of chunks under the same H1, so the chat only
+    # fetches neighbours it can merge (see context_expansion.neighbour_ids)
+    runs = []
+    for idx, chunk in enumerate(chunks):
+        parent = chunk["metadata"]["heading_path"][:1]
+        if runs and runs[-1][0] == parent:
+            runs[-1][2] = idx
+        else:
+            runs.append([parent, idx, idx])
+    parent_ranges = [(first, last) for _, first, last in runs for _ in range(first, last + 1)]
 
-    # Prepare vectors for Pinecone and ensure 'text' is part of the metadata
-    vectors = []
-    for idx, (chunk, embedding) in enumerate(zip(chunks_with_metadata, embeddings)):
+    records = []
+    for idx, chunk in enumerate(chunks):
         metadata = chunk["metadata"]
         metadata["text"] = chunk["text"]  # Explicitly add text to metadata
         metadata["file"] = file_name  # Add the file name to metadata
-        vectors.append({
+        metadata["parent_first"], metadata["parent_last"] = parent_ranges[idx]
+        records.append({
             "id": f"{file_name}_chunk_{idx}",  # Make ID unique by including the file name
-            "values": embedding["values"],
-            "metadata": metadata
+            "text": chunk["text"],
+            "metadata": metadata,
+            "hash": chunk_hash(metadata)
         })
+    return records
+
+def chunk_hash(metadata):
+    """
+    Hash of what a chunk's vector depends on: embedding model, text, file and heading path.
+
+    Its position under its H1 (`parent_first`/`parent_last`) is left out, so an edit that
+    adds or removes chunks does not make its unchanged siblings look new.
+    """
+    payload = json.dumps(
+        [EMBEDDING_MODEL, metadata["text"], metadata["file"], metadata["heading_path"]], ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _position(metadata):
+    return [metadata["parent_first"], metadata["parent_last"]]
+
+def _batched(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def open_embedding_store(path=EMBEDDING_STORE_PATH):
+    """Opens the on-disk passage embedding store (no expiry; only a small memory tier)."""
+    return EmbeddingCache(max_entries=EMBEDDING_STORE_MEMORY_ENTRIES, ttl_seconds=None, db_path=path)
+
+def cached_embedder(embed_texts, embedding_store):
+    """Wraps `embed_texts` so only texts missing from `embedding_store` reach the embed API."""
+    def embed(texts):
+        return embedding_store.get_many_or_compute(texts, EMBEDDING_MODEL, "passage", embed_texts)
+    return embed
+
+def _vector_size(vector):
+    """Approximate request payload of a vector in bytes (values serialized as JSON floats)."""
+    metadata = json.dumps(vector["metadata"], ensure_ascii=False).encode("utf-8")
+    return len(vector["id"]) + len(metadata) + 20 * len(vector["values"]) + 64
+
+def upsert_vectors(store, vectors, namespace):
+    """Upserts vectors in count- and size-bounded requests, retrying each failed request."""
+    for batch in make_batches(vectors, UPSERT_BATCH_SIZE, UPSERT_BATCH_MAX_BYTES, _vector_size):
+        call_with_retries(store.upsert, vectors=batch, namespace=namespace, retries=BATCH_RETRIES)
+
+def embed_and_upsert(records, store, namespace, embed_texts, workers=INGEST_WORKERS):
+    """
+    Embeds records and upserts their vectors, in batches on a bounded worker pool.
 
-    # Upsert vectors into Pinecone
-    print(f"Upserting {len(vectors)} embeddings into Pinecone (namespace: {namespace})...")
-    index.upsert(vectors=vectors, namespace=namespace)
-    print("Chunks embedded and stored successfully in Pinecone.")
+    Each worker embeds one batch and upserts it straight away, so upserts overlap with
+    the embedding of the next batches. A failed request is retried on its own with
+    backoff; batches that still fail are reported together in a BatchError.
+    """
+    def process(batch):
+        embeddings = call_with_retries(embed_texts, [record["text"] for record in batch], retries=BATCH_RETRIES)
+        if len(embeddings) != len(batch):
+            raise ValueError(f"Expected {len(batch)} embeddings, got {len(embeddings)}")
+        upsert_vectors(store, [
+            {"id": record["id"], "values": embedding, "metadata": record["metadata"]}
+            for record, embedding in zip(batch, embeddings)
+        ], namespace)
+        return len(batch)
+
+    batches = make_batches(records, EMBED_BATCH_SIZE, EMBED_BATCH_MAX_CHARS, lambda record: len(record["text"]))
+    return sum(run_batches(process, batches, max_workers=workers))
+
+def _report_throughput(chunks, start):
+    seconds = time.perf_counter() - start
+    rate = chunks / seconds if seconds else 0.0
+    print(f"Processed {chunks} chunks in {seconds:.2f}s ({rate:.1f} chunks/s).")
+    return seconds, rate
+
+def load_manifest(path=MANIFEST_PATH):
+    """Loads the ingestion manifest: {"<index>/<namespace>": {vector_id: {"hash", "file", "position"}}}."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    """Writes the manifest atomically, so an interrupted run never leaves it half written."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def embed_and_store_with_pinecone(file_path, index_name, namespace, store=None, embed_texts=None,
+                                  workers=INGEST_WORKERS, embedding_store=None):
+    """
+    Embeds markdown chunks and stores them in the configured vector store (Pinecone by default).
+
+    When an `embedding_store` is given, text embedded by a previous run is not embedded again.
+    """
+    store = store or get_vector_store(pinecone_client=pc, index_name=index_name)
+    embed_texts = embed_texts or embed_passages
+    if embedding_store is not None:
+        embed_texts = cached_embedder(embed_texts, embedding_store)
+    start = time.perf_counter()
+
+    # Split markdown content with metadata
+    records = prepare_chunks(file_path)
+    print(f"Processing {len(records)} chunks...")
+
+    # Embed (Pinecone's inference API by default) and upsert in parallel batches;
+    # 'text' is part of the metadata
+    print(f"Embedding and upserting into the vector store (namespace: {namespace})...")
+    embed_and_upsert(records, store, namespace, embed_texts, workers=workers)
+    _report_throughput(len(records), start)
+    print("Chunks embedded and stored successfully.")
+
+def _group_by_namespace(items, namespace_of):
+    groups = {}
+    for item in items:
+        groups.setdefault(namespace_of(item), []).append(item)
+    return groups.items()
+
+def target_namespace(namespace, file_name, per_file):
+    """Namespace the chunks of `file_name` are written to."""
+    return file_namespace(namespace, file_name) if per_file else namespace
+
+def sync_files_incrementally(file_paths, index_name, namespace, store=None, embed_texts=None,
+                             manifest_path=MANIFEST_PATH, full=False, workers=INGEST_WORKERS,
+                             embedding_store=None, lexical_store=None, per_file=False):
+    """
+    Brings the namespace in line with the given files, touching only what changed.
+
+    Each chunk's content hash is compared with the manifest of what is currently indexed:
+    unchanged chunks are skipped, chunks whose content is already indexed under another id
+    (e.g. shifted by an edit earlier in the section), or under the same id with a new
+    position under its H1, are upserted with the stored vector and their new metadata, and
+    only genuinely new text is embedded. Vectors are upserted before stale ids are deleted, so
+    queries never see an empty or partial namespace. `full=True` re-embeds every chunk.
+
+    With an `embedding_store`, chunks to embed are first looked up by content hash there,
+    so re-chunking or a full reindex only pays for text that was never embedded before.
+    With a `lexical_store`, the keyword index of the namespace is rewritten from the chunks.
+    With `per_file`, each file's chunks go to its own namespace (see vector_store.file_namespace);
+    the manifest and the keyword index stay keyed by `namespace`.
+    """
+    store = store or get_vector_store(pinecone_client=pc, index_name=index_name)
+    embed_texts = embed_texts or embed_passages
+    if embedding_store is not None:
+        embed_texts = cached_embedder(embed_texts, embedding_store)
+        hits_before = embedding_store.stats()["hits"]
+    start = time.perf_counter()
+    manifest = load_manifest(manifest_path)
+    manifest_key = f"{index_name}/{namespace}"
+    indexed = manifest.get(manifest_key, {})
+
+    records = [record for file_path in file_paths for record in prepare_chunks(file_path)]
+    ids_by_hash = {entry["hash"]: vector_id for vector_id, entry in indexed.items()}
+
+    # record id -> id of the stored vector it reuses
+    unchanged, to_reuse, to_embed, source_ids = [], [], [], {}
+    for record in records:
+        entry = indexed.get(record["id"])
+        if not full and entry is not None and entry["hash"] == record["hash"]:
+            if entry.get("position") == _position(record["metadata"]):
+                unchanged.append(record)
+            else:
+                # Same vector, moved within its H1: only the metadata is rewritten
+                to_reuse.append(record)
+                source_ids[record["id"]] = record["id"]
+        elif not full and record["hash"] in ids_by_hash:
+            to_reuse.append(record)
+            source_ids[record["id"]] = ids_by_hash[record["hash"]]
+        else:
+            to_embed.append(record)
+
+    def namespace_of_record(record):
+        return target_namespace(namespace, record["metadata"]["file"], per_file)
+
+    def namespace_of_id(vector_id):
+        return target_namespace(namespace, indexed[vector_id]["file"], per_file)
+
+    reused = []
+
+    # Reuse vectors already stored, under another id or with outdated metadata
+    for source_namespace, group in _group_by_namespace(
+        to_reuse, lambda record: namespace_of_id(source_ids[record["id"]])
+    ):
+        for batch in _batched(group, ID_BATCH_SIZE):
+            fetched = store.fetch([source_ids[record["id"]] for record in batch], source_namespace)["vectors"]
+            for record in batch:
+                stored = fetched.get(source_ids[record["id"]])
+                if stored is None:
+                    to_embed.append(record)  # The manifest was out of date; embed it again
+                else:
+                    reused.append({"id": record["id"], "values": stored["values"], "metadata": record["metadata"]})
+
+    for target, group in _group_by_namespace(reused, namespace_of_record):
+        print(f"Upserting {len(group)} reused vectors into the vector store (namespace: {target})...")
+        upsert_vectors(store, group, target)
+
+    # Embed and upsert new or changed chunks
+    for target, group in _group_by_namespace(to_embed, namespace_of_record):
+        print(f"Embedding {len(group)} new or changed chunks (namespace: {target})...")
+        embed_and_upsert(group, store, target, embed_texts, workers=workers)
+
+    # Delete ids that no longer exist, only after the new vectors are in place
+    current_ids = {record["id"] for record in records}
+    stale_ids = sorted(vector_id for vector_id in indexed if vector_id not in current_ids)
+    for target, group in _group_by_namespace(stale_ids, namespace_of_id):
+        for batch in _batched(group, ID_BATCH_SIZE):
+            store.delete(namespace=target, ids=batch)
+    if stale_ids:
+        print(f"Deleted {len(stale_ids)} stale vectors.")
+
+    manifest[manifest_key] = {
+        record["id"]: {
+            "hash": record["hash"],
+            "file": record["metadata"]["file"],
+            "position": _position(record["metadata"])
+        }
+        for record in records
+    }
+    save_manifest(manifest, manifest_path)
+    if lexical_store is not None:
+        lexical_store.save(namespace, records)
+
+    seconds, rate = _report_throughput(len(reused) + len(to_embed), start)
+    stats = {
+        "chunks": len(records),
+        "unchanged": len(unchanged),
+        "reused": len(reused),
+        "embedded": len(to_embed),
+        "deleted": len(stale_ids),
+        "seconds": round(seconds, 3),
+        "chunks_per_second": round(rate, 1)
+    }
+    if embedding_store is not None:
+        stats["embedding_store_hits"] = embedding_store.stats()["hits"] - hits_before
+    print(f"Incremental sync done: {stats}")
+    return stats
+
+def corpus_hash(records):
+    """Hash of every chunk id and content hash: the version of the corpus."""
+    digest = hashlib.sha256()
+    for record in sorted(records, key=lambda record: record["id"]):
+        digest.update(f"{record['id']}\x1f{record['hash']}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+def validate_namespace(store, namespace, records, attempts=VALIDATION_ATTEMPTS, delay=VALIDATION_DELAY,
+                       per_file=False):
+    """
+    Checks that every chunk is stored in `namespace` (or its file's namespace, with
+    `per_file`) with its current metadata.
+
+    Pinecone is eventually consistent, so a freshly written namespace is checked a few
+    times before giving up. Raises RuntimeError if it is still incomplete.
+    """
+    for attempt in range(attempts):
+        missing = 0
+        for target, group in _group_by_namespace(
+            records, lambda record: target_namespace(namespace, record["metadata"]["file"], per_file)
+        ):
+            for batch in _batched(group, ID_BATCH_SIZE):
+                fetched = store.fetch([record["id"] for record in batch], target)["vectors"]
+                missing += sum(
+                    1 for record in batch
+                    if record["id"] not in fetched or fetched[record["id"]]["metadata"].get("text") != record["text"]
+                )
+        if not missing:
+            return
+        if attempt < attempts - 1:
+            print(f"Namespace '{namespace}' is missing {missing} chunks, checking again in {delay}s...")
+            time.sleep(delay)
+    raise RuntimeError(f"Namespace '{namespace}' is incomplete ({missing} chunks missing); alias not switched.")
+
+def collect_old_versions(store, alias, keep, index_name, manifest_path=MANIFEST_PATH, lexical_store=None):
+    """
+    Deletes versions of `alias` other than those in `keep` (with their per-file
+    namespaces), and their manifest entries and keyword indexes.
+    """
+    manifest = load_manifest(manifest_path)
+    deleted = []
+    for namespace in store.list_namespaces():
+        version = base_namespace(namespace)
+        if is_version_of(namespace, alias) and version not in keep:
+            print(f"Garbage-collecting namespace '{namespace}'...")
+            store.delete(namespace=namespace, delete_all=True)
+            manifest.pop(f"{index_name}/{version}", None)
+            if lexical_store is not None:
+                lexical_store.delete(version)
+            deleted.append(namespace)
+    if deleted:
+        save_manifest(manifest, manifest_path)
+    return deleted
+
+def publish_new_version(file_paths, index_name, alias, store=None, embed_texts=None,
+                        manifest_path=MANIFEST_PATH, full=False, workers=INGEST_WORKERS,
+                        embedding_store=None, lexical_store=None, layout=LAYOUT_PER_FILE):
+    """
+    Blue/green reindex: builds the corpus into a new versioned namespace, validates it,
+    then points `alias` (the namespace the chat queries) at it.
+
+    With the per-file `layout`, each knowledge file gets its own namespace under the
+    version, so the chat queries it directly instead of filtering a shared namespace.
+    The layout is recorded on the alias, so readers follow it on the switch; publishing
+    over a shared-layout version is how an existing index is migrated.
+
+    Readers keep querying the live version until the alias switch, a single upsert, so
+    they never see an empty or half-built index. The version just replaced is kept for
+    readers that resolved the alias moments ago (and for rollback); older versions are
+    garbage-collected. If the corpus has not changed, nothing is rebuilt unless `full`.
+    """
+    store = store or get_vector_store(pinecone_client=pc, index_name=index_name)
+    records = [record for file_path in file_paths for record in prepare_chunks(file_path)]
+    version_hash = corpus_hash(records)
+    live = get_namespace_alias(store, alias)
+    live_namespace = live["namespace"] if live else None
+    if live_namespace is None and alias in store.list_namespaces():
+        live_namespace = alias  # Data ingested before namespaces were versioned
+
+    live_layout = live.get("layout", LAYOUT_SHARED) if live else LAYOUT_SHARED
+    if live and live.get("corpus_hash") == version_hash and live_layout == layout and not full:
+        print(f"Corpus unchanged; '{alias}' already points at '{live_namespace}'.")
+        collect_old_versions(store, alias, {live_namespace, live.get("previous")}, index_name, manifest_path,
+                             lexical_store)
+        return live_namespace
+
+    namespace = versioned_namespace(alias, version_hash[:12])
+    if namespace == live_namespace:
+        # Forced rebuild of the live corpus: build it next to the live copy
+        namespace = versioned_namespace(alias, f"{version_hash[:12]}-{int(time.time())}")
+    print(f"Building '{namespace}' (live: {live_namespace or 'none'})...")
+    per_file = layout == LAYOUT_PER_FILE
+    sync_files_incrementally(file_paths, index_name, namespace, store=store, embed_texts=embed_texts,
+                             manifest_path=manifest_path, workers=workers, embedding_store=embedding_store,
+                             lexical_store=lexical_store, per_file=per_file)
+    validate_namespace(store, namespace, records, per_file=per_file)
+
+    set_namespace_alias(store, alias, namespace, DIMENSION, layout=layout, previous=live_namespace,
+                        corpus_hash=version_hash)
+    print(f"'{alias}' now points at '{namespace}'.")
+    collect_old_versions(store, alias, {namespace, live_namespace}, index_name, manifest_path, lexical_store)
+    return namespace
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Embed the knowledge base markdown files into the vector store.")
+    parser.add_argument("--in-place", action="store_true",
+                        help="update the namespace in place instead of publishing a new version behind the alias")
+    parser.add_argument("--full", action="store_true",
+                        help="rebuild even if nothing changed (with --in-place: re-embed every chunk)")
+    parser.add_argument("--reset", action="store_true",
+                        help="with --in-place, wipe the namespace first (queries return nothing until it is rebuilt)")
+    parser.add_argument("--no-embedding-store", action="store_true",
+                        help="always call the embed API instead of reusing embeddings stored by earlier runs")
+    parser.add_argument("--layout", choices=[LAYOUT_PER_FILE, LAYOUT_SHARED], default=LAYOUT_PER_FILE,
+                        help="one namespace per knowledge file, or all files in one namespace (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS,
+                        help="embedding/upsert batches in flight at once (default: %(default)s)")
+    parser.add_argument("--allow-estimated-tokens", action="store_true",
+                        help="chunk with a character-based token estimate when the tokenizer cannot be loaded")
+    return parser.parse_args()
 
 if __name__ == "__main__":
+    args = parse_args()
+    if not args.allow_estimated_tokens:
+        require_tokenizer()
+    store = get_vector_store(pinecone_client=pc, index_name=INDEX_NAME)
+    is_pinecone = isinstance(store, PineconeVectorStore)
+
     # Ensure the Pinecone index exists
-    ensure_index_exists(INDEX_NAME, DIMENSION, PINECONE_CLOUD, PINECONE_REGION)
-    try:
-        # Delete existing vectors in the namespace only if starting fresh
-        delete_namespace_vectors(INDEX_NAME, NAMESPACE)  # Comment out or remove this if you don't want to clear existing data
-        time.sleep(10)
-    except:
-        print('Nothing to delete!')
+    if is_pinecone:
+        ensure_index_exists(INDEX_NAME, DIMENSION, PINECONE_CLOUD, PINECONE_REGION)
 
     # Process and store embeddings for the markdown files
     file_paths = ["tucuvi_data_organizational.md", "tucuvi_data_technical.md"]
-    for file_path in file_paths:
-        embed_and_store_with_pinecone(file_path, INDEX_NAME, NAMESPACE)
\ No newline at end of file
+    embedding_store = None if args.no_embedding_store else open_embedding_store()
+    lexical_store = LexicalIndexStore(LEXICAL_INDEX_PATH)
+    if not args.in_place:
+        publish_new_version(file_paths, INDEX_NAME, NAMESPACE, store=store, full=args.full,
+                            workers=args.workers, embedding_store=embedding_store, lexical_store=lexical_store,
+                            layout=args.layout)
+    else:
+        # Update whichever namespace the chat currently reads, keeping its layout
+        alias = get_namespace_alias(store, NAMESPACE)
+        namespace = alias["namespace"] if alias else NAMESPACE
+        per_file = bool(alias) and alias.get("layout") == LAYOUT_PER_FILE
+        if args.reset:
+            try:
+                for existing in store.list_namespaces():
+                    if base_namespace(existing) == namespace:
+                        delete_namespace_vectors(INDEX_NAME, existing, store=store)
+                if is_pinecone:
+                    time.sleep(10)
+            except:
+                print('Nothing to delete!')
+            # Nothing is indexed any more
+            manifest = load_manifest()
+            manifest.pop(f"{INDEX_NAME}/{namespace}", None)
+            save_manifest(manifest)
+        sync_files_incrementally(file_paths, INDEX_NAME, namespace, store=store, full=args.full,
+                                 workers=args.workers, embedding_store=embedding_store,
+                                 lexical_store=lexical_store, per_file=per_file)
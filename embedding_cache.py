@@ -0,0 +1,228 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+
+# Keys per SQLite lookup (stays below SQLite's bound-parameter limit)
+SQL_BATCH_SIZE = 500
+
+
+def normalize_text(text):
+    """Normalize text before hashing so trivially different inputs share a cache entry."""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def embedding_cache_key(text, model, input_type):
+    """Stable cache key for (normalized text, model, input_type)."""
+    payload = "\x1f".join([model, input_type, normalize_text(text)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache for embedding vectors.
+
+    - Memory tier: a bounded LRU shared by every caller in the process (and therefore by
+      every Streamlit session), with an optional TTL.
+    - Disk tier (optional): a SQLite table that survives restarts. Entries found on disk
+      are promoted back into the memory tier.
+
+    The cache is thread-safe. `stats()` reports hits and misses, plus an estimate of the
+    embedding time saved based on the average latency of the misses.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=None, db_path=None):
+        self._max_entries = max_entries
+        self._ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._miss_seconds = 0.0
+        if db_path:
+            self._open_db(db_path)
+
+    def _open_db(self, db_path):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, model TEXT, input_type TEXT, vector BLOB, created_at REAL)"
+        )
+        self._db.commit()
+
+    def _is_expired(self, created_at):
+        return self._ttl_seconds is not None and time.time() - created_at > self._ttl_seconds
+
+    def _remember(self, key, vector, created_at):
+        self._entries[key] = (vector, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def _read_disk(self, key):
+        row = self._db.execute(
+            "SELECT vector, created_at FROM embeddings WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        blob, created_at = row
+        if self._is_expired(created_at):
+            self._db.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+            self._db.commit()
+            return None
+        return array("f", blob).tolist(), created_at
+
+    def get(self, text, model, input_type):
+        """Return the cached vector or None. Counts as a hit or a miss."""
+        key = embedding_cache_key(text, model, input_type)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._is_expired(entry[1]):
+                del self._entries[key]
+                entry = None
+            if entry is None and self._db is not None:
+                entry = self._read_disk(key)
+                if entry is not None:
+                    self._disk_hits += 1
+                    self._remember(key, *entry)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def get_many(self, texts, model, input_type):
+        """Return the cached vector (or None) for each text, reading the disk tier in bulk."""
+        keys = [embedding_cache_key(text, model, input_type) for text in texts]
+        found = {}
+        with self._lock:
+            for key in set(keys):
+                entry = self._entries.get(key)
+                if entry is not None and self._is_expired(entry[1]):
+                    del self._entries[key]
+                    entry = None
+                if entry is not None:
+                    found[key] = entry
+            missing = [key for key in set(keys) if key not in found]
+            if missing and self._db is not None:
+                for start in range(0, len(missing), SQL_BATCH_SIZE):
+                    batch = missing[start:start + SQL_BATCH_SIZE]
+                    rows = self._db.execute(
+                        f"SELECT key, vector, created_at FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                        batch
+                    ).fetchall()
+                    for key, blob, created_at in rows:
+                        if not self._is_expired(created_at):
+                            found[key] = (array("f", blob).tolist(), created_at)
+                            self._disk_hits += 1
+                            self._remember(key, *found[key])
+            vectors = []
+            for key in keys:
+                entry = found.get(key)
+                if entry is None:
+                    self._misses += 1
+                    vectors.append(None)
+                else:
+                    self._hits += 1
+                    vectors.append(entry[0])
+            return vectors
+
+    def put(self, text, model, input_type, vector):
+        """Store a vector in both tiers."""
+        key = embedding_cache_key(text, model, input_type)
+        vector = list(vector)
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, vector, created_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, model, input_type, vector, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, model, input_type, array("f", vector).tobytes(), created_at)
+                )
+                self._db.commit()
+
+    def put_many(self, texts, model, input_type, vectors):
+        """Store several vectors in both tiers, with a single disk transaction."""
+        created_at = time.time()
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = embedding_cache_key(text, model, input_type)
+                vector = list(vector)
+                self._remember(key, vector, created_at)
+                rows.append((key, model, input_type, array("f", vector).tobytes(), created_at))
+            if self._db is not None and rows:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, model, input_type, vector, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    rows
+                )
+                self._db.commit()
+
+    def get_or_compute(self, text, model, input_type, compute):
+        """Return the cached vector, or call `compute(text)` on a miss and cache its result."""
+        vector = self.get(text, model, input_type)
+        if vector is not None:
+            return vector
+        start = time.perf_counter()
+        vector = compute(text)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._miss_seconds += elapsed
+        self.put(text, model, input_type, vector)
+        return vector
+
+    def get_many_or_compute(self, texts, model, input_type, compute_many):
+        """
+        Return a vector for each text, calling `compute_many(missing_texts)` once for the
+        texts that are not cached (each distinct text is computed only once).
+        """
+        vectors = self.get_many(texts, model, input_type)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if not missing:
+            return vectors
+        start = time.perf_counter()
+        computed = compute_many(missing)
+        elapsed = time.perf_counter() - start
+        if len(computed) != len(missing):
+            raise ValueError(f"Expected {len(missing)} embeddings, got {len(computed)}")
+        with self._lock:
+            self._miss_seconds += elapsed
+        self.put_many(missing, model, input_type, computed)
+        by_text = dict(zip(missing, computed))
+        return [vector if vector is not None else by_text[text] for text, vector in zip(texts, vectors)]
+
+    def clear(self):
+        """Drop every entry from both tiers."""
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM embeddings")
+                self._db.commit()
+
+    def stats(self):
+        """Hit/miss counters and the estimated embedding time saved by hits."""
+        with self._lock:
+            lookups = self._hits + self._misses
+            average_miss = self._miss_seconds / self._misses if self._misses else 0.0
+            return {
+                "hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "average_miss_seconds": average_miss,
+                "estimated_seconds_saved": self._hits * average_miss
+            }
@@ -0,0 +1,181 @@
+"""
+Local BM25 index over the ingested chunks.
+
+Dense embeddings retrieve exact identifiers (table, dashboard and metric names such as
+`phone_visit_summaries`) poorly; an inverted index matches them exactly. The index is
+written by `embed_and_store.py` next to each namespace it ingests, as
+`<path>/<namespace>.json`, and read (and reloaded when rewritten) by the chat.
+"""
+import json
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+
+from vector_store import matches_filter
+
+DEFAULT_PATH = "lexical_index"
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+# A lexical hit is decisive when it matches every identifier of the query and scores at
+# least this many times the next hit
+DECISIVE_RATIO = 1.5
+
+_WORD = re.compile(r"[\w.]+")
+_IDENTIFIER = re.compile(r"^(?=.*[a-z])(?=.*[_.\d])[\w.]{4,}$")
+_BACKTICKED = re.compile(r"`([^`]+)`")
+
+
+def _fold(text):
+    """Lowercase and strip accents, so "información" matches "informacion"."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def tokenize(text):
+    """
+    Words of `text`, lowercased and without accents. Identifiers joined by "_" or "."
+    are kept whole and also split into their parts.
+    """
+    tokens = []
+    for word in _WORD.findall(_fold(text)):
+        word = word.strip("._")
+        if not word:
+            continue
+        tokens.append(word)
+        parts = [part for part in re.split(r"[_.]", word) if part]
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+def query_identifiers(query):
+    """Identifier-like terms of a query: backticked text and words containing "_", "." or digits."""
+    identifiers = {_fold(term).strip() for term in _BACKTICKED.findall(query)}
+    identifiers.update(word.strip("._") for word in _WORD.findall(_fold(query)) if _IDENTIFIER.match(word.strip("._")))
+    return {identifier for identifier in identifiers if identifier}
+
+
+class BM25Index:
+    """In-memory BM25 index of chunk dicts ({"id", "text", "metadata"})."""
+
+    def __init__(self, documents=()):
+        self.documents = []
+        self._postings = defaultdict(list)
+        self._lengths = []
+        for document in documents:
+            self.add(document)
+
+    def add(self, document):
+        position = len(self.documents)
+        terms = Counter(tokenize(document["text"]))
+        self.documents.append(document)
+        self._lengths.append(sum(terms.values()))
+        for term, frequency in terms.items():
+            self._postings[term].append((position, frequency))
+
+    def search(self, query, top_k, filter=None):
+        """Top `top_k` documents for `query` as (score, document), best first."""
+        if not self.documents:
+            return []
+        average_length = sum(self._lengths) / len(self._lengths) or 1.0
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (len(self.documents) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for position, frequency in postings:
+                length_norm = K1 * (1 - B + B * self._lengths[position] / average_length)
+                scores[position] += idf * frequency * (K1 + 1) / (frequency + length_norm)
+        ranked = sorted(scores.items(), key=lambda item: -item[1])
+        results = []
+        for position, score in ranked:
+            document = self.documents[position]
+            if filter and not matches_filter(document["metadata"], filter):
+                continue
+            results.append((score, document))
+            if len(results) == top_k:
+                break
+        return results
+
+    def is_decisive(self, query, results):
+        """
+        Whether the best hit settles a keyword query on its own: the query names
+        identifiers, the hit contains all of them and it clearly outscores the next one.
+        """
+        identifiers = query_identifiers(query)
+        if not identifiers or not results:
+            return False
+        text = _fold(results[0][1]["text"])
+        if not all(identifier in text for identifier in identifiers):
+            return False
+        return len(results) == 1 or results[0][0] >= DECISIVE_RATIO * results[1][0]
+
+
+class LexicalIndexStore:
+    """BM25 indexes persisted per namespace under `path`, reloaded when their file changes."""
+
+    def __init__(self, path=DEFAULT_PATH):
+        self._path = path
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def _file_for(self, namespace):
+        return os.path.join(self._path, f"{namespace}.json")
+
+    def save(self, namespace, records):
+        """Write the index of a namespace from its chunk records ({"id", "text", "metadata"})."""
+        os.makedirs(self._path, exist_ok=True)
+        file_path = self._file_for(namespace)
+        tmp_path = f"{file_path}.tmp"
+        # The text is kept once, outside the metadata the vector store also copies it into
+        documents = [
+            {
+                "id": record["id"],
+                "text": record["text"],
+                "metadata": {key: value for key, value in record["metadata"].items() if key != "text"}
+            }
+            for record in records
+        ]
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(documents, file, ensure_ascii=False)
+        os.replace(tmp_path, file_path)
+
+    def delete(self, namespace):
+        file_path = self._file_for(namespace)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+    def get(self, namespace):
+        """The BM25 index of a namespace, or None if none was written."""
+        file_path = self._file_for(namespace)
+        try:
+            mtime = os.stat(file_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            cached = self._indexes.get(namespace)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+        with open(file_path, "r", encoding="utf-8") as file:
+            index = BM25Index(json.load(file))
+        with self._lock:
+            self._indexes[namespace] = (mtime, index)
+        return index
+
+
+def reciprocal_rank_fusion(rankings, top_k, k=60):
+    """
+    Fuse ranked chunk lists: each chunk scores sum(1 / (k + rank)) over the lists it
+    appears in. Returns the top_k chunks with the fused `score`, best first.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, chunk in enumerate(ranking, start=1):
+            entry = fused.setdefault(chunk["id"], dict(chunk, score=0.0))
+            entry["score"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda chunk: -chunk["score"])[:top_k]
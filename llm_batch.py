@@ -0,0 +1,130 @@
+"""
+Offline batch mode of AzureLLMService, on the Azure OpenAI Batch API.
+
+Prompts are written as a JSONL batch file, one chat completion request per line with the
+request id as `custom_id`. The file is uploaded and submitted as a batch job to a Global
+Batch deployment, which is then polled until it ends; its output (and error) file is read
+back and each line mapped to its request id. Batch deployments are billed at a discount and
+have their own enqueued-token quota, so bulk jobs leave the interactive TPM/RPM quota (and
+the request scheduler) to the users. Results arrive within the completion window, not
+interactively.
+"""
+import json
+import time
+
+# Endpoint of the requests in a batch file, and the time Azure has to process the batch
+BATCH_ENDPOINT = "/chat/completions"
+COMPLETION_WINDOW = "24h"
+# Seconds between two status checks of a running batch
+POLL_SECONDS = 60.0
+# Statuses after which a batch makes no more progress
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def batch_request(request_id, messages, model, **parameters):
+    """One line of a batch file: a chat completion request identified by `request_id`."""
+    return {
+        "custom_id": request_id,
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": dict(parameters, model=model, messages=messages)
+    }
+
+
+def write_batch_file(path, requests):
+    """Write batch requests (see `batch_request`) as JSONL; returns `path`."""
+    with open(path, "w", encoding="utf-8") as file:
+        for request in requests:
+            file.write(json.dumps(request, ensure_ascii=False) + "\n")
+    return path
+
+
+def _usage(body):
+    usage = body.get("usage")
+    if not usage:
+        return None
+    return {key: usage.get(key) for key in ("prompt_tokens", "completion_tokens", "total_tokens")}
+
+
+def _error_message(error):
+    if isinstance(error, dict):
+        return error.get("message") or json.dumps(error)
+    return str(error)
+
+
+def parse_result(line):
+    """
+    Result of one output line, shaped like the items of `AzureLLMService.execute_many`:
+    `content`, `status` and `usage`, plus `error` when the request failed.
+    """
+    response = line.get("response") or {}
+    status = response.get("status_code") or 500
+    body = response.get("body") or {}
+    if line.get("error") or status != 200:
+        error = line.get("error") or body.get("error") or f"HTTP {status}"
+        return {"content": None, "status": status if status != 200 else 500, "usage": None,
+                "error": _error_message(error)}
+    choice = body["choices"][0]
+    content = (choice.get("message") or {}).get("content")
+    if choice.get("finish_reason") != "stop" or content is None:
+        return {"content": None, "status": 500, "usage": _usage(body),
+                "error": f"Invalid response (finish_reason={choice.get('finish_reason')})"}
+    return {"content": content, "status": 200, "usage": _usage(body)}
+
+
+def read_results(text):
+    """Results of a batch output or error file, keyed by request id."""
+    results = {}
+    for raw in text.splitlines():
+        if raw.strip():
+            line = json.loads(raw)
+            results[line["custom_id"]] = parse_result(line)
+    return results
+
+
+def submit_batch_file(client, path, metadata=None):
+    """Upload a batch file and start its batch job; returns the batch id."""
+    with open(path, "rb") as file:
+        uploaded = client.files.create(file=file, purpose="batch")
+    options = {"metadata": metadata} if metadata else {}
+    batch = client.batches.create(
+        input_file_id=uploaded.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window=COMPLETION_WINDOW,
+        **options
+    )
+    return batch.id
+
+
+def poll_batch(client, batch_id, poll_seconds=POLL_SECONDS, timeout=None):
+    """
+    Poll a batch until it ends; returns the batch. Raises TimeoutError after `timeout`
+    seconds (the batch keeps running and can be waited for again).
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        if batch.status in TERMINAL_STATUSES:
+            return batch
+        if deadline is not None and time.monotonic() + poll_seconds > deadline:
+            raise TimeoutError(f"Batch {batch_id} still {batch.status} after {timeout:.0f}s")
+        time.sleep(poll_seconds)
+
+
+def collect_results(client, batch, request_ids=None):
+    """
+    Results of an ended batch, keyed by request id. Requests of `request_ids` without a
+    result (the batch failed validation, expired or was cancelled first) get status 500.
+    """
+    results = {}
+    for file_id in (batch.output_file_id, getattr(batch, "error_file_id", None)):
+        if file_id:
+            results.update(read_results(client.files.content(file_id).text))
+    if request_ids is not None:
+        errors = getattr(getattr(batch, "errors", None), "data", None) or []
+        reason = "; ".join(getattr(error, "message", str(error)) for error in errors) or f"batch {batch.status}"
+        for request_id in request_ids:
+            results.setdefault(request_id, {
+                "content": None, "status": 500, "usage": None, "error": f"No result: {reason}"
+            })
+    return results
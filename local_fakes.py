@@ -0,0 +1,279 @@
+"""
+Deterministic local stand-ins for Pinecone inference and Azure OpenAI chat completions
+and batch jobs.
+
+They mimic the response shapes used by the chat and the ingestion script, with
+configurable latency, jitter and failure rate, so the whole pipeline (including its
+retries and circuit breakers) can run offline in benchmarks.
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+
+class _Latency:
+    """Thread-safe sampler of `latency ± jitter` seconds (never negative)."""
+
+    def __init__(self, latency=0.0, jitter=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self):
+        if not self.latency and not self.jitter:
+            return 0.0
+        with self._lock:
+            offset = self._random.uniform(-self.jitter, self.jitter)
+        return max(0.0, self.latency + offset)
+
+    def sleep(self):
+        delay = self.sample()
+        if delay:
+            time.sleep(delay)
+
+
+class FakeServiceError(Exception):
+    """Error with the status code and headers of an HTTP error from the real clients."""
+
+    def __init__(self, status_code=503, retry_after=None):
+        self.status_code = status_code
+        headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+        self.response = SimpleNamespace(status_code=status_code, headers=headers)
+        super().__init__(f"Fake service error {status_code}")
+
+
+class _Failures:
+    """Thread-safe draw of injected failures: each call fails with probability `rate`."""
+
+    def __init__(self, rate=0.0, status_code=503, retry_after=None, seed=0):
+        self.rate = rate
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.count = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def maybe_raise(self):
+        if not self.rate:
+            return
+        with self._lock:
+            failed = self._random.random() < self.rate
+            if failed:
+                self.count += 1
+        if failed:
+            raise FakeServiceError(self.status_code, self.retry_after)
+
+
+class FakeEmbedder:
+    """
+    Hashing bag-of-words embedder.
+
+    Each token is hashed into a fixed dimension, so texts sharing words get similar
+    vectors and retrieval behaves plausibly. Callable as `embedder(text)` (query
+    embedding), `embedder.embed_many(texts)` (ingestion), or through `embed(model, inputs,
+    parameters)` like `Pinecone().inference`.
+    """
+
+    def __init__(self, dimension=1024, latency=0.0, jitter=0.0, seed=0, failure_rate=0.0, failure_status=503):
+        self.dimension = dimension
+        self.calls = 0
+        self.inputs = 0
+        self._latency = _Latency(latency, jitter, seed)
+        self.failures = _Failures(failure_rate, failure_status, seed=seed)
+        self._lock = threading.Lock()
+
+    def vector(self, text):
+        values = np.zeros(self.dimension, dtype=np.float32)
+        for token in re.findall(r"\w+", text.lower()):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            values[int.from_bytes(digest[:4], "little") % self.dimension] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(values)
+        return (values / norm if norm else values).tolist()
+
+    def embed_many(self, texts):
+        with self._lock:
+            self.calls += 1
+            self.inputs += len(texts)
+        self._latency.sleep()
+        self.failures.maybe_raise()
+        return [self.vector(text) for text in texts]
+
+    def __call__(self, text):
+        return self.embed_many([text])[0]
+
+    def embed(self, model, inputs, parameters=None):
+        return [{"values": values} for values in self.embed_many(inputs)]
+
+
+def _default_answer(messages):
+    question = messages[-1]["content"] if messages else ""
+    return f"Fake answer to: {question}"
+
+
+class FakeChatCompletions:
+    """
+    Stand-in for `client.chat.completions` with configurable latency.
+
+    `latency`/`jitter` model the time to first token; `seconds_per_token` is added per
+    streamed token (and once per token for non-streaming calls). The answer is produced
+    by `answer_fn(messages)`. A `failure_rate` share of the calls raise FakeServiceError
+    with `failure_status` (and `retry_after`, if given) after the latency.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, seconds_per_token=0.0, answer_fn=None, seed=0,
+                 failure_rate=0.0, failure_status=503, retry_after=None):
+        self.calls = 0
+        self._latency = _Latency(latency, jitter, seed)
+        self.failures = _Failures(failure_rate, failure_status, retry_after, seed)
+        self._seconds_per_token = seconds_per_token
+        self._answer_fn = answer_fn or _default_answer
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _tokens(answer):
+        return re.findall(r"\S+\s*", answer)
+
+    @staticmethod
+    def _usage(messages, answer):
+        prompt_tokens = sum(len(str(message.get("content", "")).split()) for message in messages)
+        completion_tokens = len(answer.split())
+        return SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens
+        )
+
+    def _completion(self, messages, answer):
+        return SimpleNamespace(
+            choices=[SimpleNamespace(
+                finish_reason="stop",
+                message=SimpleNamespace(role="assistant", content=answer)
+            )],
+            usage=self._usage(messages, answer)
+        )
+
+    @staticmethod
+    def _chunk(content):
+        return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content), finish_reason=None)])
+
+    def _stream(self, answer):
+        # Azure starts with a chunk carrying only prompt filter results
+        yield SimpleNamespace(choices=[])
+        for token in self._tokens(answer):
+            if self._seconds_per_token:
+                time.sleep(self._seconds_per_token)
+            yield self._chunk(token)
+
+    def create(self, model=None, messages=None, stream=False, **kwargs):
+        with self._lock:
+            self.calls += 1
+        answer = self._answer_fn(messages or [])
+        self._latency.sleep()
+        self.failures.maybe_raise()
+        if stream:
+            return self._stream(answer)
+        if self._seconds_per_token:
+            time.sleep(self._seconds_per_token * len(self._tokens(answer)))
+        return self._completion(messages or [], answer)
+
+
+class FakeChatClient:
+    """Stand-in for AzureOpenAI exposing `client.chat.completions`."""
+
+    def __init__(self, completions):
+        self.chat = SimpleNamespace(completions=completions)
+
+
+def _as_dict(value):
+    """JSON-ready copy of a completion (SimpleNamespace from the fakes, or a pydantic model)."""
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    if isinstance(value, SimpleNamespace):
+        return {key: _as_dict(item) for key, item in vars(value).items()}
+    if isinstance(value, (list, tuple)):
+        return [_as_dict(item) for item in value]
+    return value
+
+
+class LocalBatchClient:
+    """
+    Stand-in for the `files` and `batches` APIs of AzureOpenAI that processes batch files
+    locally: each JSONL request is sent to `completions` (e.g. FakeChatCompletions) and
+    its answer written to the output file, or to the error file when it fails, in the
+    format of the Batch API. A batch stays in progress for its first `polls` retrievals.
+    """
+
+    def __init__(self, completions, polls=1):
+        self._completions = completions
+        self._polls = polls
+        self._files = {}
+        self._batches = {}
+        self._lock = threading.Lock()
+        self.files = SimpleNamespace(create=self._create_file, content=self._file_content)
+        self.batches = SimpleNamespace(create=self._create_batch, retrieve=self._retrieve_batch)
+
+    def _store(self, text):
+        with self._lock:
+            file_id = f"file-{len(self._files)}"
+            self._files[file_id] = text
+        return file_id
+
+    def _create_file(self, file, purpose):
+        content = file.read()
+        return SimpleNamespace(id=self._store(content.decode("utf-8") if isinstance(content, bytes) else content),
+                               purpose=purpose)
+
+    def _file_content(self, file_id):
+        return SimpleNamespace(text=self._files[file_id])
+
+    def _create_batch(self, input_file_id, endpoint, completion_window, metadata=None):
+        with self._lock:
+            batch_id = f"batch-{len(self._batches)}"
+            self._batches[batch_id] = SimpleNamespace(
+                id=batch_id, status="validating", input_file_id=input_file_id, endpoint=endpoint,
+                output_file_id=None, error_file_id=None, errors=None, metadata=metadata,
+                request_counts=SimpleNamespace(total=0, completed=0, failed=0), polls=0
+            )
+        return self._batches[batch_id]
+
+    def _retrieve_batch(self, batch_id):
+        batch = self._batches[batch_id]
+        if batch.status not in ("validating", "in_progress"):
+            return batch
+        batch.polls += 1
+        if batch.polls <= self._polls:
+            batch.status = "in_progress"
+        else:
+            self._process(batch)
+        return batch
+
+    def _process(self, batch):
+        outputs, errors = [], []
+        for raw in self._files[batch.input_file_id].splitlines():
+            if not raw.strip():
+                continue
+            request = json.loads(raw)
+            try:
+                body = _as_dict(self._completions.create(**request["body"]))
+                outputs.append({"custom_id": request["custom_id"], "response": {"status_code": 200, "body": body},
+                                "error": None})
+            except Exception as error:
+                status = getattr(error, "status_code", 500)
+                errors.append({"custom_id": request["custom_id"], "error": None, "response": {
+                    "status_code": status, "body": {"error": {"code": str(status), "message": str(error)}}
+                }})
+        batch.request_counts = SimpleNamespace(
+            total=len(outputs) + len(errors), completed=len(outputs), failed=len(errors)
+        )
+        if outputs:
+            batch.output_file_id = self._store("".join(json.dumps(line) + "\n" for line in outputs))
+        if errors:
+            batch.error_file_id = self._store("".join(json.dumps(line) + "\n" for line in errors))
+        batch.status = "completed"
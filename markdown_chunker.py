@@ -0,0 +1,202 @@
+"""
+Token-aware hierarchical chunking of the knowledge base Markdown files.
+
+The file is streamed line by line and parsed into blocks (paragraphs and lists, tables,
+fenced code blocks) under the heading tree H1 -> H2 -> H3. Each heading section is packed
+into chunks of at most `max_tokens` tokens, every chunk starting with the headings of its
+path so it reads (and embeds) on its own. Tables and code blocks are never cut: only
+when one alone exceeds the budget is it split between rows or lines, repeating the table
+header or the code fences.
+"""
+import re
+
+from token_counter import count_tokens
+
+# Chunk size in tokens. multilingual-e5-large only embeds the first 512 tokens of an input,
+# but counts them with its own (XLM-RoBERTa) tokenizer, which splits text into somewhat more
+# tokens than the gpt-4o one counted here. 400 leaves about a fifth of the window as margin
+# for that difference and the "passage: " prefix added by the embed API
+MAX_CHUNK_TOKENS = 400
+# Deepest heading level that starts a new section; deeper headings are kept as content
+MAX_HEADING_LEVEL = 3
+# Never squeeze the body of a chunk below this many tokens, however deep the heading path
+MIN_BODY_TOKENS = 100
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_FENCE = re.compile(r"^\s*(```|~~~)")
+_TABLE_SEPARATOR = re.compile(r"^\s*\|?\s*:?-{3,}")
+_SENTENCE_END = re.compile(r"(?<=[.!?:;])\s+")
+
+
+def heading_title(heading_line):
+    """Heading text without the leading #'s and emphasis markers."""
+    match = _HEADING.match(heading_line)
+    title = match.group(2) if match else heading_line
+    return title.strip("*_ ").strip()
+
+
+def iter_sections(lines):
+    """
+    Parse Markdown lines into sections.
+
+    Yields (heading_lines, blocks) for each section, where heading_lines is the path of
+    heading lines from H1 down to the section's own heading and blocks is a list of
+    (kind, text) with kind in "paragraph", "table" and "code".
+    """
+    path = []
+    blocks = []
+    current = []
+    kind = None
+    fence = None
+
+    def flush():
+        nonlocal current, kind
+        text = "\n".join(current).strip("\n")
+        if text.strip():
+            blocks.append((kind, text))
+        current = []
+        kind = None
+
+    for line in lines:
+        line = line.rstrip("\n").rstrip("\r")
+
+        if fence is not None:
+            current.append(line)
+            if line.strip().startswith(fence):
+                fence = None
+                flush()
+            continue
+
+        fence_match = _FENCE.match(line)
+        if fence_match:
+            flush()
+            fence = fence_match.group(1)
+            kind = "code"
+            current.append(line)
+            continue
+
+        heading = _HEADING.match(line)
+        if heading and len(heading.group(1)) <= MAX_HEADING_LEVEL:
+            flush()
+            if blocks:
+                yield list(path), blocks
+            blocks = []
+            level = len(heading.group(1))
+            # Drop the headings at this level or deeper, then descend
+            path = [item for item in path if len(_HEADING.match(item).group(1)) < level]
+            path.append(line.strip())
+            continue
+
+        if not line.strip():
+            flush()
+            continue
+
+        line_kind = "table" if line.lstrip().startswith("|") else "paragraph"
+        if kind is not None and kind != line_kind:
+            flush()
+        kind = line_kind
+        current.append(line)
+
+    flush()
+    if blocks:
+        yield list(path), blocks
+
+
+def _pack(pieces, budget, joiner):
+    """Greedily group (text, tokens) pieces into texts of at most `budget` tokens."""
+    groups = []
+    current = []
+    current_tokens = 0
+    for text, tokens in pieces:
+        if current and current_tokens + tokens > budget:
+            groups.append(joiner.join(current))
+            current = []
+            current_tokens = 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        groups.append(joiner.join(current))
+    return groups
+
+
+def _split_text(text, budget):
+    """Split prose on lines, then sentences, then words, so each piece fits the budget."""
+    pieces = []
+    for line in text.split("\n"):
+        tokens = count_tokens(line)
+        if tokens <= budget:
+            pieces.append((line, tokens))
+            continue
+        for sentence in _SENTENCE_END.split(line):
+            tokens = count_tokens(sentence)
+            if tokens <= budget:
+                pieces.append((sentence, tokens))
+                continue
+            words = sentence.split(" ")
+            pieces.extend((group, count_tokens(group)) for group in _pack(
+                [(word, count_tokens(word) + 1) for word in words], budget, " "
+            ))
+    return _pack(pieces, budget, "\n")
+
+
+def _split_table(text, budget):
+    lines = text.split("\n")
+    header = lines[:2] if len(lines) > 1 and _TABLE_SEPARATOR.match(lines[1]) else lines[:1]
+    header_text = "\n".join(header)
+    rows_budget = max(budget - count_tokens(header_text), 1)
+    groups = _pack([(row, count_tokens(row)) for row in lines[len(header):]], rows_budget, "\n")
+    return [f"{header_text}\n{group}" for group in groups] or [header_text]
+
+
+def _split_code(text, budget):
+    lines = text.split("\n")
+    opening = lines[0]
+    closing = lines[-1] if len(lines) > 1 and _FENCE.match(lines[-1]) else opening.strip()[:3]
+    inner = lines[1:-1] if len(lines) > 1 and _FENCE.match(lines[-1]) else lines[1:]
+    inner_budget = max(budget - count_tokens(opening) - count_tokens(closing), 1)
+    groups = _pack([(line, count_tokens(line)) for line in inner], inner_budget, "\n")
+    return [f"{opening}\n{group}\n{closing}" for group in groups]
+
+
+def _split_block(kind, text, budget):
+    if kind == "table":
+        return _split_table(text, budget)
+    if kind == "code":
+        return _split_code(text, budget)
+    return _split_text(text, budget)
+
+
+def chunk_section(heading_lines, blocks, max_tokens=MAX_CHUNK_TOKENS):
+    """Pack the blocks of one section into texts of at most ~max_tokens, each prefixed by the heading path."""
+    prefix = "\n".join(heading_lines)
+    budget = max(max_tokens - count_tokens(prefix) - 1, MIN_BODY_TOKENS)
+    pieces = []
+    for kind, text in blocks:
+        tokens = count_tokens(text)
+        if tokens <= budget:
+            pieces.append((text, tokens + 1))
+        else:
+            pieces.extend((part, count_tokens(part) + 1) for part in _split_block(kind, text, budget))
+    return [f"{prefix}\n\n{body}" if prefix else body for body in _pack(pieces, budget, "\n\n")]
+
+
+def chunk_markdown(file_path, max_tokens=MAX_CHUNK_TOKENS):
+    """
+    Stream a Markdown file and yield its chunks.
+
+    Each chunk is {"text", "metadata": {"section", "heading_path", "tokens", "file"}} where
+    `heading_path` lists the heading titles from H1 down and `section` joins them.
+    """
+    with open(file_path, "r", encoding="utf-8") as file:
+        for heading_lines, blocks in iter_sections(file):
+            titles = [heading_title(line) for line in heading_lines]
+            for text in chunk_section(heading_lines, blocks, max_tokens):
+                yield {
+                    "text": text,
+                    "metadata": {
+                        "section": " > ".join(titles),
+                        "heading_path": titles,
+                        "tokens": count_tokens(text),
+                        "file": file_path
+                    }
+                }
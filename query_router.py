@@ -0,0 +1,56 @@
+"""
+Routing of questions to the knowledge files.
+
+Without an explicit `/tech` prefix a question is searched in every knowledge file at
+once: one embedding and one vector query with a `$in` filter on the file, so the hits
+of both files compete on score. The file the hits favour then picks the system prompt.
+The prefix still forces the technical file.
+"""
+
+# Knowledge files and the system prompt that answers from each
+KNOWLEDGE_FILES = {
+    "tucuvi_data_organizational.md": "system_prompts/instructions.txt",
+    "tucuvi_data_technical.md": "system_prompts/instructions_tech.txt"
+}
+# File used when nothing was retrieved or routing is off
+DEFAULT_KNOWLEDGE_FILE = "tucuvi_data_organizational.md"
+TECH_PREFIX = "/tech"
+TECH_KNOWLEDGE_FILE = "tucuvi_data_technical.md"
+
+
+def route_prompt(prompt, auto_route=True):
+    """
+    Knowledge files to search for a prompt and the prompt without its prefix.
+
+    Returns (knowledge_files, cleaned_prompt): only the technical file for `/tech`
+    prompts, every file when `auto_route` is on, else the default file.
+    """
+    if prompt.startswith(TECH_PREFIX):
+        return [TECH_KNOWLEDGE_FILE], prompt.replace(TECH_PREFIX, "").strip()
+    if auto_route:
+        return list(KNOWLEDGE_FILES), prompt.strip()
+    return [DEFAULT_KNOWLEDGE_FILE], prompt.strip()
+
+
+def file_filter(knowledge_file):
+    """Metadata filter for one knowledge file or a list of them."""
+    if isinstance(knowledge_file, str):
+        return {"file": knowledge_file}
+    if len(knowledge_file) == 1:
+        return {"file": knowledge_file[0]}
+    return {"file": {"$in": list(knowledge_file)}}
+
+
+def winning_file(chunks, knowledge_files):
+    """
+    The knowledge file the hits favour: the one with the highest total score among
+    them, the best hit's file on a tie, and the first candidate when nothing matched.
+    """
+    totals = {}
+    for chunk in chunks:
+        if chunk.get("file") in knowledge_files:
+            totals[chunk["file"]] = totals.get(chunk["file"], 0.0) + (chunk.get("score") or 0.0)
+    if not totals:
+        return knowledge_files[0]
+    # max keeps the first maximum, and chunks come best first
+    return max(totals, key=totals.get)
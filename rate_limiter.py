@@ -0,0 +1,238 @@
+"""
+Process-wide admission control for the Azure OpenAI deployments.
+
+Each deployment has a tokens-per-minute and a requests-per-minute quota. A
+`RequestScheduler` keeps one token bucket per quota and admits a request only when both
+buckets can pay for it, so the process stays at the quota ceiling instead of getting
+429s for every user at once and retrying in bursts. Requests that cannot go yet wait in
+a queue ordered by priority and, within a priority, round-robin between users, so one
+busy user (or a batch job) cannot starve the others. A request whose wait would exceed
+its deadline is shed with LoadShedError instead of holding the user.
+
+A request's tokens are estimated before sending it (prompt plus the completion it may
+produce, as Azure counts them) and settled against the usage reported afterwards.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from token_counter import count_message_tokens
+
+# Priorities, served lowest first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+PRIORITY_BATCH = 2
+# Completion tokens assumed for a request that sets no max_tokens
+COMPLETION_TOKEN_ESTIMATE = 500
+# Seconds of quota that may be spent in one burst (Azure also enforces the quota over short windows)
+BURST_SECONDS = 10
+# Longest a request may wait in the queue before it is shed
+MAX_QUEUE_SECONDS = 20.0
+
+LOAD_SHED_MESSAGE = "The assistant is very busy right now. Please try again in a minute."
+
+
+class LoadShedError(Exception):
+    """Raised when a request would wait in the queue longer than its deadline."""
+
+    def __init__(self, wait):
+        self.wait = wait
+        super().__init__(f"Request shed: it would wait about {wait:.1f}s for quota")
+
+
+def estimate_tokens(messages, max_tokens=None):
+    """Tokens a chat completion request counts against the TPM quota."""
+    return count_message_tokens(messages) + (max_tokens or COMPLETION_TOKEN_ESTIMATE)
+
+
+class TokenBucket:
+    """Refills at `per_minute / 60` per second up to `burst_seconds` worth of quota."""
+
+    def __init__(self, per_minute, burst_seconds=BURST_SECONDS, clock=time.monotonic):
+        self.rate = per_minute / 60.0
+        self.capacity = max(self.rate * burst_seconds, 1.0)
+        self.level = self.capacity
+        self._updated = clock()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` can be taken (a request larger than the burst waits for a full bucket)."""
+        self._refill(now)
+        needed = min(amount, self.capacity)
+        return 0.0 if self.level >= needed else (needed - self.level) / self.rate
+
+    def backlog_time(self, ahead, amount, now):
+        """Seconds until `amount` can be taken once `ahead` has been paid for."""
+        self._refill(now)
+        return max(ahead + min(amount, self.capacity) - self.level, 0.0) / self.rate
+
+    def take(self, amount):
+        # May go below zero for oversized requests; the debt is paid back by the refill
+        self.level -= amount
+
+    def give_back(self, amount):
+        self.level = min(self.capacity, self.level + amount)
+
+
+class _Ticket:
+    __slots__ = ("user", "priority", "tokens")
+
+    def __init__(self, user, priority, tokens):
+        self.user = user
+        self.priority = priority
+        self.tokens = tokens
+
+
+class Reservation:
+    """Quota taken by an admitted request; `settle` corrects it with the actual usage."""
+
+    def __init__(self, scheduler, tokens, waited):
+        self._scheduler = scheduler
+        self.tokens = tokens
+        self.waited = waited
+        self._settled = False
+
+    def settle(self, actual_tokens=None):
+        """Replace the estimate with `actual_tokens` (ignored when unknown)."""
+        if self._settled or actual_tokens is None:
+            return
+        self._settled = True
+        self._scheduler._adjust(self.tokens - actual_tokens)
+
+
+class RequestScheduler:
+    """
+    Token buckets for a deployment's TPM and RPM quotas, with a fair priority queue.
+
+    `tpm` or `rpm` may be None to leave that quota unenforced. `acquire` blocks until
+    the request may be sent and returns a Reservation, or raises LoadShedError. `clock`
+    returns monotonic seconds (replaced in tests).
+    """
+
+    def __init__(self, tpm=None, rpm=None, max_wait=MAX_QUEUE_SECONDS, burst_seconds=BURST_SECONDS,
+                 clock=time.monotonic):
+        self._clock = clock
+        self._tokens = TokenBucket(tpm, burst_seconds, clock) if tpm else None
+        self._requests = TokenBucket(rpm, burst_seconds, clock) if rpm else None
+        self.max_wait = max_wait
+        # priority -> {user: deque of tickets}; users rotate to the back once served
+        self._queues = {}
+        self._condition = threading.Condition()
+        self.stats = {"admitted": 0, "shed": 0, "queued": 0, "max_wait_seconds": 0.0}
+
+    def _head(self):
+        for priority in sorted(self._queues):
+            users = self._queues[priority]
+            if users:
+                return next(iter(users.values()))[0]
+        return None
+
+    def _enqueue(self, ticket):
+        users = self._queues.setdefault(ticket.priority, OrderedDict())
+        users.setdefault(ticket.user, deque()).append(ticket)
+
+    def _dequeue(self, ticket, served):
+        users = self._queues[ticket.priority]
+        tickets = users[ticket.user]
+        tickets.remove(ticket)
+        if not tickets:
+            del users[ticket.user]
+        elif served:
+            users.move_to_end(ticket.user)
+
+    def _wait_time(self, ticket, now):
+        waits = [0.0]
+        if self._tokens is not None:
+            waits.append(self._tokens.wait_time(ticket.tokens, now))
+        if self._requests is not None:
+            waits.append(self._requests.wait_time(1, now))
+        return max(waits)
+
+    def _predicted_wait(self, ticket, now):
+        """Seconds until the quota pays for this request and those queued ahead of it."""
+        ahead = [
+            queued for priority, users in self._queues.items() if priority <= ticket.priority
+            for tickets in users.values() for queued in tickets if queued is not ticket
+        ]
+        waits = [0.0]
+        if self._tokens is not None:
+            waits.append(self._tokens.backlog_time(sum(queued.tokens for queued in ahead), ticket.tokens, now))
+        if self._requests is not None:
+            waits.append(self._requests.backlog_time(len(ahead), 1, now))
+        return max(waits)
+
+    def acquire(self, tokens, user=None, priority=PRIORITY_INTERACTIVE, max_wait=None):
+        """Wait for quota for a request of `tokens` tokens; returns its Reservation."""
+        max_wait = self.max_wait if max_wait is None else max_wait
+        start = self._clock()
+        ticket = _Ticket(user, priority, tokens)
+        with self._condition:
+            self._enqueue(ticket)
+            predicted = self._predicted_wait(ticket, start)
+            if predicted > max_wait:
+                self._shed(ticket, predicted)
+            while True:
+                now = self._clock()
+                wait = None
+                if self._head() is ticket:
+                    wait = self._wait_time(ticket, now)
+                    if wait <= 0:
+                        self._admit(ticket, now - start)
+                        return Reservation(self, tokens, now - start)
+                remaining = start + max_wait - now
+                if remaining <= 0:
+                    self._shed(ticket, now - start)
+                self.stats["queued"] = sum(len(tickets) for users in self._queues.values() for tickets in users.values())
+                self._condition.wait(min(wait, remaining) if wait is not None else remaining)
+
+    def _admit(self, ticket, waited):
+        if self._tokens is not None:
+            self._tokens.take(ticket.tokens)
+        if self._requests is not None:
+            self._requests.take(1)
+        self._dequeue(ticket, served=True)
+        self.stats["admitted"] += 1
+        self.stats["max_wait_seconds"] = max(self.stats["max_wait_seconds"], waited)
+        self._condition.notify_all()
+
+    def _shed(self, ticket, wait):
+        self._dequeue(ticket, served=False)
+        self.stats["shed"] += 1
+        self._condition.notify_all()
+        raise LoadShedError(wait)
+
+    def _adjust(self, unused_tokens):
+        if self._tokens is None:
+            return
+        with self._condition:
+            if unused_tokens >= 0:
+                self._tokens.give_back(unused_tokens)
+            else:
+                self._tokens.take(-unused_tokens)
+            self._condition.notify_all()
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(deployment, tpm=None, rpm=None):
+    """
+    The scheduler of a deployment, shared by every caller in the process.
+
+    Quotas default to AZURE_OPENAI_TPM and AZURE_OPENAI_RPM; a quota left unset is not
+    enforced. The settings of the first call for a deployment win.
+    """
+    with _schedulers_lock:
+        scheduler = _schedulers.get(deployment)
+        if scheduler is None:
+            tpm = tpm or int(os.getenv("AZURE_OPENAI_TPM", "0"))
+            rpm = rpm or int(os.getenv("AZURE_OPENAI_RPM", "0"))
+            scheduler = _schedulers[deployment] = RequestScheduler(
+                tpm or None, rpm or None, max_wait=float(os.getenv("LLM_QUEUE_SECONDS", str(MAX_QUEUE_SECONDS)))
+            )
+        return scheduler
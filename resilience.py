@@ -0,0 +1,262 @@
+"""
+Retries, hedged requests and circuit breaking for calls to Azure OpenAI and Pinecone.
+
+A `ResilientCaller` wraps each call to an upstream service:
+
+- transient failures (429, 408, 5xx, timeouts and connection errors) are retried with
+  jittered exponential backoff, waiting at least what the service asks in `Retry-After`;
+- with hedging on, a second identical request is sent when the first one has not
+  answered after the p95 latency of recent calls, and the first answer wins;
+- a circuit breaker, shared by every caller of the same service, opens after repeated
+  transient failures: calls then fail fast with CircuitOpenError until a trial call
+  succeeds, instead of holding users for the full timeout of a degraded upstream.
+"""
+import email.utils
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# HTTP statuses worth retrying
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+# Longest wait between two attempts, whatever Retry-After asks
+MAX_RETRY_DELAY = 20.0
+# Consecutive transient failures that open a circuit, and seconds before a trial call
+BREAKER_FAILURES = 5
+BREAKER_RESET_SECONDS = 30.0
+# Latency percentile after which a hedged request is sent, and the samples needed first
+HEDGE_QUANTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a service whose circuit is open."""
+
+    def __init__(self, name, retry_in):
+        self.name = name
+        self.retry_in = retry_in
+        super().__init__(f"'{name}' is unavailable (circuit open, next trial in {retry_in:.0f}s)")
+
+
+def status_code(error):
+    """HTTP status of an error raised by the OpenAI or Pinecone clients, if any."""
+    for candidate in (error, getattr(error, "response", None)):
+        for attribute in ("status_code", "status"):
+            value = getattr(candidate, attribute, None)
+            if isinstance(value, int):
+                return value
+    return None
+
+
+def retry_after(error):
+    """Seconds the service asked to wait (Retry-After / retry-after-ms headers), or None."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or getattr(error, "headers", None)
+    if not headers:
+        return None
+    try:
+        milliseconds = headers.get("retry-after-ms")
+        if milliseconds is not None:
+            return float(milliseconds) / 1000
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            # HTTP date form
+            return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+def backoff_delay(attempt, error, backoff=0.5, max_delay=MAX_RETRY_DELAY):
+    """Seconds to wait before retry number `attempt + 1` of a call that raised `error`."""
+    # Jitter keeps clients that failed together from retrying in lockstep
+    delay = backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+    asked = retry_after(error)
+    if asked is not None:
+        delay = max(delay, asked)
+    return min(delay, max_delay)
+
+
+def is_transient(error):
+    """Whether a failure is worth retrying (and counts against the circuit)."""
+    status = status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    name = type(error).__name__
+    return "Timeout" in name or "Connection" in name
+
+
+class CircuitBreaker:
+    """
+    Closed until `failures` consecutive transient failures, then open for
+    `reset_seconds`; after that one trial call is let through (half-open), which closes
+    the circuit on success and reopens it on failure.
+    """
+
+    def __init__(self, name, failures=BREAKER_FAILURES, reset_seconds=BREAKER_RESET_SECONDS):
+        self.name = name
+        self._threshold = failures
+        self._reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at < self._reset_seconds:
+                return "open"
+            return "half_open"
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through now."""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            waited = time.monotonic() - self._opened_at
+            if waited < self._reset_seconds or self._trial_running:
+                raise CircuitOpenError(self.name, max(self._reset_seconds - waited, 0.0))
+            self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self._threshold:
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name, failures=BREAKER_FAILURES, reset_seconds=BREAKER_RESET_SECONDS):
+    """The circuit breaker of a service, shared by every caller in the process."""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name, failures, reset_seconds)
+        return breaker
+
+
+class LatencyTracker:
+    """Latencies of the most recent successful calls."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q, min_samples=HEDGE_MIN_SAMPLES):
+        """The q-quantile of the recent latencies, or None with fewer than `min_samples`."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < min_samples:
+            return None
+        return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+
+class ResilientCaller:
+    """
+    Calls one upstream service with retries, optional hedging and its circuit breaker.
+
+    `call(function, *args, **kwargs)` returns what `function` returns or raises its last
+    error; CircuitOpenError is raised without calling it while the circuit is open.
+    Hedged requests are not cancelled when they lose: they finish in the background, so
+    hedging is best kept for idempotent, cheap calls.
+    """
+
+    def __init__(self, name, retries=3, backoff=0.5, max_delay=MAX_RETRY_DELAY, breaker=None,
+                 hedge=False, hedge_quantile=HEDGE_QUANTILE, max_workers=8):
+        self.name = name
+        self.retries = retries
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.breaker = breaker or get_breaker(name)
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.latency = LatencyTracker()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"hedge-{name}") if hedge else None
+        self.stats = {"calls": 0, "retries": 0, "hedged": 0, "hedge_wins": 0, "rejected": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def delay(self, attempt, error):
+        """Seconds to wait before retry number `attempt + 1`."""
+        return backoff_delay(attempt, error, self.backoff, self.max_delay)
+
+    def call(self, function, *args, **kwargs):
+        return self._call(function, args, kwargs, self.hedge)
+
+    def call_without_hedging(self, function, *args, **kwargs):
+        """`call` without hedged requests, for calls that must not run twice (e.g. streams)."""
+        return self._call(function, args, kwargs, False)
+
+    def _call(self, function, args, kwargs, hedge):
+        self._count("calls")
+        for attempt in range(self.retries + 1):
+            try:
+                self.breaker.before_call()
+            except CircuitOpenError:
+                self._count("rejected")
+                raise
+            start = time.perf_counter()
+            try:
+                result = self._attempt(function, args, kwargs, hedge)
+            except Exception as error:
+                if not is_transient(error):
+                    # The service answered; the request itself was wrong
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if attempt == self.retries:
+                    raise
+                self._count("retries")
+                time.sleep(self.delay(attempt, error))
+                continue
+            self.breaker.record_success()
+            self.latency.add(time.perf_counter() - start)
+            return result
+
+    def _attempt(self, function, args, kwargs, hedge):
+        hedge_after = self.latency.quantile(self.hedge_quantile) if hedge else None
+        if hedge_after is None:
+            return function(*args, **kwargs)
+        first = self._executor.submit(function, *args, **kwargs)
+        done, _ = wait([first], timeout=hedge_after)
+        if done:
+            return first.result()
+        self._count("hedged")
+        second = self._executor.submit(function, *args, **kwargs)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is second:
+                        self._count("hedge_wins")
+                    return future.result()
+                error = future.exception()
+        raise error
@@ -0,0 +1,104 @@
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def response_cache_key(deployment, temperature, messages):
+    """Stable hash of everything that determines a chat completion request."""
+    payload = json.dumps(
+        {"deployment": deployment, "temperature": temperature, "messages": messages},
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def files_fingerprint(patterns):
+    """Fingerprint (path, mtime, size) of every file matching the glob patterns."""
+    entries = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(entries)
+
+
+class ResponseCache:
+    """
+    Exact-match cache of LLM answers keyed on (deployment, temperature, messages).
+
+    Entries expire after `ttl_seconds` and the least recently used ones are evicted once
+    `max_entries` is reached. The whole cache is dropped as soon as any file matching
+    `watched_patterns` (knowledge base sources, system prompts) changes on disk, so a
+    cached answer never outlives the documents it was built from.
+    """
+
+    def __init__(self, max_entries=512, ttl_seconds=3600, watched_patterns=()):
+        self._max_entries = max_entries
+        self._ttl_seconds = ttl_seconds
+        self._watched_patterns = list(watched_patterns)
+        self._fingerprint = files_fingerprint(self._watched_patterns)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    def _check_fingerprint(self):
+        if not self._watched_patterns:
+            return
+        fingerprint = files_fingerprint(self._watched_patterns)
+        if fingerprint != self._fingerprint:
+            self._fingerprint = fingerprint
+            self._entries.clear()
+            self._invalidations += 1
+
+    def get(self, deployment, temperature, messages):
+        """Return the cached answer or None."""
+        key = response_cache_key(deployment, temperature, messages)
+        with self._lock:
+            self._check_fingerprint()
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[1] > self._ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, deployment, temperature, messages, answer):
+        """Store an answer for the given request."""
+        key = response_cache_key(deployment, temperature, messages)
+        with self._lock:
+            self._entries[key] = (answer, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every cached answer."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hit/miss/invalidation counters."""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "invalidations": self._invalidations,
+                "entries": len(self._entries)
+            }
@@ -0,0 +1,119 @@
+import hashlib
+import threading
+import time
+
+import numpy as np
+
+
+def chunk_set_key(chunks):
+    """
+    Order-independent key of a retrieved chunk set.
+
+    Uses each chunk's id and text, so an answer is not reused after the chunk content
+    behind an id was re-ingested.
+    """
+    digests = sorted(
+        hashlib.sha256(f"{chunk.get('id', '')}\x1f{chunk.get('text', '')}".encode("utf-8")).hexdigest()
+        for chunk in chunks
+    )
+    return hashlib.sha256("".join(digests).encode("utf-8")).hexdigest()
+
+
+def _to_int64(hex_digest):
+    return int(hex_digest[:16], 16) - (1 << 63)
+
+
+def _scope_code(knowledge_file, system_prompt):
+    payload = f"{knowledge_file}\x1f{system_prompt}"
+    return _to_int64(hashlib.sha256(payload.encode("utf-8")).hexdigest())
+
+
+class SemanticCache:
+    """
+    Answer cache for paraphrased questions.
+
+    Each entry keeps a query embedding, its knowledge file, the retrieved chunk set and the
+    answer. A lookup serves the stored answer of the most similar entry whose cosine
+    similarity is at least `threshold` and whose knowledge file, system prompt and chunk
+    set match the current ones. Entries live in preallocated NumPy arrays, so a lookup is a vectorized
+    scan over integer keys followed by a dot product over the few matching embeddings;
+    once `max_entries` is reached the oldest entries are overwritten.
+    """
+
+    def __init__(self, threshold=0.95, max_entries=20000, ttl_seconds=None):
+        self._threshold = threshold
+        self._max_entries = max_entries
+        self._ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._file_codes = np.zeros(max_entries, dtype=np.int64)
+        self._chunk_codes = np.zeros(max_entries, dtype=np.int64)
+        self._created_at = np.zeros(max_entries, dtype=np.float64)
+        self._answers = [None] * max_entries
+        self._size = 0
+        self._next = 0
+        self._hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, embedding, knowledge_file, chunks, system_prompt=""):
+        """Return the cached answer for a near-duplicate question, or None."""
+        file_code = _scope_code(knowledge_file, system_prompt)
+        chunk_code = _to_int64(chunk_set_key(chunks))
+        query = self._normalize(embedding)
+        with self._lock:
+            # The chunk set must match exactly, so narrow down on the integer codes first
+            # and only score the (few) entries that share it.
+            mask = (
+                (self._file_codes[:self._size] == file_code)
+                & (self._chunk_codes[:self._size] == chunk_code)
+            )
+            if self._ttl_seconds is not None:
+                mask &= self._created_at[:self._size] >= time.time() - self._ttl_seconds
+            candidates = np.flatnonzero(mask)
+            if candidates.size:
+                scores = self._matrix[candidates] @ query
+                best = int(np.argmax(scores))
+            if not candidates.size or scores[best] < self._threshold:
+                self._misses += 1
+                return None
+            self._hits += 1
+            return self._answers[candidates[best]]
+
+    def add(self, embedding, knowledge_file, chunks, answer, system_prompt=""):
+        """Store an answer for the question embedding and its retrieved chunks."""
+        vector = self._normalize(embedding)
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self._max_entries, vector.shape[0]), dtype=np.float32)
+            slot = self._next
+            self._matrix[slot] = vector
+            self._file_codes[slot] = _scope_code(knowledge_file, system_prompt)
+            self._chunk_codes[slot] = _to_int64(chunk_set_key(chunks))
+            self._created_at[slot] = time.time()
+            self._answers[slot] = answer
+            self._next = (slot + 1) % self._max_entries
+            self._size = min(self._size + 1, self._max_entries)
+
+    def clear(self):
+        """Drop every entry."""
+        with self._lock:
+            self._answers = [None] * self._max_entries
+            self._size = 0
+            self._next = 0
+
+    def stats(self):
+        """Hit/miss counters."""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "entries": self._size
+            }
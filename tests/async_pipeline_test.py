@@ -0,0 +1,49 @@
+import asyncio
+
+from async_pipeline import AsyncRagPipeline
+from query_router import route_prompt
+
+INSTRUCTIONS = {"org.md": "org.txt", "tech.md": "tech.txt"}
+
+
+def _pipeline(hits, searched):
+    def search(embedding, knowledge_files, lexical_chunks=None):
+        searched.append(list(knowledge_files))
+        return [chunk for chunk in hits if chunk["file"] in knowledge_files]
+
+    return AsyncRagPipeline(
+        load_system_prompt=lambda instructions_file: f"prompt from {instructions_file}",
+        embed_query=lambda query: [1.0, 0.0],
+        search=search
+    )
+
+
+def test_retrieve_picks_the_file_the_hits_favour():
+    searched = []
+    hits = [{"file": "tech.md", "score": 0.9}, {"file": "org.md", "score": 0.5}, {"file": "tech.md", "score": 0.4}]
+
+    result = asyncio.run(_pipeline(hits, searched).retrieve("question", ["org.md", "tech.md"], INSTRUCTIONS))
+
+    assert searched == [["org.md", "tech.md"]]
+    assert result["knowledge_file"] == "tech.md"
+    assert result["system_prompt"] == "prompt from tech.txt"
+    assert result["embedding"] == [1.0, 0.0]
+
+
+def test_retrieve_with_a_single_candidate():
+    searched = []
+
+    result = asyncio.run(_pipeline([], searched).retrieve("question", ["tech.md"], {"tech.md": "tech.txt"}))
+
+    assert searched == [["tech.md"]]
+    assert result["knowledge_file"] == "tech.md"
+    assert result["system_prompt"] == "prompt from tech.txt"
+    assert result["chunks"] == []
+
+
+def test_tech_prefix_forces_the_technical_file():
+    assert route_prompt("/tech Where is the calls dashboard?") == (
+        ["tucuvi_data_technical.md"], "Where is the calls dashboard?"
+    )
+    assert route_prompt(" Where is it?", auto_route=False) == (["tucuvi_data_organizational.md"], "Where is it?")
+    assert len(route_prompt("Where is it?")[0]) == 2
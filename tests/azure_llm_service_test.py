@@ -0,0 +1,119 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from azure_llm_service import AzureLLMService
+from local_fakes import FakeChatClient, FakeChatCompletions, FakeServiceError
+from rate_limiter import RequestScheduler
+from resilience import CircuitBreaker, ResilientCaller
+
+
+def _service(completions, scheduler=None):
+    service = AzureLLMService(
+        "key", "2024-10-21", "https://example.openai.azure.com", "gpt-4o", "gpt-4o",
+        max_tokens=100,
+        caller=ResilientCaller("test", retries=1, backoff=0.001, breaker=CircuitBreaker("test")),
+        scheduler=scheduler or RequestScheduler()
+    )
+    service._openai = FakeChatClient(completions)
+    return service
+
+
+@pytest.mark.parametrize("status", [503, 400])
+def test_failed_requests_give_their_quota_back(status):
+    # A stopped clock: the bucket never refills on its own
+    scheduler = RequestScheduler(tpm=60000, burst_seconds=1, clock=lambda: 0.0)  # holds 1000 tokens
+    service = _service(FakeChatCompletions(failure_rate=1.0, failure_status=status), scheduler)
+
+    if status == 400:
+        with pytest.raises(FakeServiceError):
+            service.execute("system", "question")
+    else:
+        assert service.execute("system", "question") == (None, 503)
+
+    assert scheduler._tokens.level == scheduler._tokens.capacity
+
+
+def test_successful_requests_are_charged_their_usage():
+    scheduler = RequestScheduler(tpm=60000, burst_seconds=1, clock=lambda: 0.0)
+    service = _service(FakeChatCompletions(answer_fn=lambda messages: "four words of answer"), scheduler)
+
+    result = service.execute_many([("system", "question")])[0]
+
+    assert result["status"] == 200
+    assert scheduler._tokens.capacity - scheduler._tokens.level == result["usage"]["total_tokens"]
+
+
+class TrackedCompletions(FakeChatCompletions):
+    """Counts the calls in flight; the first prompts answer last, and prompts saying "fail" get a 400."""
+
+    def __init__(self, prompts):
+        super().__init__(latency=0.01, answer_fn=self._answer)
+        self._prompts = prompts
+        self._in_flight_lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _answer(self, messages):
+        question = messages[-1]["content"]
+        if question.startswith("fail"):
+            raise FakeServiceError(400)
+        time.sleep(0.005 * (len(self._prompts) - self._prompts.index(("system", question))))
+        return f"answer to {question}"
+
+    def create(self, **kwargs):
+        with self._in_flight_lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            return super().create(**kwargs)
+        finally:
+            with self._in_flight_lock:
+                self.in_flight -= 1
+
+
+PROMPTS = [("system", f"question {i}") for i in range(3)] + [("system", "fail 3")] + [
+    ("system", f"question {i}") for i in range(4, 8)
+]
+
+
+def _run_many(run_async, prompts, max_concurrency):
+    completions = TrackedCompletions(prompts)
+    service = _service(completions)
+    if run_async:
+        results = asyncio.run(service.execute_many_async(prompts, max_concurrency=max_concurrency))
+    else:
+        results = service.execute_many(prompts, max_concurrency=max_concurrency)
+    return results, completions
+
+
+@pytest.mark.parametrize("run_async", [False, True])
+def test_execute_many_keeps_the_order_of_the_prompts(run_async):
+    prompts = [prompt for prompt in PROMPTS if not prompt[1].startswith("fail")]
+
+    results, _ = _run_many(run_async, prompts, max_concurrency=len(prompts))
+
+    assert [result["content"] for result in results] == [f"answer to {question}" for _, question in prompts]
+    assert all(result["status"] == 200 for result in results)
+
+
+@pytest.mark.parametrize("run_async", [False, True])
+def test_execute_many_isolates_failed_prompts(run_async):
+    results, _ = _run_many(run_async, PROMPTS, max_concurrency=4)
+
+    assert [result["status"] for result in results] == [200] * 3 + [400] + [200] * 4
+    assert results[3]["content"] is None
+    assert "400" in results[3]["error"]
+    assert results[4]["content"] == "answer to question 4"
+
+
+@pytest.mark.parametrize("run_async", [False, True])
+@pytest.mark.parametrize("max_concurrency", [1, 3])
+def test_execute_many_respects_max_concurrency(run_async, max_concurrency):
+    results, completions = _run_many(run_async, PROMPTS, max_concurrency=max_concurrency)
+
+    assert len(results) == len(PROMPTS)
+    assert completions.max_in_flight <= max_concurrency
+    assert completions.calls == len(PROMPTS)
@@ -0,0 +1,90 @@
+import os
+
+import pytest
+
+from chat_engine import UNAVAILABLE_MESSAGE, ChatEngine, Conversation
+from lexical_index import LexicalIndexStore
+from local_fakes import FakeChatClient, FakeChatCompletions, FakeEmbedder, FakeServiceError
+from rate_limiter import RequestScheduler
+from resilience import CircuitBreaker, ResilientCaller
+from vector_store import NumpyVectorStore
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MESSAGES = [{"role": "system", "content": "Answer briefly."}, {"role": "user", "content": "Where is it?"}]
+
+
+def _engine(completions, embed_query=lambda text: [1.0, 0.0], **kwargs):
+    kwargs.setdefault("scheduler", RequestScheduler(tpm=60000, burst_seconds=1, clock=lambda: 0.0))
+    return ChatEngine(
+        embed_query=embed_query,
+        vector_store=NumpyVectorStore(),
+        llm_client=FakeChatClient(completions),
+        llm_caller=ResilientCaller("test-llm", retries=1, backoff=0.001, breaker=CircuitBreaker("test-llm")),
+        **kwargs
+    )
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_failed_answers_give_their_quota_back(stream):
+    engine = _engine(FakeChatCompletions(failure_rate=1.0, failure_status=503))
+
+    with pytest.raises(FakeServiceError):
+        engine.ask_gpt(MESSAGES, on_token=(lambda token: None) if stream else None)
+
+    assert engine.scheduler._tokens.level == engine.scheduler._tokens.capacity
+
+
+def test_answers_are_charged_their_usage():
+    engine = _engine(FakeChatCompletions(answer_fn=lambda messages: "It is here."))
+
+    engine.ask_gpt(MESSAGES)
+
+    # The fake counts one token per word: 5 prompt words and 3 answer words
+    assert engine.scheduler._tokens.capacity - engine.scheduler._tokens.level == 8
+
+
+def _failing_embeddings(breaker, **kwargs):
+    """An engine whose embedding model always answers 503, reading the system prompts of the repo."""
+    return _engine(
+        FakeChatCompletions(answer_fn=lambda messages: "From the keywords."),
+        embed_query=FakeEmbedder(dimension=8, failure_rate=1.0, failure_status=503),
+        embedding_caller=ResilientCaller("test-embedding", retries=1, backoff=0.001, breaker=breaker),
+        **kwargs
+    )
+
+
+@pytest.mark.parametrize("circuit_open", [False, True])
+def test_answers_unavailable_without_embeddings_or_keyword_index(monkeypatch, circuit_open):
+    monkeypatch.chdir(REPO)
+    breaker = CircuitBreaker("test-embedding", failures=1 if circuit_open else 100)
+    engine = _failing_embeddings(breaker)
+    if circuit_open:
+        breaker.record_failure()
+    conversation = Conversation()
+
+    for flow in (engine.new_thread, engine.continue_thread_update):
+        result = flow(conversation, "Where is the calls dashboard?")
+        assert result["response"] == UNAVAILABLE_MESSAGE
+        assert result["unavailable"]
+    assert conversation.messages[-1] == {"role": "assistant", "content": UNAVAILABLE_MESSAGE}
+
+
+@pytest.mark.parametrize("circuit_open", [False, True])
+def test_answers_from_keyword_hits_without_embeddings(monkeypatch, tmp_path, circuit_open):
+    monkeypatch.chdir(REPO)
+    lexical_index = LexicalIndexStore(str(tmp_path))
+    lexical_index.save("markdown_chunks", [{
+        "id": "tucuvi_data_organizational.md#0",
+        "text": "The calls dashboard lives in Looker Studio.",
+        "metadata": {"file": "tucuvi_data_organizational.md", "section": "Dashboards"}
+    }])
+    breaker = CircuitBreaker("test-embedding", failures=1 if circuit_open else 100)
+    if circuit_open:
+        breaker.record_failure()
+    engine = _failing_embeddings(breaker, lexical_index=lexical_index)
+
+    result = engine.new_thread(Conversation(), "Where is the calls dashboard?")
+
+    assert result["response"] == "From the keywords."
+    assert not result["unavailable"]
+    assert [chunk["id"] for chunk in result["chunks"]] == ["tucuvi_data_organizational.md#0"]
@@ -0,0 +1,13 @@
+import clients
+
+
+def test_azure_clients_share_one_pooled_http_client(monkeypatch):
+    monkeypatch.setattr(clients, "_clients", {})
+
+    first = clients.get_azure_openai_client("key", "2024-10-21", "https://example.openai.azure.com", "gpt-4o")
+    second = clients.get_azure_openai_client("key", "2024-10-21", "https://example.openai.azure.com", "gpt-4o-mini")
+
+    assert first is not second
+    assert first._client is second._client is clients.get_http_client()
+    assert first.timeout.read == clients.HTTP_READ_TIMEOUT
+    assert first.timeout.connect == clients.HTTP_CONNECT_TIMEOUT
@@ -0,0 +1,11 @@
+import os
+import sys
+
+# The modules under test live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Scripts build their service clients at import; the tests never call the services
+os.environ.setdefault("PINECONE_API_KEY", "test")
+
+# Streamlit script exercising the authenticator by hand, not a pytest module
+collect_ignore = ["streamlit_authenticator_test.py"]
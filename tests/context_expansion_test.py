@@ -0,0 +1,131 @@
+import asyncio
+import contextlib
+import io
+
+import embed_and_store
+from chat_engine import ChatEngine, fetched_to_chunks
+from context_expansion import expand_chunks, neighbour_ids
+from local_fakes import FakeChatClient, FakeChatCompletions, FakeEmbedder
+from vector_store import NumpyVectorStore
+
+
+def _chunk(idx, h1, section, score=None, tokens=50, parent=(0, 3)):
+    return {
+        "id": f"knowledge.md_chunk_{idx}",
+        "text": f"# {h1}\n## {section}\n\n{section.lower()} text.",
+        "section": f"{h1} > {section}",
+        "heading_path": [h1, section],
+        "file": "knowledge.md",
+        "score": score,
+        "tokens": tokens,
+        "parent_first": parent[0],
+        "parent_last": parent[1]
+    }
+
+
+# Chunks 0-3 under the first H1 and 4-7 under the second
+CHUNKS = [_chunk(idx, "Guides", f"Section{idx}") for idx in range(4)] + [
+    _chunk(idx, "Reference", f"Section{idx}", parent=(4, 7)) for idx in range(4, 8)
+]
+
+
+def _hit(idx, score):
+    return dict(CHUNKS[idx], score=score)
+
+
+def _fetched(*indexes):
+    return {CHUNKS[idx]["id"]: dict(CHUNKS[idx]) for idx in indexes}
+
+
+def test_neighbours_stay_within_the_h1():
+    assert neighbour_ids([_hit(3, 0.9)]) == ["knowledge.md_chunk_2"]
+    assert neighbour_ids([_hit(4, 0.9)]) == ["knowledge.md_chunk_5"]
+    # Adjacent hits are not fetched again, and a shared neighbour is asked for once
+    assert neighbour_ids([_hit(1, 0.9), _hit(2, 0.8), _hit(5, 0.7)], window=2) == [
+        "knowledge.md_chunk_0", "knowledge.md_chunk_3", "knowledge.md_chunk_4",
+        "knowledge.md_chunk_6", "knowledge.md_chunk_7"
+    ]
+
+
+def test_no_neighbours_when_the_hits_fill_the_budget():
+    hits = [_hit(1, 0.9), _hit(5, 0.8)]
+
+    assert neighbour_ids(hits, token_budget=100) == []
+    assert neighbour_ids(hits, token_budget=101) != []
+
+
+def test_hits_merge_with_their_neighbours_under_the_same_h1():
+    passages = expand_chunks([_hit(3, 0.9)], _fetched(2, 4))
+
+    assert len(passages) == 1
+    assert passages[0]["ids"] == ["knowledge.md_chunk_2", "knowledge.md_chunk_3"]
+    assert passages[0]["score"] == 0.9
+    # The repeated heading path is dropped from the second chunk
+    assert passages[0]["text"] == "# Guides\n## Section2\n\nsection2 text.\n\n# Guides\n## Section3\n\nsection3 text."
+
+
+def test_adjacent_hits_become_one_passage():
+    passages = expand_chunks([_hit(5, 0.4), _hit(6, 0.8)], {})
+
+    assert [passage["ids"] for passage in passages] == [["knowledge.md_chunk_5", "knowledge.md_chunk_6"]]
+    assert passages[0]["score"] == 0.8
+
+
+def test_expansion_stops_at_the_token_budget():
+    # Room for the two hits and one neighbour: the closest to the best hit
+    passages = expand_chunks([_hit(1, 0.9), _hit(5, 0.8)], _fetched(0, 2, 4, 6), token_budget=150)
+
+    assert [passage["ids"] for passage in passages] == [
+        ["knowledge.md_chunk_0", "knowledge.md_chunk_1"], ["knowledge.md_chunk_5"]
+    ]
+
+
+class CountingStore(NumpyVectorStore):
+    """Records the ids of every fetch."""
+
+    def __init__(self):
+        super().__init__()
+        self.fetches = []
+
+    def fetch(self, ids, namespace):
+        self.fetches.append(list(ids))
+        return super().fetch(ids, namespace)
+
+
+def _search(tmp_path, **kwargs):
+    path = tmp_path / "knowledge.md"
+    path.write_text("".join(
+        f"# {h1}\n\n" + "".join(f"## {title}\n\n{title.lower()} words.\n\n" for title in titles)
+        for h1, titles in {"Guides": ["Alpha", "Beta", "Gamma"], "Reference": ["Delta", "Epsilon"]}.items()
+    ), encoding="utf-8")
+    store, embedder = CountingStore(), FakeEmbedder(dimension=8)
+    with contextlib.redirect_stdout(io.StringIO()):
+        embed_and_store.sync_files_incrementally(
+            [str(path)], "index", "ns", store=store, embed_texts=embedder.embed_many,
+            manifest_path=str(tmp_path / "manifest.json")
+        )
+    engine = ChatEngine(
+        embed_query=embedder.vector, vector_store=store, llm_client=FakeChatClient(FakeChatCompletions()),
+        namespace="ns", top_k=2, **kwargs
+    )
+    records = fetched_to_chunks(store.fetch([f"knowledge.md_chunk_{idx}" for idx in range(5)], "ns"))
+    store.fetches.clear()
+    query = embedder.vector(records["knowledge.md_chunk_1"]["text"])
+    return asyncio.run(engine.search_async(query, "knowledge.md")), store.fetches
+
+
+def test_search_fetches_the_neighbours_of_every_hit_at_once(tmp_path):
+    passages, fetches = _search(tmp_path)
+
+    assert len(fetches) == 1
+    assert "knowledge.md_chunk_1" in sum((passage["ids"] for passage in passages), [])
+    assert sum(len(passage["ids"]) for passage in passages) > 2
+
+
+def test_search_does_not_fetch_when_no_neighbour_fits(tmp_path):
+    passages, fetches = _search(tmp_path, expansion_token_budget=1)
+
+    assert fetches == []
+    # The hits are returned as they are
+    assert [chunk["id"] for chunk in passages].count("knowledge.md_chunk_1") == 1
+    assert len(passages) == 2
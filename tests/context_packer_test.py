@@ -0,0 +1,80 @@
+from context_packer import CHUNK_SEPARATOR, HISTORY_SHARE, MIN_TRUNCATED_TOKENS, pack_prompt
+from token_counter import TOKENS_PER_MESSAGE, count_tokens
+
+
+def _words(prefix, count):
+    return " ".join(f"{prefix}{i}" for i in range(count)) + "."
+
+
+def _chunk(name, score, text=None, words=200):
+    return {"section": name, "file": "tech.md", "score": score, "text": text or _words(name, words)}
+
+
+def _history(turns, words=150):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": _words(f"turn{i}_", words)}
+        for i in range(turns)
+    ]
+
+
+def test_prompt_fits_the_budget_and_keeps_system_prompt_and_query_whole():
+    system_prompt, query = _words("system", 300), _words("query", 200)
+    chunks = [_chunk(f"chunk{i}", 1.0 - i / 10) for i in range(10)]
+
+    history, context, packed, report = pack_prompt(system_prompt, _history(8), chunks, query, max_input_tokens=1500)
+
+    assert report["total_tokens"] <= 1500
+    assert report["system_tokens"] == TOKENS_PER_MESSAGE + count_tokens(system_prompt)
+    assert report["query_tokens"] == TOKENS_PER_MESSAGE + count_tokens(query)
+    assert count_tokens(context) <= report["context_tokens"]
+    assert report["dropped_chunks"] > 0
+
+
+def test_system_prompt_and_query_are_kept_when_nothing_else_fits():
+    system_prompt, query = _words("system", 600), _words("query", 600)
+
+    _, context, packed, report = pack_prompt(system_prompt, [], [_chunk("a", 1.0)], query, max_input_tokens=500)
+
+    assert (context, packed) == ("", [])
+    assert report["system_tokens"] == TOKENS_PER_MESSAGE + count_tokens(system_prompt)
+    assert report["query_tokens"] == TOKENS_PER_MESSAGE + count_tokens(query)
+
+
+def test_history_is_capped_at_its_share_and_keeps_the_latest_turns():
+    history = _history(20)
+
+    kept, _, _, report = pack_prompt("system", history, [_chunk("a", 1.0)], "query", max_input_tokens=4000)
+
+    overhead = TOKENS_PER_MESSAGE + count_tokens("Context:\n") + 2
+    available = 4000 - report["system_tokens"] - report["query_tokens"] - overhead
+    assert report["history_tokens"] <= int(available * HISTORY_SHARE)
+    assert 0 < len(kept) < len(history)
+    assert kept == history[-len(kept):]
+
+
+def test_repeated_paragraphs_are_kept_once():
+    shared = _words("shared", 40)
+    best = _chunk("best", 0.9, text=f"## Best\n\n{shared}\n\n{_words('best', 40)}")
+    overlapping = _chunk("overlap", 0.5, text=f"## Overlap\n\n{shared}\n\n{_words('overlap', 40)}")
+    duplicate = _chunk("duplicate", 0.1, text=f"## Duplicate\n\n{shared}")
+
+    _, context, packed, report = pack_prompt("system", [], [duplicate, overlapping, best], "query")
+
+    assert [chunk["section"] for chunk in packed] == ["best", "overlap"]
+    assert context.count(shared) == 1
+    assert packed[1]["text"] == f"## Overlap\n\n{_words('overlap', 40)}"
+    assert report["duplicate_chunks"] == 1
+
+
+def test_last_chunk_that_does_not_fit_is_truncated():
+    chunks = [_chunk(f"chunk{i}", 1.0 - i / 10, words=300) for i in range(4)]
+
+    _, context, packed, report = pack_prompt("system", [], chunks, "query", max_input_tokens=1000)
+
+    assert [chunk.get("truncated", False) for chunk in packed] == [False] * (len(packed) - 1) + [True]
+    assert packed[-1]["tokens"] >= MIN_TRUNCATED_TOKENS
+    assert chunks[len(packed) - 1]["text"].startswith(packed[-1]["text"].removesuffix(" …"))
+    assert report["truncated_chunks"] == 1
+    assert report["dropped_chunks"] == len(chunks) - len(packed)
+    assert context.count(CHUNK_SEPARATOR) == len(packed) - 1
+    assert report["total_tokens"] <= 1000
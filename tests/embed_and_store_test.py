@@ -0,0 +1,214 @@
+import contextlib
+import io
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import embed_and_store
+from lexical_index import LexicalIndexStore
+from local_fakes import FakeEmbedder
+from vector_store import ALIAS_NAMESPACE, LAYOUT_SHARED, NumpyVectorStore, get_namespace_alias
+
+
+def _section(title, words=40):
+    return f"## {title}\n\n" + " ".join(f"{title.lower()}{i}" for i in range(words)) + ".\n\n"
+
+
+def _write(path, titles_by_h1):
+    path.write_text("".join(
+        f"# {h1}\n\n" + "".join(_section(title) for title in titles)
+        for h1, titles in titles_by_h1.items()
+    ), encoding="utf-8")
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    """A knowledge file of two H1s with four sections each, and where to index it."""
+    path = tmp_path / "knowledge.md"
+    sections = {"Guides": ["Alpha", "Beta", "Gamma", "Delta"], "Reference": ["Epsilon", "Zeta", "Eta", "Theta"]}
+    _write(path, sections)
+    return {"path": path, "sections": sections, "manifest": str(tmp_path / "manifest.json")}
+
+
+def _sync(corpus, store, embedder, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return embed_and_store.sync_files_incrementally(
+            [str(corpus["path"])], "index", "ns", store=store, embed_texts=embedder.embed_many,
+            manifest_path=corpus["manifest"], **kwargs
+        )
+
+
+def _stored(store, namespace="ns"):
+    ids = [f"knowledge.md_chunk_{idx}" for idx in range(100)]
+    return store.fetch(ids, namespace)["vectors"]
+
+
+def test_insert_in_the_middle_only_embeds_the_new_chunk(corpus):
+    store, embedder = NumpyVectorStore(), FakeEmbedder(dimension=8)
+    _sync(corpus, store, embedder)
+    corpus["sections"]["Guides"].insert(2, "Inserted")
+    _write(corpus["path"], corpus["sections"])
+
+    stats = _sync(corpus, store, embedder)
+
+    # Alpha and Beta keep their ids and vectors but move within their grown H1; the chunks
+    # after the insert shift to new ids; only the inserted section is embedded
+    assert stats["chunks"] == 9
+    assert stats["embedded"] == 1
+    assert stats["reused"] == 8
+    assert stats["unchanged"] == 0
+    assert embedder.inputs == 8 + 1
+    stored = _stored(store)
+    assert len(stored) == 9
+    records = embed_and_store.prepare_chunks(str(corpus["path"]))
+    for record in records:
+        assert stored[record["id"]]["metadata"] == record["metadata"]
+        assert stored[record["id"]]["values"] == pytest.approx(embedder.vector(record["text"]))
+
+    assert _sync(corpus, store, embedder)["unchanged"] == 9
+
+
+def test_unchanged_corpus_is_skipped(corpus):
+    store, embedder = NumpyVectorStore(), FakeEmbedder(dimension=8)
+
+    first = _sync(corpus, store, embedder)
+    second = _sync(corpus, store, embedder)
+
+    assert (first["embedded"], first["unchanged"]) == (8, 0)
+    assert (second["embedded"], second["reused"], second["unchanged"], second["deleted"]) == (0, 0, 8, 0)
+    assert embedder.inputs == 8
+
+
+def test_edited_chunk_is_reembedded(corpus):
+    store, embedder = NumpyVectorStore(), FakeEmbedder(dimension=8)
+    _sync(corpus, store, embedder)
+    corpus["path"].write_text(corpus["path"].read_text().replace("zeta3 ", "rewritten "), encoding="utf-8")
+
+    stats = _sync(corpus, store, embedder)
+
+    assert (stats["embedded"], stats["reused"], stats["unchanged"], stats["deleted"]) == (1, 0, 7, 0)
+    assert "rewritten" in _stored(store)["knowledge.md_chunk_5"]["metadata"]["text"]
+
+
+def test_full_sync_reembeds_every_chunk(corpus):
+    store, embedder = NumpyVectorStore(), FakeEmbedder(dimension=8)
+    _sync(corpus, store, embedder)
+
+    stats = _sync(corpus, store, embedder, full=True)
+
+    assert (stats["embedded"], stats["unchanged"]) == (8, 0)
+
+
+def test_ids_that_no_longer_exist_are_deleted(corpus):
+    store, embedder = NumpyVectorStore(), FakeEmbedder(dimension=8)
+    _sync(corpus, store, embedder)
+    corpus["sections"]["Reference"] = ["Epsilon", "Zeta"]
+    _write(corpus["path"], corpus["sections"])
+
+    stats = _sync(corpus, store, embedder)
+
+    # Epsilon and Zeta keep their ids, but their H1 now ends earlier
+    assert (stats["chunks"], stats["unchanged"], stats["reused"], stats["embedded"], stats["deleted"]) == (6, 4, 2, 0, 2)
+    assert _stored(store)["knowledge.md_chunk_4"]["metadata"]["parent_last"] == 5
+    assert sorted(_stored(store)) == [f"knowledge.md_chunk_{idx}" for idx in range(6)]
+    manifest = embed_and_store.load_manifest(corpus["manifest"])
+    assert sorted(manifest["index/ns"]) == sorted(_stored(store))
+
+
+def test_per_file_sync_writes_the_file_namespace(corpus):
+    store, embedder = NumpyVectorStore(), FakeEmbedder(dimension=8)
+
+    _sync(corpus, store, embedder, per_file=True)
+
+    assert store.list_namespaces() == ["ns#knowledge"]
+    assert len(_stored(store, "ns#knowledge")) == 8
+
+
+class LossyStore(NumpyVectorStore):
+    """Loses the first vector of every data upsert while `lossy` is set."""
+
+    lossy = False
+
+    def upsert(self, vectors, namespace):
+        if self.lossy and namespace != ALIAS_NAMESPACE:
+            vectors = vectors[1:]
+        super().upsert(vectors, namespace)
+
+
+def _publish(corpus, store, embedder, lexical_store=None, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return embed_and_store.publish_new_version(
+            [str(corpus["path"])], "index", "kb", store=store, embed_texts=embedder.embed_many,
+            manifest_path=corpus["manifest"], lexical_store=lexical_store, **kwargs
+        )
+
+
+def _edit(corpus, title):
+    corpus["sections"]["Reference"].append(title)
+    _write(corpus["path"], corpus["sections"])
+
+
+def test_publish_switches_the_alias_to_a_new_version(corpus):
+    store, embedder = NumpyVectorStore(), FakeEmbedder(dimension=8)
+
+    namespace = _publish(corpus, store, embedder)
+
+    alias = get_namespace_alias(store, "kb")
+    assert namespace.startswith("kb@")
+    assert alias["namespace"] == namespace
+    assert alias["layout"] == "per_file"
+    assert "previous" not in alias
+    assert len(_stored(store, f"{namespace}#knowledge")) == 8
+    # Nothing to rebuild for the same corpus
+    assert _publish(corpus, store, embedder) == namespace
+    assert embedder.inputs == 8
+
+
+def test_publish_migrates_the_layout(corpus):
+    store, embedder = NumpyVectorStore(), FakeEmbedder(dimension=8)
+    shared = _publish(corpus, store, embedder, layout=LAYOUT_SHARED)
+
+    per_file = _publish(corpus, store, embedder)
+
+    assert per_file != shared
+    assert get_namespace_alias(store, "kb")["layout"] == "per_file"
+    assert get_namespace_alias(store, "kb")["previous"] == shared
+
+
+def test_incomplete_version_is_not_published(corpus, monkeypatch):
+    # Validation retries without waiting
+    monkeypatch.setattr(embed_and_store, "time", SimpleNamespace(
+        perf_counter=time.perf_counter, time=time.time, sleep=lambda seconds: None
+    ))
+    store, embedder = LossyStore(), FakeEmbedder(dimension=8)
+    live = _publish(corpus, store, embedder)
+    _edit(corpus, "Iota")
+    store.lossy = True
+
+    with pytest.raises(RuntimeError, match="alias not switched"):
+        _publish(corpus, store, embedder)
+
+    assert get_namespace_alias(store, "kb")["namespace"] == live
+    assert len(_stored(store, f"{live}#knowledge")) == 8
+
+
+def test_only_the_previous_version_is_kept(corpus, tmp_path):
+    store, embedder = NumpyVectorStore(), FakeEmbedder(dimension=8)
+    lexical_store = LexicalIndexStore(str(tmp_path / "lexical"))
+    embedding_store = embed_and_store.open_embedding_store(str(tmp_path / "embeddings.sqlite"))
+    first = _publish(corpus, store, embedder, lexical_store, embedding_store=embedding_store)
+    _edit(corpus, "Iota")
+    second = _publish(corpus, store, embedder, lexical_store, embedding_store=embedding_store)
+    assert sorted(store.list_namespaces()) == sorted([ALIAS_NAMESPACE, f"{first}#knowledge", f"{second}#knowledge"])
+
+    _edit(corpus, "Kappa")
+    third = _publish(corpus, store, embedder, lexical_store, embedding_store=embedding_store)
+
+    assert sorted(store.list_namespaces()) == sorted([ALIAS_NAMESPACE, f"{second}#knowledge", f"{third}#knowledge"])
+    assert get_namespace_alias(store, "kb")["previous"] == second
+    assert sorted(embed_and_store.load_manifest(corpus["manifest"])) == sorted([f"index/{second}", f"index/{third}"])
+    assert lexical_store.get(first) is None
+    assert lexical_store.get(third) is not None
+    # Every version is built from scratch, but the embedding store only sends new text to the model
+    assert embedder.inputs == 8 + 1 + 1
@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+from azure_llm_service import AzureLLMService
+from llm_batch import parse_result, read_results
+from local_fakes import FakeChatCompletions, FakeServiceError, LocalBatchClient
+
+
+def _answer(messages):
+    question = messages[-1]["content"]
+    if question == "rejected":
+        raise FakeServiceError(400)
+    return f"Answer to {question}"
+
+
+@pytest.fixture
+def service():
+    return AzureLLMService(
+        "key", "2024-10-21", "https://example.openai.azure.com", "gpt-4o", "gpt-4o",
+        batch_deployment="gpt-4o-batch",
+        batch_client=LocalBatchClient(FakeChatCompletions(answer_fn=_answer), polls=2)
+    )
+
+
+def test_execute_batch_maps_results_to_request_ids(service, tmp_path):
+    prompts = {f"request-{i}": ("system", f"question {i}") for i in range(3)}
+    results = service.execute_batch(prompts, temperature=0, poll_seconds=0.001, path=str(tmp_path / "batch.jsonl"))
+
+    assert set(results) == set(prompts)
+    for request_id, (_, question) in prompts.items():
+        assert results[request_id]["status"] == 200
+        assert results[request_id]["content"] == f"Answer to {question}"
+        assert results[request_id]["usage"]["total_tokens"] > 0
+
+    lines = [json.loads(line) for line in (tmp_path / "batch.jsonl").read_text().splitlines()]
+    assert [line["custom_id"] for line in lines] == list(prompts)
+    assert lines[0]["url"] == "/chat/completions"
+    assert lines[0]["body"]["model"] == "gpt-4o-batch"
+    assert lines[0]["body"]["temperature"] == 0
+
+
+def test_failed_requests_come_from_the_error_file(service):
+    results = service.execute_batch(
+        {"good": ("system", "fine"), "bad": ("system", "rejected")}, poll_seconds=0.001
+    )
+
+    assert results["good"]["status"] == 200
+    assert results["bad"]["status"] == 400
+    assert results["bad"]["content"] is None
+    assert "400" in results["bad"]["error"]
+
+
+def test_wait_for_batch_times_out_then_resumes(service):
+    batch_id = service.submit_batch({"only": ("system", "question")})
+
+    with pytest.raises(TimeoutError):
+        service.wait_for_batch(batch_id, poll_seconds=0.05, timeout=0.01)
+    results = service.wait_for_batch(batch_id, ["only", "missing"], poll_seconds=0.001)
+
+    assert results["only"]["content"] == "Answer to question"
+    assert results["missing"]["status"] == 500
+    assert "No result" in results["missing"]["error"]
+
+
+def test_submit_requires_a_batch_deployment(monkeypatch):
+    monkeypatch.delenv("AZURE_OPENAI_BATCH_DEPLOYMENT", raising=False)
+    service = AzureLLMService(
+        "key", "2024-10-21", "https://example.openai.azure.com", "gpt-4o", "gpt-4o",
+        batch_client=LocalBatchClient(FakeChatCompletions())
+    )
+
+    with pytest.raises(ValueError, match="AZURE_OPENAI_BATCH_DEPLOYMENT"):
+        service.submit_batch({"only": ("system", "question")})
+
+
+def test_parse_result_rejects_truncated_answers():
+    line = {"custom_id": "a", "response": {"status_code": 200, "body": {
+        "choices": [{"finish_reason": "length", "message": {"content": "partial"}}],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 2, "total_tokens": 3}
+    }}}
+
+    result = parse_result(line)
+
+    assert result["status"] == 500
+    assert result["content"] is None
+    assert result["usage"]["total_tokens"] == 3
+
+
+def test_read_results_uses_line_level_errors():
+    text = json.dumps({"custom_id": "a", "response": None, "error": {"code": "expired", "message": "Expired"}})
+
+    assert read_results(text + "\n\n") == {"a": {"content": None, "status": 500, "usage": None, "error": "Expired"}}
@@ -0,0 +1,93 @@
+import os
+
+import pytest
+
+from markdown_chunker import MAX_CHUNK_TOKENS, chunk_markdown
+from token_counter import count_tokens
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _words(prefix, count):
+    return " ".join(f"{prefix}{i}" for i in range(count)) + "."
+
+
+def _chunks(tmp_path, text, **kwargs):
+    path = tmp_path / "doc.md"
+    path.write_text(text, encoding="utf-8")
+    return list(chunk_markdown(str(path), **kwargs))
+
+
+@pytest.mark.parametrize("file_name", ["tucuvi_data_organizational.md", "tucuvi_data_technical.md"])
+def test_chunks_of_the_knowledge_files_fit_the_budget(file_name):
+    chunks = list(chunk_markdown(os.path.join(REPO, file_name)))
+
+    assert chunks
+    for chunk in chunks:
+        assert chunk["metadata"]["tokens"] == count_tokens(chunk["text"]) <= MAX_CHUNK_TOKENS
+
+
+def test_heading_path_and_section(tmp_path):
+    chunks = _chunks(tmp_path, "\n".join([
+        "# **Data Platform**", "Intro.",
+        "## Dashboards", "Calls.",
+        "### Filters", "By date.",
+        "#### Details", "Kept as content.",
+        "## Tables", "Visits.",
+        "# Team", "People."
+    ]))
+
+    assert [chunk["metadata"]["heading_path"] for chunk in chunks] == [
+        ["Data Platform"],
+        ["Data Platform", "Dashboards"],
+        ["Data Platform", "Dashboards", "Filters"],
+        ["Data Platform", "Tables"],
+        ["Team"]
+    ]
+    assert chunks[2]["metadata"]["section"] == "Data Platform > Dashboards > Filters"
+    assert chunks[2]["text"] == "# **Data Platform**\n## Dashboards\n### Filters\n\nBy date.\n#### Details\nKept as content."
+
+
+def test_tables_and_code_blocks_stay_whole(tmp_path):
+    table = "\n".join(["| name | owner |", "| --- | --- |"] + [f"| table{i} | team{i} |" for i in range(8)])
+    code = "\n".join(["```sql", "SELECT *", "FROM visits", "", "WHERE day > 1", "```"])
+    chunks = _chunks(tmp_path, "\n\n".join([
+        "# Guide", _words("intro", 120), table, _words("middle", 120), code, _words("outro", 120)
+    ]), max_tokens=250)
+
+    assert len(chunks) > 1
+    assert sum(table in chunk["text"] for chunk in chunks) == 1
+    assert sum(code in chunk["text"] for chunk in chunks) == 1
+    for chunk in chunks:
+        assert chunk["text"].startswith("# Guide\n\n")
+        assert count_tokens(chunk["text"]) <= 250
+
+
+def test_oversized_table_repeats_its_header(tmp_path):
+    header = ["| name | owner | description |", "| --- | --- | --- |"]
+    rows = [f"| table{i} | team{i} | {_words('row', 6)} |" for i in range(60)]
+    chunks = _chunks(tmp_path, "# Tables\n\n" + "\n".join(header + rows), max_tokens=200)
+
+    assert len(chunks) > 1
+    seen = []
+    for chunk in chunks:
+        body = chunk["text"].split("\n\n", 1)[1].split("\n")
+        assert body[:2] == header
+        seen.extend(body[2:])
+        assert count_tokens(chunk["text"]) <= 200
+    assert seen == rows
+
+
+def test_oversized_code_block_repeats_its_fences(tmp_path):
+    lines = [f"value_{i} = compute({i})  # {_words('note', 3)}" for i in range(80)]
+    chunks = _chunks(tmp_path, "# Code\n\n" + "\n".join(["```python"] + lines + ["```"]), max_tokens=200)
+
+    assert len(chunks) > 1
+    seen = []
+    for chunk in chunks:
+        body = chunk["text"].split("\n\n", 1)[1].split("\n")
+        assert body[0] == "```python"
+        assert body[-1] == "```"
+        seen.extend(body[1:-1])
+        assert count_tokens(chunk["text"]) <= 200
+    assert seen == lines
@@ -0,0 +1,122 @@
+import pytest
+
+from rate_limiter import (
+    PRIORITY_BATCH,
+    PRIORITY_INTERACTIVE,
+    LoadShedError,
+    RequestScheduler,
+    TokenBucket,
+    _Ticket
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def test_token_bucket_refills_up_to_its_burst():
+    clock = FakeClock()
+    bucket = TokenBucket(per_minute=600, burst_seconds=1, clock=clock)  # 10 per second, holds 10
+
+    bucket.take(10)
+    assert bucket.wait_time(5, clock.now) == pytest.approx(0.5)
+    assert bucket.wait_time(5, clock.now + 0.5) == 0.0
+    assert bucket.wait_time(1, clock.now + 60) == 0.0
+    assert bucket.level == bucket.capacity == 10
+
+
+def test_oversized_request_waits_for_a_full_bucket_and_goes_into_debt():
+    clock = FakeClock()
+    bucket = TokenBucket(per_minute=600, burst_seconds=1, clock=clock)
+
+    assert bucket.wait_time(25, clock.now) == 0.0
+    bucket.take(25)
+    assert bucket.level == -15
+    assert bucket.wait_time(1, clock.now) == pytest.approx(1.6)
+
+
+def test_backlog_counts_the_requests_queued_ahead():
+    clock = FakeClock()
+    bucket = TokenBucket(per_minute=600, burst_seconds=1, clock=clock)
+
+    assert bucket.backlog_time(0, 10, clock.now) == 0.0
+    assert bucket.backlog_time(15, 10, clock.now) == pytest.approx(1.5)
+    # Capped at the burst, like wait_time
+    assert bucket.backlog_time(0, 25, clock.now) == 0.0
+
+
+def test_settle_gives_back_unused_tokens():
+    scheduler = RequestScheduler(tpm=6000, burst_seconds=1, max_wait=0, clock=FakeClock())  # holds 100 tokens
+
+    scheduler.acquire(100).settle(10)
+
+    assert scheduler.acquire(80).tokens == 80
+    with pytest.raises(LoadShedError):
+        scheduler.acquire(80)
+
+
+def test_requests_beyond_the_deadline_are_shed():
+    scheduler = RequestScheduler(tpm=6000, burst_seconds=1, max_wait=0.5, clock=FakeClock())
+    scheduler.acquire(100)
+
+    with pytest.raises(LoadShedError) as shed:
+        scheduler.acquire(100)
+    assert shed.value.wait == pytest.approx(1.0)
+    assert scheduler.stats["admitted"] == 1
+    assert scheduler.stats["shed"] == 1
+
+
+def test_admits_at_the_request_rate():
+    clock = FakeClock()
+    scheduler = RequestScheduler(rpm=1200, burst_seconds=0.25, max_wait=0, clock=clock)  # 20 per second, burst of 5
+
+    for _ in range(5):
+        scheduler.acquire(1)
+    with pytest.raises(LoadShedError):
+        scheduler.acquire(1)
+
+    clock.advance(0.05)
+    scheduler.acquire(1)
+    with pytest.raises(LoadShedError):
+        scheduler.acquire(1)
+
+    clock.advance(1.0)
+    for _ in range(5):
+        scheduler.acquire(1)
+    assert scheduler.stats["admitted"] == 11
+
+
+def _serve(scheduler, requests):
+    """Queue (user, priority) tickets in order and return the users in the order they are served."""
+    order = []
+    with scheduler._condition:
+        for user, priority in requests:
+            scheduler._enqueue(_Ticket(user, priority, 1))
+        while scheduler._head() is not None:
+            ticket = scheduler._head()
+            scheduler._admit(ticket, 0.0)
+            order.append(ticket.user)
+    return order
+
+
+def test_users_take_turns():
+    scheduler = RequestScheduler(rpm=60, clock=FakeClock())
+
+    order = _serve(scheduler, [("heavy", PRIORITY_INTERACTIVE)] * 4 + [("light", PRIORITY_INTERACTIVE)] * 2)
+
+    assert order == ["heavy", "light", "heavy", "light", "heavy", "heavy"]
+
+
+def test_interactive_requests_go_before_batch_work():
+    scheduler = RequestScheduler(rpm=60, clock=FakeClock())
+
+    order = _serve(scheduler, [("job", PRIORITY_BATCH)] * 3 + [("user", PRIORITY_INTERACTIVE)] * 2)
+
+    assert order == ["user", "user", "job", "job", "job"]
@@ -0,0 +1,78 @@
+import time
+
+import pytest
+
+from local_fakes import FakeServiceError
+from resilience import CircuitBreaker, CircuitOpenError, ResilientCaller, is_transient, retry_after
+
+
+def _failing(status):
+    def call():
+        raise FakeServiceError(status)
+    return call
+
+
+def test_breaker_opens_half_opens_and_closes():
+    breaker = CircuitBreaker("test", failures=2, reset_seconds=0.05)
+
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+    breaker.before_call()
+    # Only one trial call at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_failed_trial_reopens_the_breaker():
+    breaker = CircuitBreaker("test", failures=1, reset_seconds=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+
+    breaker.before_call()
+    breaker.record_failure()
+
+    assert breaker.state == "open"
+
+
+def test_caller_retries_transient_failures_then_fails_fast():
+    caller = ResilientCaller("test", retries=1, backoff=0.001, breaker=CircuitBreaker("test", failures=2))
+
+    with pytest.raises(FakeServiceError):
+        caller.call(_failing(503))
+    with pytest.raises(CircuitOpenError):
+        caller.call(_failing(503))
+    assert caller.stats["retries"] == 1
+    assert caller.stats["rejected"] == 1
+
+
+def test_caller_does_not_retry_rejected_requests():
+    calls = []
+
+    def rejected():
+        calls.append(1)
+        raise FakeServiceError(400)
+
+    caller = ResilientCaller("test", retries=3, backoff=0.001, breaker=CircuitBreaker("test"))
+    with pytest.raises(FakeServiceError):
+        caller.call(rejected)
+
+    assert len(calls) == 1
+    assert caller.breaker.state == "closed"
+
+
+def test_transient_errors_and_retry_after():
+    assert is_transient(FakeServiceError(429))
+    assert is_transient(TimeoutError())
+    assert not is_transient(FakeServiceError(401))
+    assert not is_transient(ValueError())
+    assert retry_after(FakeServiceError(429, retry_after=3)) == 3.0
+    assert retry_after(FakeServiceError(429)) is None
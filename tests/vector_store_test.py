@@ -0,0 +1,84 @@
+import pytest
+
+from vector_store import NumpyVectorStore, VectorStore
+
+
+def _vectors():
+    return [
+        {"id": "a", "values": [1.0, 0.0, 0.0], "metadata": {"file_name": "x.md", "text": "alpha"}},
+        {"id": "b", "values": [0.0, 1.0, 0.0], "metadata": {"file_name": "y.md", "text": "beta"}},
+        {"id": "c", "values": [1.0, 1.0, 0.0], "metadata": {"file_name": "x.md", "text": "gamma"}},
+    ]
+
+
+def test_incomplete_backends_cannot_be_instantiated():
+    class QueryOnly(VectorStore):
+        def query(self, vector, top_k, namespace, filter=None, include_values=False, include_metadata=True):
+            return {"matches": []}
+
+    with pytest.raises(TypeError):
+        QueryOnly()
+
+
+def test_query_ranks_by_cosine_similarity():
+    store = NumpyVectorStore()
+    store.upsert(_vectors(), "ns")
+
+    matches = store.query([2.0, 0.1, 0.0], top_k=2, namespace="ns")["matches"]
+
+    assert [match["id"] for match in matches] == ["a", "c"]
+    assert matches[0]["score"] == pytest.approx(0.99875, abs=1e-4)
+    assert matches[0]["metadata"]["text"] == "alpha"
+    assert "values" not in matches[0]
+
+
+def test_query_applies_metadata_filters():
+    store = NumpyVectorStore()
+    store.upsert(_vectors(), "ns")
+
+    matches = store.query([0.0, 1.0, 0.0], top_k=3, namespace="ns", filter={"file_name": {"$eq": "x.md"}}, include_values=True)["matches"]
+
+    assert [match["id"] for match in matches] == ["c", "a"]
+    assert matches[0]["values"] == [1.0, 1.0, 0.0]
+    assert store.query([0.0, 1.0, 0.0], top_k=3, namespace="ns", filter={"file_name": "z.md"}) == {"matches": []}
+
+
+def test_upsert_overwrites_existing_ids():
+    store = NumpyVectorStore()
+    store.upsert(_vectors(), "ns")
+
+    store.upsert([{"id": "b", "values": [0.0, 0.0, 1.0], "metadata": {"text": "new"}}], "ns")
+
+    fetched = store.fetch(["b", "missing"], "ns")["vectors"]
+    assert list(fetched) == ["b"]
+    assert fetched["b"] == {"id": "b", "values": [0.0, 0.0, 1.0], "metadata": {"text": "new"}}
+    assert store.query([0.0, 0.0, 1.0], top_k=1, namespace="ns")["matches"][0]["id"] == "b"
+
+
+def test_delete_ids_and_namespaces():
+    store = NumpyVectorStore()
+    store.upsert(_vectors(), "ns")
+    store.upsert(_vectors(), "other")
+
+    store.delete("ns", ids=["a", "missing"])
+    assert [match["id"] for match in store.query([1.0, 0.0, 0.0], top_k=3, namespace="ns")["matches"]] == ["c", "b"]
+    assert store.fetch(["a"], "ns") == {"vectors": {}}
+
+    store.delete("other", delete_all=True)
+    assert store.list_namespaces() == ["ns"]
+    assert store.query([1.0, 0.0, 0.0], top_k=3, namespace="other") == {"matches": []}
+
+
+def test_round_trip_through_disk(tmp_path):
+    writer = NumpyVectorStore(str(tmp_path))
+    writer.upsert(_vectors(), "ns")
+
+    reader = NumpyVectorStore(str(tmp_path))
+    assert reader.list_namespaces() == ["ns"]
+    assert reader.fetch(["c"], "ns")["vectors"]["c"]["metadata"] == {"file_name": "x.md", "text": "gamma"}
+
+    # Changes written by another process are picked up on the next access
+    writer.delete("ns", ids=["a"])
+    assert reader.fetch(["a", "b"], "ns")["vectors"].keys() == {"b"}
+    writer.delete("ns", delete_all=True)
+    assert reader.list_namespaces() == []
@@ -0,0 +1,91 @@
+import logging
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken is optional; fall back to a character-based estimate
+    tiktoken = None
+
+# Tokenizer used by gpt-4o
+ENCODING_NAME = "o200k_base"
+# Rough characters per token when no tokenizer is available
+CHARS_PER_TOKEN = 4
+# Per-message overhead of the chat format (role, separators)
+TOKENS_PER_MESSAGE = 4
+
+logger = logging.getLogger(__name__)
+# Why the tokenizer could not be loaded, when it could not
+_unavailable_reason = None
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    global _unavailable_reason
+    if tiktoken is None:
+        _unavailable_reason = "tiktoken is not installed"
+    else:
+        try:
+            return tiktoken.get_encoding(ENCODING_NAME)
+        except Exception as error:
+            # The encoding file is downloaded on first use, so this fails offline
+            _unavailable_reason = f"{type(error).__name__}: {error}"
+    logger.warning(
+        "Tokenizer %s unavailable (%s); estimating %d characters per token",
+        ENCODING_NAME, _unavailable_reason, CHARS_PER_TOKEN
+    )
+    return None
+
+
+def require_tokenizer():
+    """
+    Load the tokenizer, retrying a failed earlier attempt, or raise RuntimeError.
+
+    Ingestion calls this first: chunk boundaries, and so vector ids and content hashes,
+    would otherwise depend on whether the encoding could be downloaded on this machine.
+    """
+    if _encoding() is not None:
+        return
+    _encoding.cache_clear()
+    if _encoding() is None:
+        raise RuntimeError(
+            f"Tokenizer {ENCODING_NAME} unavailable ({_unavailable_reason}). Install tiktoken and "
+            "download the encoding, or point TIKTOKEN_CACHE_DIR at a copy of it, before ingesting."
+        )
+    # Drop the counts estimated before the tokenizer could be loaded
+    count_tokens.cache_clear()
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text):
+    """
+    Number of gpt-4o tokens in `text` (estimated from its length without tiktoken).
+
+    Results are cached, so chunks and history messages seen again are not re-tokenized.
+    """
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is None:
+        return max(1, -(-len(text) // CHARS_PER_TOKEN))
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut `text` to at most `max_tokens` tokens, at a line or word boundary, marking the cut."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = _encoding()
+    budget = max(max_tokens - 1, 0)  # room for the marker
+    if encoding is None:
+        cut = text[:budget * CHARS_PER_TOKEN]
+    else:
+        cut = encoding.decode(encoding.encode(text, disallowed_special=())[:budget])
+    boundary = max(cut.rfind("\n"), cut.rfind(" "))
+    if boundary > len(cut) // 2:
+        cut = cut[:boundary]
+    return cut.rstrip() + " …"
+
+
+def count_message_tokens(messages):
+    """Approximate prompt tokens of a chat message list."""
+    return sum(TOKENS_PER_MESSAGE + count_tokens(message.get("content") or "") for message in messages) + 2
@@ -0,0 +1,159 @@
+"""
+Lightweight span-based tracing for the chat hot path.
+
+A request opens a trace with `request_trace(name)`; code on the hot path wraps each stage
+in `span(name, **attributes)`. Spans nest through context variables, so they follow the
+request into worker threads (`asyncio.to_thread`) and onto the pipeline event loop.
+Finished traces are logged as one JSON line on the `tracing` logger and, when
+OpenTelemetry is installed and TRACE_OTEL=true, mirrored as OpenTelemetry spans.
+"""
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:  # OpenTelemetry is optional
+    otel_trace = None
+
+logger = logging.getLogger("tracing")
+if os.getenv("TRACE_LOGS", "false").lower() == "true" and not logger.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+
+_otel_tracer = None
+if otel_trace is not None and os.getenv("TRACE_OTEL", "false").lower() == "true":
+    _otel_tracer = otel_trace.get_tracer("tucuvi-data-chat")
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed stage of a request."""
+
+    def __init__(self, name, parent, attributes):
+        self.span_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = dict(attributes)
+        self.start = time.perf_counter()
+        self.start_time = time.time()
+        self.duration = None
+        self.error = None
+        self.otel_span = None
+        if _otel_tracer is not None:
+            context = None
+            if parent is not None and parent.otel_span is not None:
+                context = otel_trace.set_span_in_context(parent.otel_span)
+            self.otel_span = _otel_tracer.start_span(name, context=context)
+
+    def set(self, **attributes):
+        """Attach attributes (token counts, payload sizes, cache hits...) to the span."""
+        self.attributes.update(attributes)
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.start
+        if self.otel_span is not None:
+            for key, value in self.attributes.items():
+                if isinstance(value, (str, bool, int, float)):
+                    self.otel_span.set_attribute(key, value)
+            if self.error:
+                self.otel_span.set_attribute("error", self.error)
+            self.otel_span.end()
+
+    def to_dict(self):
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_time": self.start_time,
+            "duration_ms": self.duration * 1000.0 if self.duration is not None else None,
+            "attributes": self.attributes,
+            "error": self.error
+        }
+
+
+class Trace:
+    """All spans recorded for one request."""
+
+    def __init__(self, name):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def breakdown(self):
+        """Milliseconds per span name (summed when a stage runs more than once)."""
+        totals = {}
+        with self._lock:
+            for span in self.spans:
+                if span.duration is not None:
+                    totals[span.name] = totals.get(span.name, 0.0) + span.duration * 1000.0
+        return totals
+
+    def to_dict(self):
+        with self._lock:
+            spans = [span.to_dict() for span in self.spans]
+        return {"trace_id": self.trace_id, "name": self.name, "spans": spans}
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time a stage of the current request. Yields the Span, or None outside a trace."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    current = Span(name, _current_span.get(), attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as error:
+        current.error = f"{type(error).__name__}: {error}"
+        raise
+    finally:
+        _current_span.reset(token)
+        current.finish()
+        trace.add(current)
+
+
+@contextmanager
+def request_trace(name, **attributes):
+    """
+    Trace one request, with a root span called `name`.
+
+    When a trace is already active (e.g. the UI opened one around an engine call), this
+    only adds a child span and yields the enclosing trace.
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        with span(name, **attributes):
+            yield trace
+        return
+    trace = Trace(name)
+    token = _current_trace.set(trace)
+    try:
+        with span(name, **attributes):
+            yield trace
+    finally:
+        _current_trace.reset(token)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps(trace.to_dict(), default=str))
+
+
+def current_trace():
+    """The trace of the request running in this context, if any."""
+    return _current_trace.get()
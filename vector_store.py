@@ -0,0 +1,519 @@
+import abc
+import asyncio
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+# Defaults, overridable with VECTOR_STORE_BACKEND / LOCAL_VECTOR_STORE_PATH in the environment
+DEFAULT_BACKEND = "pinecone"
+DEFAULT_LOCAL_PATH = "vector_store"
+# Namespace holding the alias records that point readers at a versioned namespace
+ALIAS_NAMESPACE = "__aliases__"
+# Layouts of a namespace: every knowledge file in it (queries filter on the file), or
+# one namespace per knowledge file next to it (queries target the file's namespace)
+LAYOUT_SHARED = "shared"
+LAYOUT_PER_FILE = "per_file"
+FILE_NAMESPACE_SEPARATOR = "#"
+
+
+class VectorStore(abc.ABC):
+    """
+    Minimal interface shared by every vector store backend.
+
+    Results are plain dictionaries shaped like Pinecone responses, so callers can
+    switch backends without touching the code that reads them:
+
+    - query  -> {"matches": [{"id", "score", "metadata"[, "values"]}, ...]}
+    - fetch  -> {"vectors": {id: {"id", "values", "metadata"}, ...}}
+    """
+
+    @abc.abstractmethod
+    def upsert(self, vectors, namespace):
+        """Insert or overwrite vectors given as {"id", "values", "metadata"} dicts."""
+
+    @abc.abstractmethod
+    def query(self, vector, top_k, namespace, filter=None, include_values=False, include_metadata=True):
+        """Return the top_k most similar vectors, optionally restricted by a metadata filter."""
+
+    @abc.abstractmethod
+    def delete(self, namespace, ids=None, delete_all=False):
+        """Delete the given ids, or every vector in the namespace when delete_all is set."""
+
+    @abc.abstractmethod
+    def fetch(self, ids, namespace):
+        """Fetch stored vectors by id."""
+
+    @abc.abstractmethod
+    def list_namespaces(self):
+        """Names of the namespaces holding at least one vector."""
+
+
+class PineconeVectorStore(VectorStore):
+    """Vector store backed by a Pinecone index."""
+
+    def __init__(self, index):
+        self._index = index
+
+    def upsert(self, vectors, namespace):
+        self._index.upsert(vectors=vectors, namespace=namespace)
+
+    def query(self, vector, top_k, namespace, filter=None, include_values=False, include_metadata=True):
+        kwargs = {}
+        if filter:
+            kwargs["filter"] = filter
+        results = self._index.query(
+            namespace=namespace,
+            vector=vector,
+            top_k=top_k,
+            include_values=include_values,
+            include_metadata=include_metadata,
+            **kwargs
+        )
+        matches = []
+        for match in results.get("matches", []):
+            item = {
+                "id": match["id"],
+                "score": match["score"],
+                "metadata": match.get("metadata") or {}
+            }
+            if include_values:
+                item["values"] = match.get("values") or []
+            matches.append(item)
+        return {"matches": matches}
+
+    def delete(self, namespace, ids=None, delete_all=False):
+        if delete_all:
+            self._index.delete(delete_all=True, namespace=namespace)
+        elif ids:
+            self._index.delete(ids=list(ids), namespace=namespace)
+
+    def fetch(self, ids, namespace):
+        response = self._index.fetch(ids=list(ids), namespace=namespace)
+        vectors = {}
+        for vector_id, vector in response.vectors.items():
+            vectors[vector_id] = {
+                "id": vector_id,
+                "values": list(vector.values or []),
+                "metadata": dict(vector.metadata or {})
+            }
+        return {"vectors": vectors}
+
+    def list_namespaces(self):
+        return list(self._index.describe_index_stats().namespaces)
+
+
+def _matches_condition(value, condition):
+    """Evaluate a single Pinecone-style metadata condition against a value."""
+    if not isinstance(condition, dict):
+        return value == condition
+    for operator, operand in condition.items():
+        if operator == "$eq" and not value == operand:
+            return False
+        if operator == "$ne" and not value != operand:
+            return False
+        if operator == "$in" and value not in operand:
+            return False
+        if operator == "$nin" and value in operand:
+            return False
+        if operator in ("$gt", "$gte", "$lt", "$lte"):
+            if value is None:
+                return False
+            if operator == "$gt" and not value > operand:
+                return False
+            if operator == "$gte" and not value >= operand:
+                return False
+            if operator == "$lt" and not value < operand:
+                return False
+            if operator == "$lte" and not value <= operand:
+                return False
+    return True
+
+
+def matches_filter(metadata, metadata_filter):
+    """Return True when metadata satisfies a Pinecone-style filter ($eq, $in, $and, $or, ...)."""
+    if not metadata_filter:
+        return True
+    for key, condition in metadata_filter.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(metadata, sub) for sub in condition):
+                return False
+        elif not _matches_condition(metadata.get(key), condition):
+            return False
+    return True
+
+
+class _Namespace:
+    """Rows of one namespace in the NumPy store."""
+
+    def __init__(self, dimension=None):
+        self.ids = []
+        self.positions = {}
+        self.metadata = []
+        self.vectors = np.zeros((0, dimension or 0), dtype=np.float32)
+        self.normalized = self.vectors
+        self.filter_masks = {}
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    In-process vector store doing brute-force cosine similarity with NumPy.
+
+    Meant for small corpora (a few thousand chunks), where a single matrix-vector
+    product is far cheaper than a network round trip. When a path is given, each
+    namespace is persisted as `<path>/<namespace>.npz` so the chat app can read what
+    the ingestion script wrote; a namespace file rewritten by another process is
+    reloaded on its next access. Safe to share between threads: ingestion upserts
+    batches in parallel.
+    """
+
+    def __init__(self, path=None):
+        self._path = path
+        self._namespaces = {}
+        self._mtimes = {}
+        self._lock = threading.RLock()
+        if path and os.path.isdir(path):
+            self._load()
+
+    def _file_for(self, namespace):
+        return os.path.join(self._path, f"{namespace}.npz")
+
+    def _namespaces_on_disk(self):
+        if not self._path or not os.path.isdir(self._path):
+            return []
+        return [
+            file_name[:-len(".npz")] for file_name in os.listdir(self._path)
+            if file_name.endswith(".npz") and not file_name.endswith(".tmp.npz")
+        ]
+
+    def _load(self):
+        for namespace in self._namespaces_on_disk():
+            self._refresh(namespace)
+
+    def _mtime(self, namespace):
+        try:
+            return os.stat(self._file_for(namespace)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _refresh(self, namespace):
+        """Reload a namespace whose file was written or removed since we last saw it."""
+        if not self._path:
+            return
+        mtime = self._mtime(namespace)
+        if mtime == self._mtimes.get(namespace):
+            return
+        self._mtimes[namespace] = mtime
+        if mtime is None:
+            self._namespaces.pop(namespace, None)
+            return
+        with np.load(self._file_for(namespace), allow_pickle=False) as data:
+            ns = _Namespace()
+            ns.ids = [str(vector_id) for vector_id in data["ids"]]
+            ns.positions = {vector_id: pos for pos, vector_id in enumerate(ns.ids)}
+            ns.metadata = json.loads(str(data["metadata"]))
+            ns.vectors = data["vectors"].astype(np.float32)
+            ns.normalized = self._normalize(ns.vectors)
+        self._namespaces[namespace] = ns
+
+    def _save(self, namespace):
+        if not self._path:
+            return
+        os.makedirs(self._path, exist_ok=True)
+        ns = self._namespaces.get(namespace)
+        file_path = self._file_for(namespace)
+        if ns is None or not ns.ids:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            self._mtimes[namespace] = None
+            return
+        tmp_path = file_path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            ids=np.array(ns.ids),
+            vectors=ns.vectors,
+            metadata=np.array(json.dumps(ns.metadata))
+        )
+        os.replace(tmp_path, file_path)
+        self._mtimes[namespace] = self._mtime(namespace)
+
+    @staticmethod
+    def _normalize(vectors):
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def upsert(self, vectors, namespace):
+        with self._lock:
+            if not vectors:
+                return
+            self._refresh(namespace)
+            ns = self._namespaces.get(namespace)
+            if ns is None:
+                ns = self._namespaces[namespace] = _Namespace(len(vectors[0]["values"]))
+
+            new_rows = []
+            new_values = []
+            for vector in vectors:
+                values = np.asarray(vector["values"], dtype=np.float32)
+                metadata = dict(vector.get("metadata") or {})
+                position = ns.positions.get(vector["id"])
+                if position is not None:
+                    ns.vectors[position] = values
+                    ns.metadata[position] = metadata
+                else:
+                    ns.positions[vector["id"]] = len(ns.ids) + len(new_rows)
+                    new_rows.append((vector["id"], metadata))
+                    new_values.append(values)
+
+            if new_rows:
+                ns.ids.extend(vector_id for vector_id, _ in new_rows)
+                ns.metadata.extend(metadata for _, metadata in new_rows)
+                ns.vectors = np.vstack([ns.vectors, np.vstack(new_values)])
+
+            ns.normalized = self._normalize(ns.vectors)
+            ns.filter_masks = {}
+            self._save(namespace)
+
+    def _mask_for(self, ns, metadata_filter):
+        key = json.dumps(metadata_filter, sort_keys=True)
+        mask = ns.filter_masks.get(key)
+        if mask is None:
+            mask = np.fromiter(
+                (matches_filter(metadata, metadata_filter) for metadata in ns.metadata),
+                dtype=bool,
+                count=len(ns.metadata)
+            )
+            ns.filter_masks[key] = mask
+        return mask
+
+    def query(self, vector, top_k, namespace, filter=None, include_values=False, include_metadata=True):
+        with self._lock:
+            self._refresh(namespace)
+            ns = self._namespaces.get(namespace)
+            if ns is None or not ns.ids or top_k <= 0:
+                return {"matches": []}
+
+            query_vector = np.asarray(vector, dtype=np.float32)
+            norm = np.linalg.norm(query_vector)
+            if norm:
+                query_vector = query_vector / norm
+            scores = ns.normalized @ query_vector
+
+            if filter:
+                mask = self._mask_for(ns, filter)
+                candidates = np.flatnonzero(mask)
+                if candidates.size == 0:
+                    return {"matches": []}
+                candidate_scores = scores[candidates]
+            else:
+                candidates = np.arange(len(ns.ids))
+                candidate_scores = scores
+
+            k = min(top_k, candidates.size)
+            top = np.argpartition(-candidate_scores, k - 1)[:k]
+            top = top[np.argsort(-candidate_scores[top])]
+
+            matches = []
+            for position in candidates[top]:
+                item = {"id": ns.ids[position], "score": float(scores[position])}
+                item["metadata"] = dict(ns.metadata[position]) if include_metadata else {}
+                if include_values:
+                    item["values"] = ns.vectors[position].tolist()
+                matches.append(item)
+            return {"matches": matches}
+
+    def delete(self, namespace, ids=None, delete_all=False):
+        with self._lock:
+            self._refresh(namespace)
+            ns = self._namespaces.get(namespace)
+            if ns is None:
+                return
+            if delete_all:
+                del self._namespaces[namespace]
+                self._save(namespace)
+                return
+            to_remove = {ns.positions[vector_id] for vector_id in (ids or []) if vector_id in ns.positions}
+            if not to_remove:
+                return
+            keep = [pos for pos in range(len(ns.ids)) if pos not in to_remove]
+            ns.ids = [ns.ids[pos] for pos in keep]
+            ns.metadata = [ns.metadata[pos] for pos in keep]
+            ns.vectors = ns.vectors[keep]
+            ns.normalized = ns.normalized[keep]
+            ns.positions = {vector_id: pos for pos, vector_id in enumerate(ns.ids)}
+            ns.filter_masks = {}
+            self._save(namespace)
+
+    def fetch(self, ids, namespace):
+        with self._lock:
+            self._refresh(namespace)
+            ns = self._namespaces.get(namespace)
+            vectors = {}
+            if ns is None:
+                return {"vectors": vectors}
+            for vector_id in ids:
+                position = ns.positions.get(vector_id)
+                if position is None:
+                    continue
+                vectors[vector_id] = {
+                    "id": vector_id,
+                    "values": ns.vectors[position].tolist(),
+                    "metadata": dict(ns.metadata[position])
+                }
+            return {"vectors": vectors}
+
+    def list_namespaces(self):
+        with self._lock:
+            for namespace in set(self._namespaces_on_disk()) | set(self._namespaces):
+                self._refresh(namespace)
+            return [name for name, ns in self._namespaces.items() if ns.ids]
+
+
+class AsyncVectorStore:
+    """
+    Asyncio adapter over any VectorStore.
+
+    Blocking backend calls run in the default executor, so several queries (or a query
+    and other I/O) can be awaited concurrently from an event loop.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    async def upsert(self, vectors, namespace):
+        return await asyncio.to_thread(self.store.upsert, vectors, namespace)
+
+    async def query(self, vector, top_k, namespace, filter=None, include_values=False, include_metadata=True):
+        return await asyncio.to_thread(
+            self.store.query, vector, top_k, namespace,
+            filter=filter, include_values=include_values, include_metadata=include_metadata
+        )
+
+    async def delete(self, namespace, ids=None, delete_all=False):
+        return await asyncio.to_thread(self.store.delete, namespace, ids=ids, delete_all=delete_all)
+
+    async def fetch(self, ids, namespace):
+        return await asyncio.to_thread(self.store.fetch, ids, namespace)
+
+
+def versioned_namespace(alias, version):
+    """Physical namespace of one version of an aliased namespace, e.g. markdown_chunks@3f2a9c."""
+    return f"{alias}@{version}"
+
+
+def is_version_of(namespace, alias):
+    """Whether `namespace` is `alias` itself or one of its versions (or their per-file namespaces)."""
+    namespace = base_namespace(namespace)
+    return namespace == alias or namespace.startswith(f"{alias}@")
+
+
+def file_namespace(namespace, file_name):
+    """Namespace holding one knowledge file of a per-file layout, e.g. markdown_chunks@3f2a9c#tucuvi_data_technical."""
+    return f"{namespace}{FILE_NAMESPACE_SEPARATOR}{os.path.splitext(os.path.basename(file_name))[0]}"
+
+
+def base_namespace(namespace):
+    """The namespace a per-file namespace belongs to (itself for other namespaces)."""
+    return namespace.split(FILE_NAMESPACE_SEPARATOR, 1)[0]
+
+
+def get_namespace_alias(store, alias):
+    """The alias record ({"namespace", "layout", "previous", "corpus_hash", "updated_at"}), or None."""
+    stored = store.fetch([alias], ALIAS_NAMESPACE)["vectors"].get(alias)
+    return stored["metadata"] if stored else None
+
+
+def set_namespace_alias(store, alias, namespace, dimension, **metadata):
+    """
+    Point `alias` at `namespace`.
+
+    The record is a single vector in ALIAS_NAMESPACE, so the switch is one atomic upsert.
+    Its values are a placeholder of the index dimension (Pinecone rejects all-zero vectors).
+    """
+    record = {key: value for key, value in metadata.items() if value is not None}
+    record.update(namespace=namespace, updated_at=time.time())
+    store.upsert(vectors=[{"id": alias, "values": [1.0] + [0.0] * (dimension - 1), "metadata": record}],
+                 namespace=ALIAS_NAMESPACE)
+    return record
+
+
+class NamespaceResolver:
+    """
+    Resolves an alias to the namespace it currently points at, for readers.
+
+    Lookups are cached for `refresh_seconds`. Once an alias has been resolved, readers
+    always get the cached target: when it is older than the interval it is refreshed in a
+    background thread, so no query waits on the alias fetch (only the very first lookup
+    does). Without an alias record the alias is used as the namespace itself (the layout
+    before versioned namespaces); if a refresh fails the last known target is kept.
+    """
+
+    def __init__(self, store, refresh_seconds=30.0):
+        self._store = store
+        self._refresh_seconds = refresh_seconds
+        self._targets = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def __call__(self, alias):
+        return self._lookup(alias)[0]
+
+    def layout(self, alias):
+        """LAYOUT_PER_FILE or LAYOUT_SHARED: how the namespace `alias` points at is organized."""
+        return self._lookup(alias)[1]
+
+    def _lookup(self, alias):
+        with self._lock:
+            cached = self._targets.get(alias)
+            if cached is not None:
+                if time.monotonic() - cached[1] >= self._refresh_seconds and alias not in self._refreshing:
+                    self._refreshing.add(alias)
+                    threading.Thread(target=self._refresh, args=(alias,), name="alias-refresh", daemon=True).start()
+                return cached[0]
+        return self._refresh(alias)
+
+    def _refresh(self, alias):
+        try:
+            record = get_namespace_alias(self._store, alias) or {}
+            target = (record.get("namespace", alias), record.get("layout", LAYOUT_SHARED))
+        except Exception:
+            with self._lock:
+                cached = self._targets.get(alias)
+                self._refreshing.discard(alias)
+                if cached is None:
+                    raise
+                # Retried after another interval
+                self._targets[alias] = (cached[0], time.monotonic())
+                return cached[0]
+        with self._lock:
+            self._targets[alias] = (target, time.monotonic())
+            self._refreshing.discard(alias)
+        return target
+
+
+def get_vector_store(pinecone_client=None, index_name=None, backend=None, path=None):
+    """
+    Build the vector store selected by `backend` (or the VECTOR_STORE_BACKEND env var).
+
+    - "pinecone": wraps `pinecone_client.Index(index_name)`, or the index handle shared
+      by the process (clients.py) when no client is given.
+    - "numpy": local in-process store persisted under `path` (or LOCAL_VECTOR_STORE_PATH).
+    """
+    backend = (backend or os.getenv("VECTOR_STORE_BACKEND", DEFAULT_BACKEND)).lower()
+    if backend == "pinecone":
+        if not index_name:
+            raise ValueError("The Pinecone backend needs an index name.")
+        if pinecone_client is None:
+            from clients import get_pinecone_index
+
+            return PineconeVectorStore(get_pinecone_index(index_name))
+        return PineconeVectorStore(pinecone_client.Index(index_name))
+    if backend == "numpy":
+        return NumpyVectorStore(path=path or os.getenv("LOCAL_VECTOR_STORE_PATH", DEFAULT_LOCAL_PATH))
+    raise ValueError(f"Unknown vector store backend '{backend}'.")